@@ -1,34 +1,63 @@
 """
 A REST API for Dino Park zone status.
 
+Development server: `python app.py`.
+Production server: `gunicorn -c gunicorn.conf.py`, see gunicorn.conf.py.
+
 """
 
 # System imports
+import json
 import logging
+import os
 
 # Third-party imports
 import pymongo
 
 # Local imports
-from dinopark_status_api.constants import API_VERSION, LOGGER
+from dinopark_status_api.constants import API_VERSION, LOGGER, LOG_LEVEL, FEED_POLL_INTERVAL_SECONDS
 from dinopark_status_api.apis import DinoparkStatusApi
-from dinopark_status_api.json_encoder import MongoJsonEncoder
+from dinopark_status_api.parks import ParkRegistry
+from dinopark_status_api.structured_logging import configure_logging
 
-# Setup logging
+# Setup logging, as JSON lines. DINOPARK_LOG_LEVEL=DEBUG logs every request.
+configure_logging(os.environ.get("DINOPARK_LOG_LEVEL", LOG_LEVEL))
 logger = logging.getLogger(LOGGER)
-logger.info(f"Starting DinoPark Status API {API_VERSION}")
 
 # Setup MongoDB as a persistent layer (Data Access Layer)
 # The main app service is in a different container than mongodb container
 # from docker point of view it's under different ip, just use service name specified in docker-compose as the hostname
 # i.e. mongodb://<MONGO_DB_IP_ADDRESS>/<PORT>/
-MONGO_URL = "mongodb://mongodb:27017/"
-mongo_dal = pymongo.MongoClient(MONGO_URL)
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://mongodb:27017/")
+
+# Parks served, as a JSON object of park name to its settings (see parks.Park), e.g.
+# {"isla-nublar": {"nudls_url": "https://isla-nublar.dinoparks.net/nudls/feed", "poll_interval": 5}}
+# Each park is served under /dinopark_status/<version>/<park>/. If unset, the park of NUDLS_URL is served at the base path.
+DINOPARK_PARKS = os.environ.get("DINOPARK_PARKS")
+
+
+def create_app(poll_interval=FEED_POLL_INTERVAL_SECONDS, create_indexes=True):
+    """
+    App factory, also used by gunicorn.
+    :param poll_interval: Seconds between background refreshes of the NUDLS feed. gunicorn passes None so that the
+    poller is started in each worker after the fork (see gunicorn.conf.py) rather than in the master process.
+    :param create_indexes: Whether to start creating the MongoDB indexes in the background. gunicorn passes False so that
+    the master process never connects to MongoDB, each worker creates them instead.
+    :return: A Flask app instance.
+    """
+    logger.info(f"Starting DinoPark Status API {API_VERSION}")
+
+    # connect=False defers connecting to the first operation, so that with gunicorn's preload_app each worker
+    # opens its own connection pool after the fork instead of inheriting sockets from the master process.
+    mongo_dal = pymongo.MongoClient(MONGO_URL, connect=False)
+
+    # Parks are loaded on demand, their feeds are only fetched once they are first requested
+    parks = ParkRegistry.from_config(json.loads(DINOPARK_PARKS)) if DINOPARK_PARKS else None
+
+    # Setup App
+    return DinoparkStatusApi.create_app(data_access_layer=mongo_dal, poll_interval=poll_interval, create_indexes=create_indexes,
+                                        parks=parks)
 
-# Setup App
-app = DinoparkStatusApi.create_app(data_access_layer=mongo_dal)
-# Add custom JSON encoder for MongoDB _id
-app.json_encoder = MongoJsonEncoder
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=80, debug=False)
+    create_app().run(host='0.0.0.0', port=80, debug=False)
@@ -0,0 +1,31 @@
+"""
+An asynchronous (ASGI) entry point of the REST API for Dino Park zone status.
+
+Run with an ASGI server, e.g. `uvicorn asgi_app:app --host 0.0.0.0 --port 80`.
+
+"""
+
+# System imports
+import logging
+import os
+
+# Third-party imports
+from motor.motor_asyncio import AsyncIOMotorClient
+
+# Local imports
+from dinopark_status_api.constants import API_VERSION, LOGGER, LOG_LEVEL
+from dinopark_status_api.asgi import DinoparkStatusAsgi
+from dinopark_status_api.structured_logging import configure_logging
+
+# Setup logging, as JSON lines, see app.py
+configure_logging(os.environ.get("DINOPARK_LOG_LEVEL", LOG_LEVEL))
+logger = logging.getLogger(LOGGER)
+logger.info(f"Starting DinoPark Status API {API_VERSION} (ASGI)")
+
+# Setup MongoDB as a persistent layer (Data Access Layer) with the asynchronous Motor driver
+# Use service name specified in docker-compose as the hostname, see app.py
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://mongodb:27017/")
+mongo_dal = AsyncIOMotorClient(MONGO_URL)
+
+# Setup App
+app = DinoparkStatusAsgi.create_app(data_access_layer=mongo_dal)
@@ -0,0 +1,5 @@
+"""
+Benchmarks for the Dinopark Status API.
+
+Run a benchmark from the project root with `python -m benchmarks.<module>`.
+"""
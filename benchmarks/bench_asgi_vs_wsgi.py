@@ -0,0 +1,244 @@
+"""
+Load test comparing the WSGI (Flask) and ASGI serving modes against a slow NUDLS.
+
+A local NUDLS stand-in serves a synthetic feed with a configurable latency. Each serving mode runs in its own process
+with an in-memory MongoDB stand-in (mongomock for WSGI, an in-memory async collection for ASGI), and a concurrent
+load generator hits both status endpoints. By default the feed cache TTL is 0, so every request waits on NUDLS, which
+is where blocking worker threads hurt the most.
+
+Requires mongomock and the ASGI requirements (httpx, uvicorn).
+
+Usage: python -m benchmarks.bench_asgi_vs_wsgi [--requests 2000] [--concurrency 50] [--upstream-latency-ms 50]
+"""
+
+# System imports
+import argparse
+import asyncio
+import json
+import logging
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+from urllib.request import urlopen
+
+# Local imports
+from benchmarks.synthetic_feed import generate_feed, ZONES
+
+
+class BulkWriteResult:
+    """
+    Result of AsyncMemoryCollection.bulk_write.
+    """
+    def __init__(self, upserted_count):
+        self.upserted_count = upserted_count
+
+
+class AsyncMemoryCollection:
+    """
+    In-memory stand-in of an asynchronous MongoDB collection.
+    """
+    def __init__(self):
+        self.count = 0
+
+    async def create_index(self, keys, **kwargs):
+        """
+        No indexes to create in memory.
+        """
+
+    async def bulk_write(self, requests, ordered=True):  # pylint: disable=unused-argument
+        """
+        Counts the upserts and drops them.
+        """
+        self.count += len(requests)
+        return BulkWriteResult(len(requests))
+
+
+def start_nudls(events, latency, dinosaurs=None, zones=None):
+    """
+    Starts a NUDLS stand-in in a thread.
+    :param events: Number of events in the served feed.
+    :param latency: Seconds to wait before answering each request.
+    :param dinosaurs: Number of dinosaurs in the feed, see synthetic_feed.generate_feed.
+    :param zones: Number of zones events are spread over, the first ones of the A1..Z16 grid. Defaults to the whole grid.
+    :return: URL of the feed.
+    """
+    body = json.dumps(generate_feed(events, num_dinos=dinosaurs, zones=ZONES[:zones] if zones else None),
+                      separators=(",", ":")).encode("utf-8")
+
+    class Handler(BaseHTTPRequestHandler):
+        """
+        Serves the feed after the configured latency.
+        """
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            time.sleep(latency)
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):  # pylint: disable=arguments-differ
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/nudls/feed"
+
+
+def serve(mode, port, nudls_url, cache_ttl):
+    """
+    Runs the API in the given serving mode until killed.
+    """
+    logging.getLogger("dinopark").setLevel(logging.CRITICAL)
+    if mode == "wsgi":
+        import mongomock  # pylint: disable=import-outside-toplevel
+        from werkzeug.serving import run_simple  # pylint: disable=import-outside-toplevel
+        from dinopark_status_api.apis import DinoparkStatusApi  # pylint: disable=import-outside-toplevel
+        from dinopark_status_api.feed_cache import FeedCache  # pylint: disable=import-outside-toplevel
+        from dinopark_status_api.nudls_client import NudlsClient  # pylint: disable=import-outside-toplevel
+
+        feed_cache = FeedCache(client=NudlsClient(url=nudls_url), ttl=cache_ttl, stale_ttl=0)
+        app = DinoparkStatusApi.create_app(mongomock.MongoClient(), feed_cache=feed_cache, poll_interval=None)
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        # What app.run() does
+        run_simple("127.0.0.1", port, app, threaded=True)
+    else:
+        import uvicorn  # pylint: disable=import-outside-toplevel
+        from dinopark_status_api.asgi import AsyncFeedCache, AsyncNudlsClient, DinoparkStatusAsgi  # pylint: disable=import-outside-toplevel
+        from dinopark_status_api.constants import DATABASE_NAME, COLLECTION_NAME  # pylint: disable=import-outside-toplevel
+
+        feed_cache = AsyncFeedCache(client=AsyncNudlsClient(url=nudls_url), ttl=cache_ttl, stale_ttl=0)
+        app = DinoparkStatusAsgi.create_app({DATABASE_NAME: {COLLECTION_NAME: AsyncMemoryCollection()}}, feed_cache=feed_cache, poll_interval=None)
+        uvicorn.run(app, host="127.0.0.1", port=port, log_level="error")
+
+
+async def fetch(connection, host, port, path):
+    """
+    Sends a GET request over a keep-alive connection, opening a new one if needed.
+    :param connection: List holding the (reader, writer) pair of the connection, or None.
+    :return: The response status code.
+    """
+    if connection[0] is None:
+        connection[0] = await asyncio.open_connection(host, port)
+    reader, writer = connection[0]
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\n\r\n".encode("latin-1"))
+    await writer.drain()
+
+    head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").lower()
+    status = int(head.split(" ", 2)[1])
+    length = int(re.search(r"content-length: *(\d+)", head).group(1))
+    await reader.readexactly(length)
+    if head.startswith("http/1.0") or "connection: close" in head:
+        writer.close()
+        connection[0] = None
+    return status
+
+
+async def run_load(base_url, total, concurrency, endpoints=("maintenance_status", "safety_status"), zones=ZONES):
+    """
+    Sends total requests over concurrency keep-alive connections, alternating between the status endpoints.
+
+    A minimal HTTP/1.1 client is used instead of an HTTP library so that the load generator itself is not the bottleneck.
+    :param endpoints: Status endpoints requested, picked at random for each request.
+    :param zones: Zones requested, picked at random for each request.
+    :return: Tuple of wall clock seconds, list of latencies in seconds and number of 5xx responses.
+    """
+    url = urlsplit(base_url)
+    rng = random.Random(7)
+    paths = [f"{url.path}/{rng.choice(endpoints)}?zone={rng.choice(zones)}" for _ in range(total)]
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for path in paths:
+        queue.put_nowait(path)
+
+    async def worker():
+        nonlocal errors
+        connection = [None]
+        while not queue.empty():
+            path = queue.get_nowait()
+            start = time.perf_counter()
+            status = await fetch(connection, url.hostname, url.port, path)
+            latencies.append(time.perf_counter() - start)
+            # Zones absent from the feed answer 400, which is a valid answer of the contract
+            if status >= 500:
+                errors += 1
+        if connection[0] is not None:
+            connection[0][1].close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return time.perf_counter() - start, latencies, errors
+
+
+def percentile(values, fraction):
+    """
+    :return: The value at the given fraction of the sorted values.
+    """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def free_port():
+    """
+    :return: A free local TCP port.
+    """
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def main():
+    """
+    Runs the load test against both serving modes and prints a report.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="Requests sent to each serving mode")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent connections")
+    parser.add_argument("--events", type=int, default=2000, help="Events in the NUDLS feed")
+    parser.add_argument("--upstream-latency-ms", type=float, default=50, help="Latency of the NUDLS stand-in")
+    parser.add_argument("--cache-ttl", type=float, default=0, help="Feed cache TTL in seconds, 0 to call NUDLS on every request")
+    parser.add_argument("--serve", choices=["wsgi", "asgi"], help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--nudls-url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port, args.nudls_url, args.cache_ttl)
+        return
+
+    nudls_url = start_nudls(args.events, args.upstream_latency_ms / 1000)
+    print(f"{args.requests} requests, concurrency {args.concurrency}, NUDLS latency {args.upstream_latency_ms} ms, cache TTL {args.cache_ttl} s")
+    print(f"{'mode':>6} {'req/s':>9} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'5xx':>5}")
+    for mode in ("wsgi", "asgi"):
+        port = free_port()
+        server = subprocess.Popen([sys.executable, "-m", "benchmarks.bench_asgi_vs_wsgi", "--serve", mode, "--port", str(port),
+                                   "--nudls-url", nudls_url, "--cache-ttl", str(args.cache_ttl)])
+        base_url = f"http://127.0.0.1:{port}/dinopark_status/v1"
+        try:
+            for _ in range(100):
+                try:
+                    urlopen(base_url + "/", timeout=1).close()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            elapsed, latencies, errors = asyncio.run(run_load(base_url, args.requests, args.concurrency))
+        finally:
+            server.terminate()
+            server.wait()
+
+        print(f"{mode:>6} {len(latencies) / elapsed:>9.1f} {percentile(latencies, 0.5) * 1e3:>9.1f} "
+              f"{percentile(latencies, 0.95) * 1e3:>9.1f} {percentile(latencies, 0.99) * 1e3:>9.1f} {errors:>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Cold start of the API process: import time profile and time from process start to the first health check answer.
+
+The import profile comes from `python -X importtime -c "import app"`: the modules taking the most time to import,
+cumulated with what they import. The time to the first health check answer is measured from the start of a new
+Python process to the answer of the health endpoint, with MongoDB unreachable: nothing on the way may wait for
+MongoDB, or for NUDLS, for the process to answer (see the readiness endpoint instead).
+
+Usage: python -m benchmarks.bench_cold_start [--runs 5] [--top 15] [--budget-ms 1000]
+"""
+
+# System imports
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Local imports
+from dinopark_status_api.constants import API_VERSION
+
+# Project root, where app.py is
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Creates the app, answers one health check and prints when it was answered
+HEALTH_CHECK = f"""
+import os, time
+import app
+response = app.create_app(poll_interval=None).test_client().get("/dinopark_status/{API_VERSION}/")
+print(time.time(), response.status_code, flush=True)
+os._exit(0)
+"""
+
+# Nothing listens on port 9 (discard), so MongoDB is unreachable
+UNREACHABLE_MONGO_URL = "mongodb://127.0.0.1:9/?serverSelectionTimeoutMS=2000"
+
+
+def import_profile():
+    """
+    :return: List of (cumulative microseconds, module name with its import depth as indentation) of importing app.
+    """
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=ROOT, capture_output=True,
+                               text=True, check=True)
+    profile = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        profile.append((int(cumulative), name.rstrip()))
+    return profile
+
+
+def time_to_health_check():
+    """
+    :return: Seconds from the start of a new process to the answer of its first health check.
+    """
+    env = dict(os.environ, MONGO_URL=UNREACHABLE_MONGO_URL)
+    started = time.time()
+    completed = subprocess.run([sys.executable, "-c", HEALTH_CHECK], cwd=ROOT, env=env, capture_output=True, text=True,
+                               check=True)
+    answered, status_code = completed.stdout.split()
+    assert status_code == "200", completed.stdout
+    return float(answered) - started
+
+
+def main():
+    """
+    Runs the benchmark, prints the import profile and the time to the first health check answer.
+    Exits with an error if the median time is over the budget.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="Number of processes started")
+    parser.add_argument("--top", type=int, default=15, help="Number of modules listed in the import profile")
+    parser.add_argument("--budget-ms", type=float, default=1000, help="Budget of the median time to the first health check")
+    args = parser.parse_args()
+
+    profile = import_profile()
+    print(f"{'cumulative (ms)':>16}  module")
+    for cumulative, name in sorted(profile, reverse=True)[:args.top]:
+        print(f"{cumulative / 1e3:>16.1f}  {name}")
+
+    timings = [time_to_health_check() for _ in range(args.runs)]
+    median = statistics.median(timings)
+    print(f"time to first health check (ms): median {median * 1e3:.0f}, min {min(timings) * 1e3:.0f}, "
+          f"max {max(timings) * 1e3:.0f}, budget {args.budget_ms:.0f}")
+    if median * 1e3 > args.budget_ms:
+        sys.exit("Over budget")
+
+
+if __name__ == "__main__":
+    main()
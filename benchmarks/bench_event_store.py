@@ -0,0 +1,83 @@
+"""
+Benchmark of time travel queries: the park state as of random past instants, rebuilt from the event store with
+several checkpoint intervals, compared with replaying the feed from its start for every query.
+
+For each interval it reports the time to ingest the feed (sorting the events and building the checkpoints), the
+memory held by the checkpoints, and the time to rebuild the park state as of an instant. The cache of rebuilt states
+is disabled, every query replays its events. Pick the interval whose query time suits the endpoint's latency budget
+at an acceptable memory cost, and set CHECKPOINT_INTERVAL_EVENTS to it.
+
+Usage: python -m benchmarks.bench_event_store [--events 100000] [--intervals 100,1000,10000] [--queries 200]
+"""
+
+# System imports
+import argparse
+import gc
+import random
+import time
+import tracemalloc
+
+# Local imports
+from benchmarks.synthetic_feed import generate_feed
+from dinopark_status_api.event_store import EventStore
+from dinopark_status_api.park_state import ParkState
+from dinopark_status_api.timestamps import epoch_millis
+
+
+def checkpoint_memory(content, interval):
+    """
+    :return: Bytes held by the store once the feed is ingested: the checkpoints, and the lists of the events (shared
+    with the feed) and of their times.
+    """
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    store = EventStore(checkpoint_interval=interval)
+    store.ingest(content)
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del store
+    return held
+
+
+def main():
+    """
+    Runs the benchmark and prints a table of the costs of each checkpoint interval.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=100000, help="Events in the NUDLS feed")
+    parser.add_argument("--intervals", default="100,1000,10000", help="Comma separated checkpoint intervals (events)")
+    parser.add_argument("--queries", type=int, default=200, help="Instants queried per interval")
+    args = parser.parse_args()
+
+    content = generate_feed(args.events)
+    times = sorted(epoch_millis(event["time"]) for event in content)
+    rng = random.Random(42)
+    instants = [rng.randint(times[0], times[-1]) for _ in range(args.queries)]
+
+    print(f"{'interval':>10} {'ingest (ms)':>12} {'checkpoints (MB)':>17} {'query (ms)':>11}")
+    for interval in [int(i) for i in args.intervals.split(",")]:
+        store = EventStore(checkpoint_interval=interval, cache_size=0)
+        start = time.perf_counter()
+        store.ingest(content)
+        ingest_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for millis in instants:
+            store.state_at(millis)
+        query_time = (time.perf_counter() - start) / len(instants)
+        memory = checkpoint_memory(content, interval)
+        print(f"{interval:>10} {ingest_time * 1e3:>12.1f} {memory / 1e6:>17.1f} {query_time * 1e3:>11.3f}")
+
+    # No checkpoints: every query filters and replays the feed from its start
+    full_queries = instants[:max(1, args.queries // 20)]
+    start = time.perf_counter()
+    for millis in full_queries:
+        ParkState.from_events(event for event in content if epoch_millis(event["time"]) <= millis)
+    query_time = (time.perf_counter() - start) / len(full_queries)
+    print(f"{'none':>10} {'-':>12} {'-':>17} {query_time * 1e3:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
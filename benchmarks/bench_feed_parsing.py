@@ -0,0 +1,89 @@
+"""
+Benchmark of NUDLS feed ingestion: resp.json() style whole-body parsing vs. streaming parsing.
+
+Each mode runs in its own process so that the reported peak RSS belongs to that mode only. The feed is generated in
+a separate process too, since Linux carries a parent's peak RSS over to the processes it spawns. The feed is written to a
+temporary file in the format of dinopark_status_api/tests/data/nudls_test_data.json (a compact JSON array) and read
+back the way each mode reads a response body.
+
+Usage: python -m benchmarks.bench_feed_parsing [--events 1000000]
+"""
+
+# System imports
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# Local imports
+from benchmarks.synthetic_feed import generate_feed
+from dinopark_status_api.feed_stream import iter_json_array, CHUNK_SIZE
+from dinopark_status_api.park_state import ParkState
+
+
+def run_mode(mode, path):
+    """
+    Ingests the feed at path into a ParkState and prints the elapsed time and peak RSS as JSON.
+    :param mode: "json" to parse the whole body at once, "stream" to parse it chunk by chunk.
+    :param path: Path of the feed file.
+    """
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    with open(path, "rb") as feed_file:
+        if mode == "json":
+            # What resp.json() does: read the whole body, decode it and load it as a list
+            events = json.loads(feed_file.read().decode("utf-8"))
+        else:
+            events = iter_json_array(iter(lambda: feed_file.read(CHUNK_SIZE), b""))
+        park_state = ParkState.from_events(events)
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print(json.dumps({
+        "seconds": elapsed,
+        "peak_rss_mb": rss_after / 1024,
+        "peak_rss_increase_mb": (rss_after - rss_before) / 1024,
+        "zones": len(park_state.location_by_zone)
+    }))
+
+
+def main():
+    """
+    Writes a synthetic feed and compares both modes.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1000000, help="Number of events in the feed")
+    parser.add_argument("--mode", choices=["generate", "json", "stream"], help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode == "generate":
+        with open(args.path, "w") as feed_file:
+            json.dump(generate_feed(args.events), feed_file, separators=(",", ":"))
+        return
+    if args.mode:
+        run_mode(args.mode, args.path)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "nudls_feed.json")
+        subprocess.run([sys.executable, "-m", "benchmarks.bench_feed_parsing", "--mode", "generate", "--events", str(args.events),
+                        "--path", path], check=True)
+        size_mb = os.path.getsize(path) / 1024 / 1024
+
+        print(f"feed: {args.events} events, {size_mb:.1f} MB")
+        print(f"{'mode':>8} {'seconds':>9} {'events/s':>12} {'MB/s':>8} {'peak RSS (MB)':>14} {'RSS increase (MB)':>18}")
+        for mode in ("json", "stream"):
+            output = subprocess.run([sys.executable, "-m", "benchmarks.bench_feed_parsing", "--mode", mode, "--path", path],
+                                    check=True, stdout=subprocess.PIPE).stdout
+            result = json.loads(output)
+            print(f"{mode:>8} {result['seconds']:>9.2f} {args.events / result['seconds']:>12.0f} {size_mb / result['seconds']:>8.1f} "
+                  f"{result['peak_rss_mb']:>14.1f} {result['peak_rss_increase_mb']:>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
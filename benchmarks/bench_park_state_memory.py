@@ -0,0 +1,105 @@
+"""
+Benchmark of the memory held by the dinosaur tables of the park state.
+
+Compares the compact layout (one __slots__ record per integer dinosaur id, interned species, diet as a bool and
+epoch millisecond times) with the previous layout of five dictionaries keyed by str(id) holding species names,
+"carnivore"/"herbivore" strings and ISO 8601 time strings.
+
+The feed is decoded from JSON inside the measurement, like a fetched feed, and dropped once the tables are built, so
+the reported memory is what each layout keeps alive between refreshes.
+
+Usage: python -m benchmarks.bench_park_state_memory [--dinos 100000,250000]
+"""
+
+# System imports
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+
+# Local imports
+from benchmarks.synthetic_feed import generate_feed
+from dinopark_status_api.park_state import ParkState
+
+
+def legacy_tables(content):
+    """
+    The previous layout: one dictionary per attribute, keyed by the dinosaur id as a string.
+    :return: Tuple of the species, type, digestion time, removal time and fed time dictionaries.
+    """
+    dino_species, dino_type, dino_digestion_time, dino_removed, dino_fed, added_time = {}, {}, {}, {}, {}, {}
+    for event in content:
+        kind = event["kind"]
+        if kind == "dino_added":
+            dino_id = str(event["id"])
+            if dino_id not in added_time or event["time"] > added_time[dino_id]:
+                added_time[dino_id] = event["time"]
+                dino_species[dino_id] = event["species"]
+                dino_type[dino_id] = "carnivore" if event["herbivore"] is False else "herbivore"
+                dino_digestion_time[dino_id] = int(event["digestion_period_in_hours"] / 24)
+        elif kind == "dino_removed":
+            dino_id = str(event["dinosaur_id"])
+            if dino_id not in dino_removed or event["time"] > dino_removed[dino_id]:
+                dino_removed[dino_id] = event["time"]
+        elif kind == "dino_fed":
+            dino_id = str(event["dinosaur_id"])
+            if dino_id not in dino_fed or event["time"] > dino_fed[dino_id]:
+                dino_fed[dino_id] = event["time"]
+    return dino_species, dino_type, dino_digestion_time, dino_removed, dino_fed, added_time
+
+
+def compact_tables(content):
+    """
+    The compact layout: the dinosaur records of a ParkState.
+    :return: Dictionary of Dinosaur records by integer id.
+    """
+    return ParkState.from_events(content).dinosaurs
+
+
+def measure(build, body):
+    """
+    Decodes the feed, builds the tables and drops the feed.
+    :param build: Function building the tables from the events.
+    :param body: JSON encoded feed.
+    :return: Tuple of the bytes held by the tables and the build time in seconds.
+    """
+    # Timed without tracing, tracemalloc slows every allocation down
+    content = json.loads(body)
+    start = time.perf_counter()
+    build(content)
+    elapsed = time.perf_counter() - start
+    del content
+
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    content = json.loads(body)
+    tables = build(content)
+    del content
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    del tables
+    return held, elapsed
+
+
+def main():
+    """
+    Runs the benchmark and prints a table of the memory held by each layout.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dinos", default="100000,250000", help="Comma separated numbers of dinosaurs")
+    args = parser.parse_args()
+
+    print(f"{'dinosaurs':>10} {'legacy (MB)':>12} {'compact (MB)':>13} {'ratio':>6} {'legacy build (s)':>17} {'compact build (s)':>18}")
+    for dinos in [int(i) for i in args.dinos.split(",")]:
+        # Every dinosaur is added, then fed about once and removed 15% of the time on average
+        body = json.dumps(generate_feed(dinos * 4, num_dinos=dinos))
+        legacy, legacy_time = measure(legacy_tables, body)
+        compact, compact_time = measure(compact_tables, body)
+        print(f"{dinos:>10} {legacy / 1e6:>12.1f} {compact / 1e6:>13.1f} {legacy / compact:>6.2f} {legacy_time:>17.2f} {compact_time:>18.2f}")
+
+
+if __name__ == "__main__":
+    main()
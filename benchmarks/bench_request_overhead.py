@@ -0,0 +1,118 @@
+"""
+Per-request overhead of parsing the zone of a status request, and of whole requests.
+
+Flask-RESTful creates a new resource for every request. Each one used to build a reqparse.RequestParser, add the zone
+argument, parse the arguments and copy them into a dictionary; the zone is now read from the query and checked by a
+regular expression compiled once (status.parse_zone). Both are measured in a request context, then whole maintenance
+status requests are measured through the Flask test client, with the feed cached, for a valid and a malformed zone.
+The cost of the instrumentation every request pays is measured too: timing a phase, and logging an event while its
+level is disabled (see metrics and structured_logging).
+
+Time is per call, memory is the peak traced by tracemalloc during one call, i.e. what the call allocates at once.
+
+Requires mongomock.
+
+Usage: python -m benchmarks.bench_request_overhead [--number 20000] [--events 10000]
+"""
+
+# System imports
+import argparse
+import logging
+import timeit
+import tracemalloc
+
+# Third-party imports
+import mongomock
+from flask import request
+from flask_restful import reqparse
+
+# Local imports
+from benchmarks.bench_asgi_vs_wsgi import start_nudls
+from dinopark_status_api.apis import DinoparkStatusApi
+from dinopark_status_api.constants import LOGGER, API_VERSION
+from dinopark_status_api.feed_cache import FeedCache
+from dinopark_status_api.metrics import phase
+from dinopark_status_api.nudls_client import NudlsClient
+from dinopark_status_api.status import parse_zone
+from dinopark_status_api.structured_logging import log_event
+
+
+def legacy_parse():
+    """
+    Zone of the request, as parsed by the status resources before.
+    """
+    parser = reqparse.RequestParser()
+    parser.add_argument("zone", type=str, help="Provide a zone number", location="args", required=True)
+    args = parser.parse_args()
+    query = dict(args)
+    return query["zone"]
+
+
+def validator_parse():
+    """
+    Zone of the request, as parsed by the status resources now.
+    """
+    return parse_zone(request.args.get("zone"))
+
+
+def timed_phase():
+    """
+    An empty phase, as timed by the status cache and the feed cache.
+    """
+    with phase("benchmark"):
+        pass
+
+
+def peak_memory(function, runs=200):
+    """
+    :return: Average peak of memory traced during a call, in bytes.
+    """
+    total = 0
+    for _ in range(runs):
+        tracemalloc.start()
+        function()
+        total += tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return total / runs
+
+
+def measure(name, function, number):
+    """
+    Prints the time and peak memory of a call.
+    """
+    cost = timeit.timeit(function, number=number) / number
+    print(f"{name:<36} {cost * 1e6:>10.1f} {peak_memory(function) / 1024:>10.1f}")
+
+
+def main():
+    """
+    Runs the benchmark and prints the per-call costs.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000, help="Calls per measurement")
+    parser.add_argument("--events", type=int, default=10000, help="Number of events in the NUDLS feed")
+    args = parser.parse_args()
+    logging.getLogger(LOGGER).setLevel(logging.CRITICAL)
+
+    feed_cache = FeedCache(client=NudlsClient(url=start_nudls(args.events, 0)), ttl=3600)
+    app = DinoparkStatusApi.create_app(mongomock.MongoClient(), feed_cache=feed_cache, poll_interval=None, create_indexes=False)
+    client = app.test_client()
+    base_path = "/dinopark_status/" + API_VERSION
+    # Load the feed and compute the status once, requests are then served from the caches
+    assert client.get(base_path + "/maintenance_status?zone=A10").status_code == 200
+
+    print(f"{'path':<36} {'time (us)':>10} {'peak (KiB)':>10}")
+    with app.test_request_context("/?zone=A10"):
+        assert legacy_parse() == validator_parse() == "A10"
+        measure("zone parsing, RequestParser", legacy_parse, args.number)
+        measure("zone parsing, precompiled validator", validator_parse, args.number)
+    logger = logging.getLogger(LOGGER)
+    measure("phase timing", timed_phase, args.number)
+    measure("log event, level disabled", lambda: log_event(logger, logging.DEBUG, "benchmark", zone="A10"), args.number)
+    measure("request, valid zone", lambda: client.get(base_path + "/maintenance_status?zone=A10"), args.number // 10)
+    measure("request, malformed zone", lambda: client.get(base_path + "/maintenance_status?zone=A17"), args.number // 10)
+    app.extensions["write_behind"].close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""
+Reproducible benchmark suite: microbenchmarks of the status algorithms and a load test of both status endpoints,
+with results stored per commit so that regressions can be spotted by comparing two runs.
+
+Nothing external is needed: a local NUDLS stand-in serves a synthetic feed of the given size (events, dinosaurs,
+zones), and the API runs in its own process with mongomock as MongoDB (see bench_asgi_vs_wsgi). The feed is generated
+from a fixed seed, so the same arguments always measure the same feed.
+
+Microbenchmarks time one call of:
+- the maintenance date logic (days since the last maintenance of a zone) and the whole maintenance status,
+- the safety algorithm of one carnivore and the whole safety status,
+- building the park state from the feed.
+Each is timed over --repeat rounds and the fastest round is kept, which is the least disturbed by the machine.
+
+The load test sends --requests requests to each endpoint with --concurrency keep-alive connections and reports the
+throughput and the p50/p95/p99 latencies, per serving mode (--modes).
+
+Results are written to <--output>/<commit>.json, with the commit, whether the tree had changes, the Python version
+and the arguments. With --compare, every metric is compared with a previous result file and the ones worse by more
+than --threshold are flagged, exiting with an error with --fail-on-regression.
+
+Requires mongomock, and the ASGI requirements (httpx, uvicorn) to load test the ASGI mode.
+
+Usage: python -m benchmarks.bench_suite [--events 10000] [--dinosaurs 500] [--zones 416] [--modes wsgi asgi]
+       [--compare benchmarks/results/<commit>.json] [--fail-on-regression]
+"""
+
+# System imports
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+from urllib.request import urlopen
+
+# Local imports
+from benchmarks.bench_asgi_vs_wsgi import free_port, percentile, run_load, start_nudls
+from benchmarks.synthetic_feed import generate_feed, ZONES
+from dinopark_status_api.constants import API_VERSION
+from dinopark_status_api.park_state import ParkState
+from dinopark_status_api.status import maintenance_status, safety_status, safety_status_algorithm
+from dinopark_status_api.timestamps import today
+
+# Project root, where the git repository is
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Status endpoints under load
+ENDPOINTS = ("maintenance_status", "safety_status")
+
+
+def git_commit():
+    """
+    :return: Tuple of the short commit hash of the tree, "unknown" outside of a git repository, and whether the tree
+    has uncommitted changes.
+    """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        changes = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True,
+                                 text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown", False
+    return commit, bool(changes)
+
+
+def time_call(function, number, repeat):
+    """
+    :return: Seconds per call of the fastest of the repeated rounds.
+    """
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number
+
+
+def available_zones(park_state, status_function):
+    """
+    :return: Zones of the grid the status function answers for, others are not in the feed.
+    """
+    zones = []
+    for zone in ZONES:
+        try:
+            status_function(park_state, zone)
+        except Exception:  # pylint: disable=broad-except
+            continue
+        zones.append(zone)
+    return zones
+
+
+def cycle_calls(status_function, park_state, zones):
+    """
+    :return: Function calling the status function for the next zone, in turn, on each call.
+    """
+    state = {"index": 0}
+
+    def call():
+        zone = zones[state["index"]]
+        state["index"] = (state["index"] + 1) % len(zones)
+        return status_function(park_state, zone)
+    return call
+
+
+def run_microbenchmarks(feed, number, repeat):
+    """
+    Times the status algorithms on a park state built from the feed.
+    :param feed: List of NUDLS events.
+    :return: Dictionary of metric name to microseconds per call.
+    """
+    park_state = ParkState.from_events(feed)
+    maintenance_zones = available_zones(park_state, maintenance_status)
+    safety_zones = available_zones(park_state, safety_status)
+    zone = safety_zones[0]
+    location = park_state.location_by_zone[zone]
+    dino_id = int(location["dinosaur_id"])
+    dinosaur = park_state.dinosaurs[dino_id]
+    update_day = park_state.location_day_by_zone[zone]
+    maintenance_day = park_state.maintenance_day_by_zone[maintenance_zones[0]]
+
+    measurements = {
+        "micro.maintenance_date_diff_us": lambda: today() - maintenance_day,
+        "micro.maintenance_status_us": cycle_calls(maintenance_status, park_state, maintenance_zones),
+        "micro.safety_algorithm_us": lambda: safety_status_algorithm(update_day, zone, dino_id, dinosaur),
+        "micro.safety_status_us": cycle_calls(safety_status, park_state, safety_zones),
+    }
+    results = {name: time_call(function, number, repeat) * 1e6 for name, function in measurements.items()}
+    # The feed is built once per fetch rather than per request, fewer rounds are enough
+    results["micro.park_state_build_ms"] = time_call(lambda: ParkState.from_events(feed), 1, repeat) * 1e3
+    return results, maintenance_zones, safety_zones
+
+
+def run_load_test(mode, nudls_url, cache_ttl, total, concurrency, zones_by_endpoint):
+    """
+    Load tests both status endpoints of the API served in the given mode, one endpoint after the other.
+    :param zones_by_endpoint: Zones requested from each endpoint, those the feed has an answer for.
+    :return: Dictionary of metric name to value.
+    """
+    port = free_port()
+    server = subprocess.Popen([sys.executable, "-m", "benchmarks.bench_asgi_vs_wsgi", "--serve", mode, "--port", str(port),
+                               "--nudls-url", nudls_url, "--cache-ttl", str(cache_ttl)], cwd=ROOT)
+    base_url = f"http://127.0.0.1:{port}/dinopark_status/{API_VERSION}"
+    results = {}
+    try:
+        for _ in range(100):
+            try:
+                urlopen(base_url + "/", timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        for endpoint in ENDPOINTS:
+            zones = zones_by_endpoint[endpoint]
+            # Warm up: fetch the feed and compute every status once, as a long running process would have
+            asyncio.run(run_load(base_url, len(zones), 1, endpoints=(endpoint,), zones=zones))
+            elapsed, latencies, errors = asyncio.run(run_load(base_url, total, concurrency, endpoints=(endpoint,), zones=zones))
+            prefix = f"load.{mode}.{endpoint}"
+            results[f"{prefix}.requests_per_second"] = len(latencies) / elapsed
+            for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+                results[f"{prefix}.{name}_ms"] = percentile(latencies, fraction) * 1e3
+            results[f"{prefix}.errors"] = errors
+    finally:
+        server.terminate()
+        server.wait()
+    return results
+
+
+def higher_is_better(name):
+    """
+    :return: Whether a larger value of the metric is an improvement, e.g. throughput.
+    """
+    return name.endswith("requests_per_second")
+
+
+def compare(metrics, baseline, threshold):
+    """
+    Prints every metric next to its baseline value.
+    :param metrics: Dictionary of metric name to value of this run.
+    :param baseline: Dictionary of metric name to value of the run compared with.
+    :param threshold: Relative change past which a worse value is a regression, e.g. 0.1 for 10%.
+    :return: List of the names of the regressed metrics.
+    """
+    regressions = []
+    print(f"{'metric':<48} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, value in sorted(metrics.items()):
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"{name:<48} {'-':>12} {value:>12.2f} {'new':>8}")
+            continue
+        change = (value - previous) / previous if previous else 0.0
+        worse = -change if higher_is_better(name) else change
+        flag = ""
+        if name.endswith(".errors"):
+            worse = value - previous
+            flag = "  REGRESSION" if worse > 0 else ""
+        elif worse > threshold:
+            flag = "  REGRESSION"
+        if flag:
+            regressions.append(name)
+        print(f"{name:<48} {previous:>12.2f} {value:>12.2f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main():
+    """
+    Runs the suite, prints and stores its results, and compares them with a previous run if asked to.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=10000, help="Events in the NUDLS feed")
+    parser.add_argument("--dinosaurs", type=int, default=500, help="Dinosaurs in the NUDLS feed")
+    parser.add_argument("--zones", type=int, default=len(ZONES), help="Zones the events are spread over, up to 416")
+    parser.add_argument("--number", type=int, default=20000, help="Calls per round of each microbenchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="Rounds of each microbenchmark, the fastest is kept")
+    parser.add_argument("--modes", nargs="*", choices=["wsgi", "asgi"], default=["wsgi"], help="Serving modes load tested, none to skip")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests sent to each endpoint")
+    parser.add_argument("--concurrency", type=int, default=20, help="Concurrent connections")
+    parser.add_argument("--upstream-latency-ms", type=float, default=0, help="Latency of the NUDLS stand-in")
+    parser.add_argument("--cache-ttl", type=float, default=60, help="Feed cache TTL in seconds, 0 to call NUDLS on every request")
+    parser.add_argument("--output", default=os.path.join(ROOT, "benchmarks", "results"), help="Directory results are written to")
+    parser.add_argument("--compare", help="Result file of a previous run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative change past which a worse metric is a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with an error if a metric regressed")
+    args = parser.parse_args()
+
+    # Read first, the baseline may be the result file of this very commit, which is overwritten
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    feed = generate_feed(args.events, num_dinos=args.dinosaurs, zones=ZONES[:args.zones])
+    metrics, maintenance_zones, safety_zones = run_microbenchmarks(feed, args.number, args.repeat)
+    if args.modes:
+        nudls_url = start_nudls(args.events, args.upstream_latency_ms / 1000, dinosaurs=args.dinosaurs, zones=args.zones)
+        zones_by_endpoint = {"maintenance_status": maintenance_zones, "safety_status": safety_zones}
+        for mode in args.modes:
+            metrics.update(run_load_test(mode, nudls_url, args.cache_ttl, args.requests, args.concurrency, zones_by_endpoint))
+
+    commit, changes = git_commit()
+    result = {
+        "commit": commit,
+        "uncommitted_changes": changes,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "arguments": {name: value for name, value in vars(args).items() if name not in ("output", "compare", "threshold", "fail_on_regression")},
+        "metrics": metrics
+    }
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{commit}{'-dirty' if changes else ''}.json")
+    with open(path, "w") as result_file:
+        json.dump(result, result_file, indent=2, sort_keys=True)
+
+    if baseline is not None:
+        if baseline["arguments"] != result["arguments"]:
+            print(f"Warning: {args.compare} was run with other arguments: {baseline['arguments']}")
+        print(f"Commit {commit} compared with {baseline['commit']}")
+        regressions = compare(metrics, baseline["metrics"], args.threshold)
+    else:
+        print(f"Commit {commit}")
+        print(f"{'metric':<48} {'value':>12}")
+        for name, value in sorted(metrics.items()):
+            print(f"{name:<48} {value:>12.2f}")
+        regressions = []
+    print(f"Results written to {path}")
+
+    if regressions and args.fail_on_regression:
+        sys.exit(f"Regressed: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Benchmark of the date handling on the status hot path.
+
+The previous code parsed the NUDLS event time and formatted and re-parsed today's date on every status request:
+datetime.strptime(time.strftime("%Y-%m-%d"), ...) and datetime.strptime(event_time[:10], ...). Event times are now
+parsed once, when the events are applied, into days since the epoch, and today comes from a clock that computes it
+once per day, so a request only subtracts two integers.
+
+Usage: python -m benchmarks.bench_timestamps [--number 200000]
+"""
+
+# System imports
+import argparse
+import time
+import timeit
+from datetime import datetime
+
+# Local imports
+from dinopark_status_api.timestamps import Clock, epoch_day, epoch_millis
+
+EVENT_TIME = "2021-02-03T22:59:31.696Z"
+
+
+def legacy_date_diff(event_time):
+    """
+    Days between an event and today, as computed before on every request.
+    """
+    today_date = datetime.strptime(time.strftime("%Y-%m-%d"), "%Y-%m-%d")
+    event_date = datetime.strptime(event_time[:10], "%Y-%m-%d")
+    return (today_date - event_date).days
+
+
+def legacy_epoch_millis(event_time):
+    """
+    Event time in milliseconds since the epoch, parsed with datetime.
+    """
+    return (datetime.strptime(event_time, "%Y-%m-%dT%H:%M:%S.%fZ") - datetime(1970, 1, 1)).total_seconds() * 1000
+
+
+def main():
+    """
+    Runs the benchmark and prints the per-call costs.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=200000, help="Calls per measurement")
+    args = parser.parse_args()
+
+    clock = Clock()
+    event_day = epoch_day(EVENT_TIME)
+    assert clock.today() - event_day == legacy_date_diff(EVENT_TIME)
+    assert epoch_millis(EVENT_TIME) == legacy_epoch_millis(EVENT_TIME)
+
+    measurements = [
+        ("date diff per request, strptime/strftime", lambda: legacy_date_diff(EVENT_TIME)),
+        ("date diff per request, clock - epoch day", lambda: clock.today() - event_day),
+        ("event time at ingest, strptime", lambda: legacy_epoch_millis(EVENT_TIME)),
+        ("event time at ingest, epoch_millis", lambda: epoch_millis(EVENT_TIME)),
+        ("event day at ingest, epoch_day", lambda: epoch_day(EVENT_TIME))
+    ]
+    print(f"{'path':<44} {'per call (us)':>14}")
+    for name, function in measurements:
+        cost = timeit.timeit(function, number=args.number) / args.number
+        print(f"{name:<44} {cost * 1e6:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
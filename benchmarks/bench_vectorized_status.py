@@ -0,0 +1,49 @@
+"""
+Benchmark of the columnar (NumPy) status evaluation against the per-zone Python path.
+
+Both engines compute the maintenance and safety statuses of the same zones from the same park state, and their
+results are checked to be identical. The number of zones grows from one to well past the 416 zones of the park
+grid. Needs numpy, which the app itself does not depend on.
+
+Usage: python -m benchmarks.bench_vectorized_status [--zones 1,4,16,64,416,4000,40000]
+"""
+
+# System imports
+import argparse
+import logging
+import timeit
+
+# Local imports
+from benchmarks.synthetic_feed import generate_feed
+from dinopark_status_api.constants import LOGGER
+from dinopark_status_api.park_state import ParkState
+from dinopark_status_api.status import batch_status, STATUS_FUNCTIONS
+from dinopark_status_api.vectorized import vectorized_batch_status
+
+
+def main():
+    """
+    Runs the benchmark and prints a table of per-call costs.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--zones", default="1,4,16,64,416,4000,40000", help="Comma separated numbers of zones")
+    args = parser.parse_args()
+    # The per-zone path logs each safety decision
+    logging.getLogger(LOGGER).setLevel(logging.CRITICAL)
+    statuses = list(STATUS_FUNCTIONS)
+
+    print(f"{'zones':>8} {'per zone (ms)':>14} {'columnar (ms)':>14} {'speed up':>9}")
+    for count in [int(i) for i in args.zones.split(",")]:
+        zones = [f"Z{i}" for i in range(count)]
+        park_state = ParkState.from_events(generate_feed(max(count * 20, 1000), zones=zones))
+        expected, _ = batch_status(park_state, zones, statuses)
+        assert vectorized_batch_status(park_state, zones, statuses) == expected
+
+        runs = max(3, 20000 // count)
+        per_zone = timeit.timeit(lambda: batch_status(park_state, zones, statuses), number=runs) / runs
+        columnar = timeit.timeit(lambda: vectorized_batch_status(park_state, zones, statuses), number=runs) / runs
+        print(f"{count:>8} {per_zone * 1e3:>14.3f} {columnar * 1e3:>14.3f} {per_zone / columnar:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Requests/s of the gunicorn serving mode (gunicorn.conf.py) as the number of worker processes grows.
+
+The API is served by gunicorn with the project's configuration, except that MongoDB is replaced by mongomock and NUDLS
+by a local stand-in, and loaded by several load generator processes. Throughput should grow with the number of
+workers until it reaches the number of cores (a single Flask process is bound by the GIL).
+
+Requires gunicorn and mongomock.
+
+Usage: python -m benchmarks.bench_wsgi_workers [--workers 1 2 4 8] [--threads 4] [--requests 4000] [--concurrency 64]
+"""
+
+# System imports
+import argparse
+import asyncio
+import logging
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from urllib.request import urlopen
+
+# Local imports
+from benchmarks.bench_asgi_vs_wsgi import free_port, percentile, run_load, start_nudls
+from dinopark_status_api.constants import LOGGER
+
+# Environment variable passing the URL of the NUDLS stand-in to the gunicorn workers
+NUDLS_URL_ENV = "BENCH_NUDLS_URL"
+
+
+def create_bench_app():
+    """
+    App factory given to gunicorn, app.create_app with in-memory MongoDB and the NUDLS stand-in.
+    :return: A Flask app instance.
+    """
+    import mongomock  # pylint: disable=import-outside-toplevel
+    from dinopark_status_api.apis import DinoparkStatusApi  # pylint: disable=import-outside-toplevel
+    from dinopark_status_api.feed_cache import FeedCache  # pylint: disable=import-outside-toplevel
+    from dinopark_status_api.json_encoder import MongoJsonEncoder  # pylint: disable=import-outside-toplevel
+    from dinopark_status_api.nudls_client import NudlsClient  # pylint: disable=import-outside-toplevel
+
+    logging.getLogger(LOGGER).setLevel(logging.CRITICAL)
+    feed_cache = FeedCache(client=NudlsClient(url=os.environ[NUDLS_URL_ENV]))
+    app = DinoparkStatusApi.create_app(mongomock.MongoClient(), feed_cache=feed_cache, poll_interval=None)
+    app.json_encoder = MongoJsonEncoder
+    return app
+
+
+def load(args):
+    """
+    Runs one load generator process.
+    :param args: Tuple of the base URL, number of requests and concurrency.
+    :return: Tuple of wall clock seconds, list of latencies in seconds and number of 5xx responses.
+    """
+    return asyncio.run(run_load(*args))
+
+
+def main():
+    """
+    Runs the load test against each number of workers and prints a report.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", help="Numbers of worker processes, defaults to powers of 2 up to the cores")
+    parser.add_argument("--threads", type=int, default=4, help="Threads per worker")
+    parser.add_argument("--requests", type=int, default=4000, help="Requests sent to each configuration")
+    parser.add_argument("--concurrency", type=int, default=64, help="Concurrent connections in total")
+    parser.add_argument("--load-processes", type=int, default=max(1, multiprocessing.cpu_count() // 2), help="Load generator processes")
+    parser.add_argument("--events", type=int, default=2000, help="Events in the NUDLS feed")
+    args = parser.parse_args()
+
+    cores = multiprocessing.cpu_count()
+    workers_list = args.workers or [2 ** i for i in range(cores.bit_length()) if 2 ** i <= cores]
+    nudls_url = start_nudls(args.events, 0)
+    processes = args.load_processes
+
+    print(f"{cores} cores, {args.threads} threads per worker, {args.requests} requests, concurrency {args.concurrency}, "
+          f"{processes} load generator processes")
+    print(f"{'workers':>8} {'req/s':>9} {'p50 (ms)':>9} {'p99 (ms)':>9} {'5xx':>5}")
+    for workers in workers_list:
+        port = free_port()
+        env = dict(os.environ, DINOPARK_BIND=f"127.0.0.1:{port}", DINOPARK_WORKERS=str(workers), DINOPARK_THREADS=str(args.threads))
+        env[NUDLS_URL_ENV] = nudls_url
+        server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "--log-level", "warning",
+                                   "benchmarks.bench_wsgi_workers:create_bench_app()"], env=env)
+        base_url = f"http://127.0.0.1:{port}/dinopark_status/v1"
+        try:
+            for _ in range(100):
+                try:
+                    urlopen(base_url + "/", timeout=1).close()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            # Warm up every worker, the first request of each waits for its first NUDLS poll
+            load((base_url, workers * args.threads * 4, workers * args.threads))
+
+            with multiprocessing.Pool(processes) as pool:
+                start = time.perf_counter()
+                results = pool.map(load, [(base_url, args.requests // processes, max(1, args.concurrency // processes))] * processes)
+                elapsed = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+
+        latencies = [latency for _, process_latencies, _ in results for latency in process_latencies]
+        errors = sum(process_errors for _, _, process_errors in results)
+        print(f"{workers:>8} {len(latencies) / elapsed:>9.1f} {percentile(latencies, 0.5) * 1e3:>9.1f} "
+              f"{percentile(latencies, 0.99) * 1e3:>9.1f} {errors:>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Microbenchmark of the per-request zone look up cost as the NUDLS feed grows.
+
+Compares the indexed ParkState look ups with the per-request list scans the resources used to do.
+
+Usage: python -m benchmarks.bench_zone_index [--sizes 1000,10000,100000,1000000]
+"""
+
+# System imports
+import argparse
+import timeit
+
+# Local imports
+from benchmarks.synthetic_feed import generate_feed, ZONES
+from dinopark_status_api.park_state import ParkState
+
+
+def scan_lookup(content, zone):
+    """
+    The previous per-request path: filter the whole feed and pick the first matching entry.
+    """
+    maintenance_log = [entry for entry in content if entry["kind"] == "maintenance_performed"]
+    locations = [entry["location"] for entry in maintenance_log]
+    if zone not in locations:
+        return None
+    return [entry for entry in maintenance_log if entry["location"] == zone][0]
+
+
+def index_lookup(park_state, zone):
+    """
+    The indexed path: one dictionary look up against the snapshot built once per feed.
+    """
+    return park_state.maintenance_by_zone.get(zone)
+
+
+def main():
+    """
+    Runs the benchmark and prints a table of per-request costs.
+    """
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000", help="Comma separated feed sizes (events)")
+    args = parser.parse_args()
+
+    print(f"{'events':>10} {'build (ms)':>12} {'index (us/req)':>15} {'scan (us/req)':>15}")
+    for size in [int(i) for i in args.sizes.split(",")]:
+        content = generate_feed(size)
+        build_time = timeit.timeit(lambda: ParkState.from_events(content), number=1)
+        park_state = ParkState.from_events(content)
+
+        zones = iter(ZONES * 1000)
+        index_runs = 100000
+        index_time = timeit.timeit(lambda: index_lookup(park_state, next(zones)), number=index_runs)
+
+        # The scan path is O(feed size), keep the number of runs bounded for large feeds.
+        scan_runs = max(1, 100000 // size)
+        scan_time = timeit.timeit(lambda: scan_lookup(content, next(zones)), number=scan_runs)
+
+        print(f"{size:>10} {build_time * 1e3:>12.1f} {index_time / index_runs * 1e6:>15.3f} {scan_time / scan_runs * 1e6:>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
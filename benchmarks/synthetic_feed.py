@@ -0,0 +1,69 @@
+"""
+Synthetic NUDLS feed generator for benchmarks.
+
+Events follow the format of dinopark_status_api/tests/data/nudls_test_data.json and are listed newest first,
+like the NUDLS feed.
+"""
+
+# System imports
+import random
+import string
+from datetime import datetime, timedelta
+
+# All zone identifiers of the park grid, A1..Z16
+ZONES = [f"{letter}{number}" for letter in string.ascii_uppercase for number in range(1, 17)]
+
+SPECIES = [
+    ("Tyrannosaurus rex", False, 48),
+    ("Velociraptor", False, 24),
+    ("Brachiosaurus", True, 72),
+    ("Triceratops", True, 36),
+    ("Stegosaurus", True, 24),
+    ("Spinosaurus", False, 96),
+]
+
+
+def generate_feed(num_events, num_dinos=None, zones=None, park_id=1, seed=42, end=datetime(2021, 2, 7)):
+    """
+    Generates a synthetic NUDLS feed.
+    :param num_events: Total number of events in the feed.
+    :param num_dinos: Number of dinosaurs added to the park. Defaults to one dinosaur per 20 events.
+    :param zones: Zone identifiers events are spread over. Defaults to the whole A1..Z16 grid.
+    :param park_id: Park identifier stamped on each event.
+    :param seed: Random seed, the same arguments always generate the same feed.
+    :param end: Time of the most recent event.
+    :return: List of NUDLS events, newest first.
+    """
+    rng = random.Random(seed)
+    zones = zones or ZONES
+    num_dinos = num_dinos or max(1, num_events // 20)
+    num_dinos = min(num_dinos, num_events)
+    first_id = 1000
+
+    # Spread events over 60 days, oldest first while generating
+    start = end - timedelta(days=60)
+    step = (end - start) / num_events
+
+    events = []
+    for i in range(num_dinos):
+        species, herbivore, digestion = rng.choice(SPECIES)
+        events.append({"kind": "dino_added", "name": f"Dino {i}", "species": species, "gender": rng.choice(["male", "female"]),
+                       "id": first_id + i, "digestion_period_in_hours": digestion, "herbivore": herbivore, "park_id": park_id})
+
+    for _ in range(num_events - num_dinos):
+        roll = rng.random()
+        dino_id = first_id + rng.randrange(num_dinos)
+        if roll < 0.4:
+            events.append({"kind": "dino_location_updated", "location": rng.choice(zones), "dinosaur_id": dino_id, "park_id": park_id})
+        elif roll < 0.7:
+            events.append({"kind": "dino_fed", "dinosaur_id": dino_id, "park_id": park_id})
+        elif roll < 0.95:
+            events.append({"kind": "maintenance_performed", "location": rng.choice(zones), "park_id": park_id})
+        else:
+            events.append({"kind": "dino_removed", "dinosaur_id": dino_id, "park_id": park_id})
+
+    for i, event in enumerate(events):
+        event["time"] = (start + step * i).strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+
+    events.reverse()
+    return events
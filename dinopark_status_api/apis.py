@@ -3,15 +3,26 @@ Main API package.
 """
 
 # System imports
+import atexit
+import functools
 import logging
+import time
 
 # Third-party imports
-from flask import Flask
+from flask import Flask, g, request
 from flask_restful import Api
 
 # Local imports
-from dinopark_status_api.constants import LOGGER, API_VERSION, DATABASE_NAME, COLLECTION_NAME
-from dinopark_status_api.resources import Health, StatusMaintenance, StatusSafety
+from dinopark_status_api.constants import LOGGER, API_VERSION, DATABASE_NAME, COLLECTION_NAME, PARK_STATE_COLLECTION_NAME, \
+    NUDLS_URL, FEED_POLL_INTERVAL_SECONDS, WRITE_BEHIND_SPILL_PATH, WRITE_BEHIND_CLOSE_SECONDS, DEFAULT_PARK_NAME
+from dinopark_status_api.history import ensure_indexes
+from dinopark_status_api.json_encoder import MongoJsonEncoder
+from dinopark_status_api.metrics import REGISTRY, REQUEST_SECONDS, REQUESTS_IN_FLIGHT, set_route, reset_route
+from dinopark_status_api.parks import Park, ParkServices
+from dinopark_status_api.readiness import Readiness
+from dinopark_status_api.resources import Health, Parks, Ready, Metrics, StatusMaintenance, StatusSafety, StatusBatch, ParkStatus, \
+    ZoneHistory, ZoneStream, json_response
+from dinopark_status_api.structured_logging import log_event
 
 
 class DinoparkStatusApi(Api):
@@ -22,16 +33,27 @@ class DinoparkStatusApi(Api):
     def handle_error(self, e):
         """
         Error handler for the API transforms a raised exception into a Flask response,
-        with the appropriate HTTP status code and body..
-
-        If no description attribute in the error class, means Python core
-        If there is a description attribute, means a HTTP exception
+        with the appropriate HTTP status code and body, encoded by resources.json_response.
 
         We are overriding handle_error inside Api package to customize.
 
         :param e: The exception to handle
         :return: JSON with the status and exception.
         """
+        data, code = self.error_envelope(e)
+        return self.make_response(data, code)
+
+    @staticmethod
+    def error_envelope(e):
+        """
+        Builds and logs the error response body for a raised exception.
+
+        If no description attribute in the error class, means Python core
+        If there is a description attribute, means a HTTP exception
+
+        :param e: The exception to handle
+        :return: Tuple of the response body and the HTTP status code.
+        """
         # retrieve attribute of exception class, defaults to 500.
         code = getattr(e, "code", 500)
         if hasattr(e, 'description') and e.description:
@@ -51,19 +73,32 @@ class DinoparkStatusApi(Api):
             }
         }
 
-        return self.make_response(data, code)
+        return data, code
 
     @staticmethod
-    def create_app(data_access_layer):
+    def create_app(data_access_layer, feed_cache=None, poll_interval=FEED_POLL_INTERVAL_SECONDS, write_behind=None, create_indexes=True,
+                   parks=None):
         """
         Creates a new API instance.
         :param data_access_layer: The data access layer for connecting to MongoDB.
+        :param feed_cache: The NUDLS feed cache shared by all requests. Defaults to a new FeedCache with the configured TTL,
+        saving the park state in MongoDB so that restarts resume from it.
+        :param poll_interval: Seconds between background refreshes of the NUDLS feed. If None, requests refresh the feed
+        themselves when it expires.
+        :param write_behind: The queue status documents are stored in MongoDB through. Defaults to a new
+        WriteBehindQueue of the status collection with the configured settings, upserting statuses by key.
+        :param create_indexes: Whether to start creating the indexes of the status collection now, in the background.
+        Servers forking the app start it in each process instead (see gunicorn.conf.py).
+        :param parks: ParkRegistry of the parks served, each under its own path, e.g. /dinopark_status/v1/<park>/safety_status,
+        with its own feed cache, refresh schedule and collections. If None, the park of the configured NUDLS feed is
+        served at the base path. feed_cache, poll_interval and write_behind only apply to that single park.
         :return A Flask app instance.
         """
         logger = logging.getLogger(LOGGER)
 
-        # Instantiate a new Flask app
+        # Instantiate a new Flask app. Responses are encoded by resources.json_response, the encoder is only used by jsonify.
         app = Flask(__name__)
+        app.json_encoder = MongoJsonEncoder
 
         # Base path
         base_path = "/dinopark_status/" + API_VERSION
@@ -71,7 +106,83 @@ class DinoparkStatusApi(Api):
         # When the app starts, create Mongo database and collection.
         # This does not recreate db and collection when a request is made, but pass the db and collection objects to the starting app.
         database = data_access_layer[DATABASE_NAME]
-        collection = database[COLLECTION_NAME]
+
+        # Start up work that needs MongoDB or NUDLS runs in the background, so that the health endpoint answers as soon
+        # as the process starts and the readiness endpoint tells when it can take traffic.
+        readiness = Readiness()
+        app.extensions["readiness"] = readiness
+
+        # Instantiate main API class within Api. This is possible as information to create object of a class
+        # is already known at the point when one of its methods is called in app.py
+        api = DinoparkStatusApi(app, prefix=base_path)
+        # Bodies returned by resources and errors are encoded with the fast serializer
+        api.representations["application/json"] = json_response
+
+        # Park of each route of a park, used by the registry to load parks on demand and evict idle ones
+        park_by_endpoint = {}
+
+        if parks is None:
+            # One feed cache per app (i.e. per process) so that every request reuses the same NUDLS feed until it expires.
+            # Its park state is saved in MongoDB, a restarted process resumes from it instead of rebuilding it from the feed.
+            park = Park(DEFAULT_PARK_NAME, NUDLS_URL, COLLECTION_NAME, PARK_STATE_COLLECTION_NAME, poll_interval)
+            services = ParkServices(park, database, feed_cache=feed_cache, write_behind=write_behind, spill_path=WRITE_BEHIND_SPILL_PATH)
+            DinoparkStatusApi._add_park(readiness, services, create_indexes)
+            DinoparkStatusApi._add_park_routes(api, services, "", "")
+            # Exposed so that servers forking the app can start polling and create the indexes in each process (see gunicorn.conf.py)
+            app.extensions["status_collection"] = services.collection
+            app.extensions["write_behind"] = services.write_behind
+            app.extensions["feed_cache"] = services.feed_cache
+            app.extensions["status_cache"] = services.status_cache
+            app.extensions["status_stream"] = services.status_stream
+            app.extensions["event_store"] = services.event_store
+
+            # Refresh the feed in the background so that requests only read the current snapshot and never wait on NUDLS.
+            if poll_interval:
+                services.load()
+                readiness.add_check("feed", services.feed_cache.loaded)
+
+            # Gauges read from the caches and the queue when the metrics are rendered, from the latest app of the process
+            REGISTRY.gauge("dinopark_feed_snapshot_age_seconds", "Seconds since the NUDLS feed was fetched or revalidated.") \
+                .set_function(lambda: services.feed_cache.stats()["age_seconds"])
+            REGISTRY.gauge("dinopark_write_behind_queued", "Status documents waiting to be written to MongoDB.") \
+                .set_function(lambda: services.write_behind.stats()["queued"])
+            REGISTRY.gauge("dinopark_stream_subscribers", "Subscribers to the zone status stream.") \
+                .set_function(lambda: services.status_stream.stats()["subscribers"])
+        else:
+            # Every park has its own caches, queue and collections. Nothing is fetched until a park is first used, and
+            # the snapshots of idle parks are evicted to keep within the memory budgets (see parks.ParkRegistry).
+            services_by_park = {}
+            for park in parks:
+                services = ParkServices(park, database)
+                parks.attach(services)
+                DinoparkStatusApi._add_park(readiness, services, create_indexes, park.name)
+                park_by_endpoint.update(DinoparkStatusApi._add_park_routes(api, services, "/" + park.name, park.name + "."))
+                services_by_park[park.name] = services
+            app.extensions["parks"] = services_by_park
+            app.extensions["park_registry"] = parks
+
+            REGISTRY.gauge("dinopark_parks_memory_bytes", "Estimated bytes held by the parks: feed snapshots, time travel events and cached statuses.") \
+                .set_function(lambda: parks.stats()["memory_bytes"])
+            REGISTRY.gauge("dinopark_parks_loaded", "Parks holding a NUDLS feed snapshot.") \
+                .set_function(lambda: sum(park["loaded"] for park in parks.stats()["parks"].values()))
+
+            api.add_resource(Parks,
+                             "/",
+                             endpoint="health",
+                             resource_class_kwargs={"parks": parks})
+
+        @app.before_request
+        def before_request():
+            """
+            Function to start timing the request, and to record its phases under its route (see metrics.phase).
+            :return:
+            """
+            g.route = request.endpoint or "unmatched"
+            g.route_token = set_route(g.route)
+            g.started = time.perf_counter()
+            REQUESTS_IN_FLIGHT.inc(g.route)
+            if request.endpoint in park_by_endpoint:
+                parks.use(park_by_endpoint[request.endpoint])
 
         @app.after_request
         def after_request(response):
@@ -80,39 +191,116 @@ class DinoparkStatusApi(Api):
             :param response:
             :return:
             """
-            if 200 <= response.status_code < 300:
-                log_statement = {
-                    "status": {
-                        "code": response.status_code,
-                        "status": "SUCCESS"
-                    }
-                }
+            route = g.get("route", "unmatched")
+            if "started" in g:
+                REQUEST_SECONDS.observe(time.perf_counter() - g.started, route, request.method, str(response.status_code))
+            log_event(logger, logging.DEBUG, "request", route=route, method=request.method, code=response.status_code)
+            # The request may have grown its park, e.g. the events kept for an as_of query
+            if request.endpoint in park_by_endpoint:
+                parks.enforce()
+            return response
 
-                logger.info(log_statement)
+        @app.teardown_request
+        def teardown_request(exc):  # pylint: disable=unused-argument
+            """
+            Function called once the request is done, even if it failed.
+            :param exc: The unhandled exception, if any.
+            :return:
+            """
+            if "route_token" in g:
+                REQUESTS_IN_FLIGHT.dec(g.route)
+                reset_route(g.pop("route_token"))
 
-            return response
+        # Routes served whatever the parks
+        api.add_resource(Ready,
+                         "/ready",
+                         endpoint="ready",
+                         resource_class_kwargs={"readiness": readiness})
 
-        # Instantiate main API class within Api. This is possible as information to create object of a class
-        # is already known at the point when one of its methods is called in app.py
-        api = DinoparkStatusApi(app, prefix=base_path)
+        api.add_resource(Metrics,
+                         "/metrics",
+                         endpoint="metrics")
+
+        return app
+
+    @staticmethod
+    def _add_park(readiness, services, create_indexes, name=None):
+        """
+        Starts the background work of a park: creating the indexes of its status collection, and draining its
+        write-behind queue on exit.
+        :param readiness: The Readiness of the app.
+        :param services: ParkServices of the park.
+        :param create_indexes: Whether to start creating the indexes now.
+        :param name: Name of the park, None for the single park of the app.
+        """
+        # Zone histories use the (zone, computed_at, _id) index, old statuses expire with the TTL index
+        if create_indexes:
+            readiness.start("indexes" if name is None else f"indexes:{name}", functools.partial(ensure_indexes, services.collection))
+        # Requests queue their status documents, a background thread upserts them in bulk. Drained on exit.
+        atexit.register(services.write_behind.close, WRITE_BEHIND_CLOSE_SECONDS)
+
+    @staticmethod
+    def _add_park_routes(api, services, path_prefix, endpoint_prefix):
+        """
+        Adds the routes of a park.
+        :param api: The DinoparkStatusApi.
+        :param services: ParkServices of the park.
+        :param path_prefix: Path of the park's routes under the base path, e.g. /isla-nublar, empty for the single park.
+        :param endpoint_prefix: Prefix of the park's endpoint names, e.g. isla-nublar., empty for the single park.
+        :return: Dictionary of the endpoint name of each route to the park name.
+        """
+        # Statuses are computed once per feed version and day, only newly computed ones are stored
+        status_kwargs = {"write_behind": services.write_behind, "feed_cache": services.feed_cache, "status_cache": services.status_cache,
+                         "event_store": services.event_store}
 
         # Routes
         api.add_resource(Health,
-                         "/",
-                         endpoint="health")
+                         path_prefix + "/",
+                         endpoint=endpoint_prefix + "health",
+                         resource_class_kwargs=status_kwargs)
 
         api.add_resource(StatusMaintenance,
-                         "/maintenance_status/",
-                         "/maintenance_status",
-                         endpoint="maintenance_status",
-                         resource_class_kwargs={"collection": collection},  # kwargs to send to constructor of resource class
+                         path_prefix + "/maintenance_status/",
+                         path_prefix + "/maintenance_status",
+                         endpoint=endpoint_prefix + "maintenance_status",
+                         # kwargs to send to constructor of resource class
+                         resource_class_kwargs=status_kwargs,
                          strict_slashes=False)
 
         api.add_resource(StatusSafety,
-                         "/safety_status/",
-                         "/safety_status",
-                         endpoint="safety_status",
-                         resource_class_kwargs={"collection": collection},  # kwargs to send to constructor of resource class
+                         path_prefix + "/safety_status/",
+                         path_prefix + "/safety_status",
+                         endpoint=endpoint_prefix + "safety_status",
+                         # kwargs to send to constructor of resource class
+                         resource_class_kwargs=status_kwargs,
                          strict_slashes=False)
 
-        return app
+        api.add_resource(StatusBatch,
+                         path_prefix + "/status:batch",
+                         endpoint=endpoint_prefix + "status_batch",
+                         resource_class_kwargs=status_kwargs)
+
+        api.add_resource(ParkStatus,
+                         path_prefix + "/park_status/",
+                         path_prefix + "/park_status",
+                         endpoint=endpoint_prefix + "park_status",
+                         resource_class_kwargs={"feed_cache": services.feed_cache, "park_status_cache": services.park_status_cache},
+                         strict_slashes=False)
+
+        # Status changes are pushed to the zone stream's subscribers as soon as a new feed snapshot is swapped in
+        api.add_resource(ZoneStream,
+                         path_prefix + "/zones/stream/",
+                         path_prefix + "/zones/stream",
+                         endpoint=endpoint_prefix + "zone_stream",
+                         resource_class_kwargs={"feed_cache": services.feed_cache, "status_stream": services.status_stream},
+                         strict_slashes=False)
+
+        api.add_resource(ZoneHistory,
+                         path_prefix + "/zones/<string:zone>/history/",
+                         path_prefix + "/zones/<string:zone>/history",
+                         endpoint=endpoint_prefix + "zone_history",
+                         resource_class_kwargs={"collection": services.collection},
+                         strict_slashes=False)
+
+        endpoints = ("health", "maintenance_status", "safety_status", "status_batch", "park_status", "zone_stream", "zone_history")
+        return {endpoint_prefix + endpoint: services.park.name for endpoint in endpoints}
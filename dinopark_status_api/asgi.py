@@ -0,0 +1,753 @@
+"""
+Asynchronous (ASGI) serving mode for the zone status endpoints.
+
+Serves the same routes and response bodies as the Flask app (see templates/swagger.yaml), but NUDLS is called with
+a non-blocking HTTP client and status documents are written with an asynchronous MongoDB driver (Motor), so a slow
+upstream or database does not hold a worker thread per request.
+
+"""
+
+# System imports
+import asyncio
+import functools
+import inspect
+import json
+import logging
+import time
+from urllib.parse import parse_qs
+
+# Third-party imports
+import httpx
+from werkzeug.exceptions import BadRequest, MethodNotAllowed, NotFound
+
+# Local imports
+from dinopark_status_api.apis import DinoparkStatusApi
+from dinopark_status_api.constants import LOGGER, API_VERSION, DATABASE_NAME, COLLECTION_NAME, FEED_CACHE_TTL_SECONDS, \
+    FEED_CACHE_STALE_SECONDS, FEED_POLL_INTERVAL_SECONDS, NUDLS_URL, NUDLS_ASYNC_MAX_CONNECTIONS, READINESS_RETRY_SECONDS, \
+    STATUS_STREAM_KEEPALIVE_SECONDS, STATUS_STREAM_RETRY_MILLISECONDS
+from dinopark_status_api.event_store import EventStore, parse_as_of, status_as_of
+from dinopark_status_api.history import status_document, upsert_requests, history_query, history_page, ensure_indexes, HISTORY_SORT
+from dinopark_status_api.json_encoder import dumps, add_field
+from dinopark_status_api.metrics import REGISTRY, CONTENT_TYPE, BACKGROUND_ROUTE, REQUEST_SECONDS, REQUESTS_IN_FLIGHT, \
+    dependency_error, observe_phase, phase, set_route, reset_route
+from dinopark_status_api.nudls_client import NudlsClientBase, NudlsUnavailable, RETRYABLE_STATUS_CODES
+from dinopark_status_api.park_state import ParkState
+from dinopark_status_api.park_status import ParkStatusCache, etag_matches
+from dinopark_status_api.readiness import Readiness
+from dinopark_status_api.status import parse_zone, parse_batch, batch_status
+from dinopark_status_api.status_cache import StatusCache
+from dinopark_status_api.status_stream import CONTENT_TYPE as STREAM_CONTENT_TYPE, StatusStream, parse_stream_filter
+from dinopark_status_api.structured_logging import log_event
+
+
+def _from_json(body, function, *args, **kwargs):
+    """
+    Parses a JSON response body and calls a function with it, so that both run in the executor: parsing a large
+    NUDLS feed on the event loop would hold up every other request.
+    :param body: The response body, as bytes.
+    :param function: Function taking the parsed body as its first argument.
+    :return: What the function returns.
+    """
+    return function(json.loads(body), *args, **kwargs)
+
+
+class AsyncNudlsClient(NudlsClientBase):
+    """
+    Non-blocking client of the NUDLS feed endpoint, with the same timeouts, retries and circuit breaker as NudlsClient.
+    """
+
+    def __init__(self, url=NUDLS_URL, max_connections=NUDLS_ASYNC_MAX_CONNECTIONS, transport=None, **kwargs):
+        """
+        Constructor.
+        :param url: NUDLS feed endpoint.
+        :param max_connections: Maximum number of connections kept open to NUDLS.
+        :param transport: httpx transport, injectable for tests. Defaults to a pooled HTTP transport.
+        :param kwargs: Timeouts, retry and circuit breaker settings, see NudlsClientBase.
+        """
+        super().__init__(url, **kwargs)
+        self._client = httpx.AsyncClient(timeout=httpx.Timeout(self._read_timeout, connect=self._connect_timeout),
+                                         limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+                                         transport=transport)
+
+    async def fetch_feed(self, etag=None, last_modified=None):
+        """
+        Requests the feed, conditionally when the validators of the cached feed are given.
+        :param etag: ETag of the cached feed.
+        :param last_modified: Last-Modified of the cached feed.
+        :return: The NUDLS response, with status code 304 if the cached feed is still current.
+        """
+        headers = self._headers(etag, last_modified)
+        self._start_call()
+
+        last_error = None
+        for attempt in range(self._max_retries + 1):
+            if attempt:
+                await asyncio.sleep(self._backoff_delay(attempt))
+
+            start = self._clock()
+            try:
+                resp = await self._client.get(self._url, headers=headers)
+            except httpx.TransportError as err:
+                self._record_attempt(start, err.__class__.__name__)
+                self._logger.warning(f"NUDLS call attempt {attempt + 1} failed: {err!r}")
+                last_error = err
+                continue
+
+            if resp.status_code in RETRYABLE_STATUS_CODES:
+                self._record_attempt(start, f"HTTP {resp.status_code}")
+                last_error = f"HTTP {resp.status_code}"
+                continue
+
+            self._record_attempt(start)
+            self._breaker.record_success()
+            if resp.status_code == 304:
+                self._count("not_modified")
+                return resp
+
+            try:
+                resp.raise_for_status()
+            except httpx.HTTPStatusError:
+                self._count("failures")
+                raise
+            self._count("successes")
+            return resp
+
+        raise self._exhausted(last_error)
+
+    async def aclose(self):
+        """
+        Closes the pooled connections.
+        """
+        await self._client.aclose()
+
+
+class AsyncFeedCache:
+    """
+    Asynchronous counterpart of FeedCache: TTL, stale-while-revalidate, single-flight refreshes, conditional fetches,
+    last good snapshot fallback and optional background polling, all on the event loop.
+
+    The park state is built in the default executor so that a large feed does not block the event loop.
+    Listeners are called on the event loop with every snapshot swapped in, see FeedCache.add_listener, and events
+    listeners in the executor with the events of every feed fetched, see FeedCache.add_events_listener.
+    """
+
+    def __init__(self, client=None, ttl=FEED_CACHE_TTL_SECONDS, stale_ttl=FEED_CACHE_STALE_SECONDS, clock=time.monotonic,
+                 snapshot_factory=ParkState.from_events):
+        """
+        Constructor.
+        :param client: Asynchronous NUDLS client. Defaults to a new AsyncNudlsClient with the configured settings.
+        :param ttl: Seconds a fetched feed is considered fresh.
+        :param stale_ttl: Seconds after the TTL a feed may still be served while it is revalidated.
+        :param clock: Monotonic clock returning seconds, injectable for tests.
+        :param snapshot_factory: Callable building the cached snapshot from the feed content and the previous snapshot.
+        """
+        self.client = client if client is not None else AsyncNudlsClient()
+        self._ttl = ttl
+        self._stale_ttl = stale_ttl
+        self._clock = clock
+        self._snapshot_factory = snapshot_factory
+        self._logger = logging.getLogger(LOGGER)
+        self._snapshot = None
+        self._fetched_at = None
+        self._etag = None
+        self._last_modified = None
+        self._refresh_task = None
+        self._poller = None
+        self._listeners = []
+        # Tuples of an events listener and the function telling whether it wants the events of the next feed
+        self._events_listeners = []
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "not_modified": 0,
+            "errors": 0,
+            "fallbacks": 0
+        }
+
+    async def get_with_age(self):
+        """
+        Returns the snapshot of the NUDLS feed and how long ago it was fetched or revalidated.
+        :return: Tuple of the feed snapshot and its age in seconds.
+        """
+        age = self._age()
+        if age is not None and (self._poller is not None or age < self._ttl):
+            self._stats["hits"] += 1
+            return self._snapshot, age
+
+        if age is not None and age < self._ttl + self._stale_ttl:
+            self._stats["stale_hits"] += 1
+            self._start_refresh()
+            return self._snapshot, age
+
+        # Concurrent callers all await the same refresh
+        self._stats["misses"] += 1
+        try:
+            await asyncio.shield(self._start_refresh())
+        except NudlsUnavailable:
+            if self._snapshot is None:
+                raise
+            self._stats["fallbacks"] += 1
+        return self._snapshot, self._age()
+
+    def add_listener(self, listener):
+        """
+        Calls a function with every new snapshot once it is swapped in.
+        :param listener: Callable taking the new snapshot. Its errors are logged and do not fail the refresh.
+        """
+        self._listeners.append(listener)
+
+    def add_events_listener(self, listener, wanted=None):
+        """
+        Calls a function in the executor with the events of every feed fetched once its snapshot is swapped in.
+        :param listener: Callable taking the list of events of the feed. Its errors are logged and do not fail the refresh.
+        :param wanted: Callable returning whether the listener wants the events of the next feed, defaults to always.
+        """
+        self._events_listeners.append((listener, wanted if wanted is not None else lambda: True))
+
+    async def reload(self):
+        """
+        Fetches the whole feed now, without the validators of the cached one, so that the events listeners get every
+        event even when the feed did not change. A refresh already running is waited for first.
+        Errors are logged and counted, the current snapshot is kept.
+        """
+        while self._refresh_task is not None and not self._refresh_task.done():
+            await asyncio.wait({self._refresh_task})
+        try:
+            await asyncio.shield(self._start_refresh(revalidate=False))
+        except Exception:  # pylint: disable=broad-except
+            pass  # Already logged and counted by the refresh
+
+    def start_polling(self, interval):
+        """
+        Starts a task refreshing the feed every interval seconds. Must be called from the event loop.
+        :param interval: Seconds between the end of a refresh and the start of the next one.
+        """
+        if self._poller is None:
+            self._poller = asyncio.ensure_future(self._poll(interval))
+
+    async def aclose(self):
+        """
+        Stops polling and closes the NUDLS client.
+        """
+        if self._poller is not None:
+            self._poller.cancel()
+            self._poller = None
+        await self.client.aclose()
+
+    def loaded(self):
+        """
+        :return: Whether a snapshot of the feed is cached.
+        """
+        return self._snapshot is not None
+
+    def stats(self):
+        """
+        :return: Dictionary of cache counters and the age of the cached feed.
+        """
+        stats = dict(self._stats)
+        age = self._age()
+        stats["age_seconds"] = round(age, 3) if age is not None else None
+        stats["polling"] = self._poller is not None
+        return stats
+
+    def _age(self):
+        """
+        :return: Seconds since the cached feed was last fetched or revalidated, None if nothing is cached.
+        """
+        if self._fetched_at is None:
+            return None
+        return self._clock() - self._fetched_at
+
+    def _start_refresh(self, revalidate=True):
+        """
+        :param revalidate: Whether a refresh started is conditional on the validators of the cached feed.
+        :return: The running refresh task, started if there is none.
+        """
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self._refresh(revalidate))
+            # Background refreshes may fail with nobody awaiting them, their errors are already logged and counted
+            self._refresh_task.add_done_callback(lambda task: task.cancelled() or task.exception())
+        return self._refresh_task
+
+    async def _poll(self, interval):
+        """
+        Body of the polling task.
+        :param interval: Seconds between refreshes.
+        """
+        # The task copied the context of the request that started it, its phases are not part of that request
+        set_route(BACKGROUND_ROUTE)
+        while True:
+            try:
+                await self._start_refresh()
+            except Exception:  # pylint: disable=broad-except
+                pass  # Already logged and counted, keep serving the current snapshot
+            await asyncio.sleep(interval)
+
+    async def _refresh(self, revalidate=True):
+        """
+        Fetches the feed from NUDLS and swaps in the new snapshot.
+        :param revalidate: Whether the fetch is conditional on the validators of the cached feed.
+        """
+        self._stats["refreshes"] += 1
+        swapped = False
+        loop = asyncio.get_event_loop()
+        listeners = [listener for listener, wanted in self._events_listeners if wanted()]
+        events = None
+        try:
+            with phase("feed_fetch"):
+                resp = await self.client.fetch_feed(*((self._etag, self._last_modified) if revalidate else (None, None)))
+            if resp.status_code == 304:
+                self._stats["not_modified"] += 1
+            else:
+                with phase("json_parse"):
+                    if listeners:
+                        # The events listeners get the parsed events too
+                        events = await loop.run_in_executor(None, json.loads, resp.content)
+                        build = functools.partial(self._snapshot_factory, events, previous=self._snapshot)
+                    else:
+                        build = functools.partial(_from_json, resp.content, self._snapshot_factory, previous=self._snapshot)
+                    self._snapshot = await loop.run_in_executor(None, build)
+                self._etag = resp.headers.get("ETag")
+                self._last_modified = resp.headers.get("Last-Modified")
+                swapped = True
+            self._fetched_at = self._clock()
+        except Exception as err:
+            self._stats["errors"] += 1
+            self._logger.error(err)
+            raise
+
+        if swapped:
+            for listener in self._listeners:
+                try:
+                    listener(self._snapshot)
+                except Exception as err:  # pylint: disable=broad-except
+                    self._logger.error(f"Feed listener failed: {err}")
+            for listener in listeners:
+                try:
+                    await loop.run_in_executor(None, listener, events)
+                except Exception as err:  # pylint: disable=broad-except
+                    self._logger.error(f"Feed events listener failed: {err}")
+
+
+class DinoparkStatusAsgi:
+    """
+    Dinopark Status API as an ASGI application.
+    """
+
+    def __init__(self, collection, feed_cache, poll_interval=None):
+        """
+        Constructor.
+        :param collection: Asynchronous MongoDB collection status documents are upserted into.
+        :param feed_cache: AsyncFeedCache shared by all requests.
+        :param poll_interval: Seconds between background refreshes of the NUDLS feed, None to refresh on requests.
+        """
+        self._collection = collection
+        self._feed_cache = feed_cache
+        self._park_status_cache = ParkStatusCache()
+        self._status_cache = StatusCache()
+        self._event_store = EventStore()
+        # Held by the request syncing the event store, so that concurrent as_of requests share one fetch
+        self._event_store_lock = asyncio.Lock()
+        self._status_stream = StatusStream()
+        feed_cache.add_listener(self._status_stream.on_snapshot)
+        feed_cache.add_events_listener(self._event_store.on_feed, self._event_store.wants_events)
+        REGISTRY.gauge("dinopark_stream_subscribers", "Subscribers to the zone status stream.") \
+            .set_function(lambda: self._status_stream.stats()["subscribers"])
+        self._poll_interval = poll_interval
+        self._logger = logging.getLogger(LOGGER)
+        # The indexes are created in the background on start up, see resources.Ready
+        self._indexes_created = False
+        self._startup_task = None
+        self._readiness = Readiness()
+        self._readiness.add_check("indexes", lambda: self._indexes_created)
+        if poll_interval:
+            self._readiness.add_check("feed", feed_cache.loaded)
+        self._base_path = "/dinopark_status/" + API_VERSION
+        maintenance = functools.partial(self._status, "maintenance")
+        safety = functools.partial(self._status, "safety")
+        # Path: (handler, allowed methods, route name as the Flask app's endpoint, see metrics)
+        self._routes = {
+            self._base_path: (self._health, ("GET", "HEAD"), "health"),
+            self._base_path + "/": (self._health, ("GET", "HEAD"), "health"),
+            self._base_path + "/ready": (self._ready, ("GET", "HEAD"), "ready"),
+            self._base_path + "/metrics": (self._metrics, ("GET", "HEAD"), "metrics"),
+            self._base_path + "/maintenance_status": (maintenance, ("GET", "HEAD"), "maintenance_status"),
+            self._base_path + "/maintenance_status/": (maintenance, ("GET", "HEAD"), "maintenance_status"),
+            self._base_path + "/safety_status": (safety, ("GET", "HEAD"), "safety_status"),
+            self._base_path + "/safety_status/": (safety, ("GET", "HEAD"), "safety_status"),
+            self._base_path + "/status:batch": (self._batch, ("GET", "HEAD", "POST"), "status_batch"),
+            self._base_path + "/park_status": (self._park_status, ("GET", "HEAD"), "park_status"),
+            self._base_path + "/park_status/": (self._park_status, ("GET", "HEAD"), "park_status"),
+            self._base_path + "/zones/stream": (self._zone_stream, ("GET",), "zone_stream"),
+            self._base_path + "/zones/stream/": (self._zone_stream, ("GET",), "zone_stream"),
+        }
+
+    @staticmethod
+    def create_app(data_access_layer, feed_cache=None, poll_interval=FEED_POLL_INTERVAL_SECONDS):
+        """
+        Creates a new ASGI application.
+        :param data_access_layer: Asynchronous data access layer for connecting to MongoDB, e.g. a Motor client.
+        :param feed_cache: The AsyncFeedCache shared by all requests. Defaults to a new one with the configured TTL.
+        :param poll_interval: Seconds between background refreshes of the NUDLS feed. If None, requests refresh the feed
+        themselves when it expires.
+        :return: An ASGI application.
+        """
+        collection = data_access_layer[DATABASE_NAME][COLLECTION_NAME]
+        if feed_cache is None:
+            feed_cache = AsyncFeedCache()
+        return DinoparkStatusAsgi(collection, feed_cache, poll_interval)
+
+    async def __call__(self, scope, receive, send):
+        """
+        ASGI entry point.
+        """
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        if self._poll_interval:
+            self._feed_cache.start_polling(self._poll_interval)
+
+        started = time.perf_counter()
+        route = self._routes.get(scope["path"]) or self._history_route(scope["path"])
+        route_name = route[2] if route is not None else "unmatched"
+        route_token = set_route(route_name)
+        REQUESTS_IN_FLIGHT.inc(route_name)
+        try:
+            code = await self._respond(scope, receive, send, route)
+        finally:
+            REQUESTS_IN_FLIGHT.dec(route_name)
+            reset_route(route_token)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route_name, scope["method"], str(code))
+        log_event(self._logger, logging.DEBUG, "request", route=route_name, method=scope["method"], code=code)
+
+    async def _respond(self, scope, receive, send, route):
+        """
+        Answers an HTTP request.
+        :param route: Tuple of the handler, allowed methods and name of the route of the request, None if not found.
+        :return: The HTTP status code of the response.
+        """
+        try:
+            if route is None:
+                raise NotFound()
+            handler, methods, _ = route
+            if scope["method"] not in methods:
+                raise MethodNotAllowed(valid_methods=list(methods))
+            request = {
+                "query": parse_qs(scope["query_string"].decode("latin-1")),
+                "headers": {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope["headers"]},
+                "body": await self._read_body(receive) if scope["method"] == "POST" else None
+            }
+            code, body, headers = await handler(request)
+        except Exception as err:  # pylint: disable=broad-except
+            # Same response envelope as the Flask app's handle_error
+            body, code = DinoparkStatusApi.error_envelope(err)
+            headers = []
+
+        if inspect.isasyncgen(body):
+            await self._stream(receive, send, code, headers, body)
+            return code
+
+        # Handlers return either a JSON-serializable body or an already encoded one, as JSON unless they tell otherwise
+        with phase("serialize"):
+            payload = body if isinstance(body, bytes) else dumps(body) + b"\n"
+        if not any(name == b"content-type" for name, _ in headers):
+            headers = [(b"content-type", b"application/json")] + headers
+        headers = [(b"content-length", str(len(payload)).encode("latin-1"))] + headers
+        await send({
+            "type": "http.response.start",
+            "status": code,
+            "headers": headers
+        })
+        await send({"type": "http.response.body", "body": payload if scope["method"] != "HEAD" else b""})
+        return code
+
+    @staticmethod
+    async def _stream(receive, send, code, headers, body):
+        """
+        Sends a streamed response, chunk by chunk as the body yields them, until it ends or the client disconnects.
+        :param body: Asynchronous generator of the encoded chunks, closed when the client disconnects.
+        """
+        await send({
+            "type": "http.response.start",
+            "status": code,
+            "headers": headers
+        })
+
+        async def wait_disconnect():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+
+        disconnected = asyncio.ensure_future(wait_disconnect())
+        try:
+            while True:
+                next_chunk = asyncio.ensure_future(body.__anext__())
+                await asyncio.wait({next_chunk, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if not next_chunk.done():
+                    # The client is gone, stop waiting for the next chunk
+                    next_chunk.cancel()
+                    await asyncio.wait({next_chunk})
+                    return
+                try:
+                    chunk = next_chunk.result()
+                except StopAsyncIteration:
+                    await send({"type": "http.response.body", "body": b""})
+                    return
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        finally:
+            disconnected.cancel()
+            await body.aclose()
+
+    async def _lifespan(self, receive, send):
+        """
+        Starts polling on start up and releases the NUDLS connections on shut down.
+        """
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self._startup_task = asyncio.ensure_future(self._create_indexes())
+                if self._poll_interval:
+                    self._feed_cache.start_polling(self._poll_interval)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self._feed_cache.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _create_indexes(self):
+        """
+        Creates the indexes of the status collection, again every READINESS_RETRY_SECONDS until it succeeds.
+        """
+        while not await self._ensure_indexes():
+            await asyncio.sleep(READINESS_RETRY_SECONDS)
+        self._indexes_created = True
+
+    async def _ensure_indexes(self):
+        """
+        Creates the indexes of the status collection if missing, see history.ensure_indexes. It runs in the executor
+        on the synchronous collection Motor wraps, so that both serving modes handle index changes the same way.
+        :return: Whether the indexes are up to date.
+        """
+        return await asyncio.get_event_loop().run_in_executor(None, ensure_indexes, self._collection.delegate)
+
+    def _history_route(self, path):
+        """
+        :param path: Request path.
+        :return: Route of a /zones/<zone>/history path, None if the path is not one.
+        """
+        prefix, suffix = self._base_path + "/zones/", "/history"
+        path = path.rstrip("/")
+        if path.startswith(prefix) and path.endswith(suffix):
+            zone = path[len(prefix):-len(suffix)]
+            if zone and "/" not in zone:
+                return functools.partial(self._history, zone), ("GET", "HEAD"), "zone_history"
+        return None
+
+    @staticmethod
+    async def _read_body(receive):
+        """
+        :return: The request body.
+        """
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body"):
+                return b"".join(chunks)
+
+    async def _health(self, request):  # pylint: disable=unused-argument
+        """
+        :return: The status of API, the NUDLS feed cache counters, the NUDLS client metrics, the status cache counters and the
+        event store counters.
+        """
+        return 200, {
+            "status": {
+                "code": 200,
+                "info": "Welcome to Dino Park Status API!",
+                "status": "SUCCESS",
+            },
+            "feed_cache": self._feed_cache.stats(),
+            "nudls": self._feed_cache.client.stats(),
+            "status_cache": self._status_cache.stats(),
+            "event_store": self._event_store.stats()
+        }, []
+
+    async def _ready(self, request):  # pylint: disable=unused-argument
+        """
+        :return: Whether the process is ready and the state of each start up check, see resources.Ready.
+        """
+        ready, checks = self._readiness.status()
+        return 200 if ready else 503, {"ready": ready, "checks": checks}, []
+
+    async def _metrics(self, request):  # pylint: disable=unused-argument
+        """
+        :return: The metrics of the process in the Prometheus text format, see resources.Metrics.
+        """
+        return 200, REGISTRY.render(), [(b"content-type", CONTENT_TYPE.encode("latin-1"))]
+
+    async def _status(self, status_name, request):
+        """
+        Returns the status of the zone given in the query, storing it if newly computed.
+        :param status_name: Name of the status, see status.STATUS_FUNCTIONS.
+        :param request: Dictionary of the parsed query string, the headers and the body of the request.
+        :return: Tuple of the HTTP status code, the response body and the extra response headers.
+        """
+        zone = parse_zone(request["query"].get("zone", [None])[0])
+
+        as_of = request["query"].get("as_of", [None])[0]
+        if as_of is not None:
+            return await self._status_as_of(status_name, zone, as_of)
+
+        park_state, snapshot_age = await self._feed_cache.get_with_age()
+        body, result, key, computed = self._status_cache.get_encoded(status_name, park_state, zone)
+
+        if computed:
+            await self._store([status_document(result, key)])
+        log_event(self._logger, logging.DEBUG, "status_request", status_type=status_name, zone=zone, computed=computed)
+        return 200, add_field(body, "snapshot_age_seconds", round(snapshot_age, 3)), []
+
+    async def _status_as_of(self, status_name, zone, as_of):
+        """
+        Returns the status of a zone as of a past instant, see resources.status_as_of_response.
+        :param status_name: Name of the status, see status.STATUS_FUNCTIONS.
+        :param zone: Validated zone identifier.
+        :param as_of: The as_of argument of the request, see event_store.parse_as_of.
+        :return: Tuple of the HTTP status code, the response body and the extra response headers.
+        """
+        millis = parse_as_of(as_of)
+        park_state, _ = await self._feed_cache.get_with_age()
+        # The events come from the feed cache, see EventStore.sync. Checkpoints are built and events replayed in the executor.
+        if self._event_store.behind(park_state.high_water_mark):
+            async with self._event_store_lock:
+                # Another request may have synced the store meanwhile
+                if self._event_store.behind(park_state.high_water_mark):
+                    self._event_store.start_sync()
+                    await self._feed_cache.reload()
+                    self._event_store.check_synced(park_state.high_water_mark)
+        state = await asyncio.get_event_loop().run_in_executor(None, self._event_store.state_at, millis)
+        return 200, status_as_of(status_name, state, zone, millis), []
+
+    async def _batch(self, request):
+        """
+        Returns the statuses of many zones, storing the newly computed ones, see resources.StatusBatch.
+        :param request: Dictionary of the parsed query string, the headers and the body of the request. Zones and statuses
+        are comma separated in the query string on GET, lists in the JSON body on POST.
+        :return: Tuple of the HTTP status code, the response body and the extra response headers.
+        """
+        if request["body"] is None:
+            query = request["query"]
+            zones, statuses = parse_batch(query.get("zones", [""])[0], query.get("statuses", [None])[0])
+        else:
+            try:
+                body = json.loads(request["body"])
+            except ValueError:
+                body = None
+            if not isinstance(body, dict):
+                raise BadRequest("Provide a JSON object with the zones.")
+            zones, statuses = parse_batch(body.get("zones"), body.get("statuses"))
+
+        park_state, snapshot_age = await self._feed_cache.get_with_age()
+        results, computed = batch_status(park_state, zones, statuses, self._status_cache)
+        documents = [status_document(result, key) for key, result in computed]
+        for result in results:
+            for status in statuses:
+                if "status" not in result[status]:
+                    result[status]["snapshot_age_seconds"] = round(snapshot_age, 3)
+
+        if documents:
+            await self._store(documents)
+        log_event(self._logger, logging.DEBUG, "batch_status_request", zones=len(zones), computed=len(documents))
+
+        return 200, {"results": results, "snapshot_age_seconds": round(snapshot_age, 3)}, []
+
+    async def _store(self, documents):
+        """
+        Upserts newly computed status documents, see history.upsert_requests.
+        :param documents: Documents built by history.status_document.
+        """
+        start = time.perf_counter()
+        try:
+            result = await self._collection.bulk_write(upsert_requests(documents), ordered=False)
+        except Exception as err:
+            dependency_error("mongo", err.__class__.__name__)
+            raise
+        finally:
+            observe_phase("mongo_write", time.perf_counter() - start)
+        log_event(self._logger, logging.DEBUG, "documents_upserted", upserted=result.upserted_count)
+
+    async def _history(self, zone, request):
+        """
+        Page of the statuses computed for a zone, see resources.ZoneHistory.
+        :param zone: Zone identifier.
+        :param request: Dictionary of the parsed query string, the headers and the body of the request.
+        :return: Tuple of the HTTP status code, the response body and the extra response headers.
+        """
+        args = {name: values[0] for name, values in request["query"].items()}
+        query, projection, limit = history_query(zone, args.get("since"), args.get("limit"), args.get("fields"), args.get("cursor"))
+        documents = await self._collection.find(query, projection).sort(HISTORY_SORT).limit(limit + 1).to_list(None)
+        page = history_page(documents, limit, args.get("fields"))
+        page["zone"] = zone
+        return 200, page, []
+
+    async def _zone_stream(self, request):
+        """
+        Stream of the changes of the zone statuses as Server-Sent Events, see resources.ZoneStream.
+        :param request: Dictionary of the parsed query string, the headers and the body of the request.
+        :return: Tuple of the HTTP status code, the asynchronous generator of the stream and the extra response headers.
+        """
+        query = request["query"]
+        zones, statuses = parse_stream_filter(query.get("zones", [None])[0], query.get("statuses", [None])[0])
+
+        # Publish the current snapshot, so that the first events of the stream are current
+        park_state, _ = await self._feed_cache.get_with_age()
+        self._status_stream.publish(park_state)
+        loop = asyncio.get_event_loop()
+        wake = asyncio.Event()
+        subscription = self._status_stream.subscribe(zones, statuses, lambda: loop.call_soon_threadsafe(wake.set))
+        headers = [(b"content-type", STREAM_CONTENT_TYPE.encode("latin-1")), (b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")]
+        return 200, self._stream_events(subscription, wake), headers
+
+    async def _stream_events(self, subscription, wake):
+        """
+        Events of a subscription as they are published, see status_stream.event_stream.
+        :param subscription: Subscription of the status stream, unsubscribed when the generator is closed.
+        :param wake: asyncio.Event set when events are queued for the subscription.
+        :return: Asynchronous generator of encoded chunks.
+        """
+        try:
+            yield f"retry: {STATUS_STREAM_RETRY_MILLISECONDS}\n\n".encode("ascii")
+            while True:
+                wake.clear()
+                events = self._status_stream.drain(subscription)
+                if events:
+                    yield b"".join(events)
+                    continue
+                try:
+                    await asyncio.wait_for(wake.wait(), STATUS_STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Idle: publish a changed feed or date even when no request refreshes the feed
+                    try:
+                        park_state, _ = await self._feed_cache.get_with_age()
+                        self._status_stream.publish(park_state)
+                    except Exception as err:  # pylint: disable=broad-except
+                        self._logger.error(f"Could not refresh the status stream: {err}")
+                    yield b": keepalive\n\n"
+        finally:
+            self._status_stream.unsubscribe(subscription)
+
+    async def _park_status(self, request):
+        """
+        Statuses of every zone of the park, see resources.ParkStatus.
+        :param request: Dictionary of the parsed query string, the headers and the body of the request.
+        :return: Tuple of the HTTP status code, the response body and the extra response headers.
+        """
+        park_state, snapshot_age = await self._feed_cache.get_with_age()
+        body, etag = self._park_status_cache.get(park_state)
+        headers = [(b"etag", f'"{etag}"'.encode("latin-1")), (b"age", str(int(snapshot_age)).encode("latin-1"))]
+        if etag_matches(request["headers"].get("if-none-match"), etag):
+            return 304, b"", headers
+        return 200, body, headers
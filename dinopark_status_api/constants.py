@@ -2,6 +2,9 @@
 Global constants.
 """
 
+# System imports
+import string
+
 # API version
 API_VERSION = "v1"
 
@@ -11,6 +14,122 @@ LOGGER = "dinopark"
 # MongoDB configs
 DATABASE_NAME = "dinopark_status_db"
 COLLECTION_NAME = "dinopark_status_collection"
+# Park state built from the NUDLS feed, persisted so that a restart only applies the events added since
+PARK_STATE_COLLECTION_NAME = "dinopark_park_state_collection"
+# The park state is saved one document per zone and dinosaur, the entries changed since the previous save are
+# upserted in bulk writes of at most PARK_STATE_SAVE_BATCH documents
+PARK_STATE_SAVE_BATCH = 1000
 
 # NUDLS exposed event endpoint
 NUDLS_URL = "https://dinoparks.net/nudls/feed"
+
+# NUDLS feed cache configs (in seconds)
+# A cached feed younger than the TTL is served as is. Past the TTL it is still served for the stale window
+# while a single background refresh revalidates it. Past both, the next request refreshes synchronously.
+FEED_CACHE_TTL_SECONDS = 30
+FEED_CACHE_STALE_SECONDS = 300
+
+# Parse the NUDLS feed incrementally while it downloads instead of loading it as a whole (opt-in).
+# A newline delimited JSON feed is used when NUDLS offers one.
+NUDLS_STREAMING = False
+
+# NUDLS client configs
+# Connect and read timeouts (in seconds) of each call to NUDLS
+NUDLS_CONNECT_TIMEOUT_SECONDS = 3.05
+NUDLS_READ_TIMEOUT_SECONDS = 10
+# Number of pooled keep-alive connections to NUDLS
+NUDLS_POOL_SIZE = 10
+# Retries of a failed call, with exponential backoff and full jitter capped at NUDLS_BACKOFF_MAX_SECONDS
+NUDLS_MAX_RETRIES = 2
+NUDLS_BACKOFF_SECONDS = 0.2
+NUDLS_BACKOFF_MAX_SECONDS = 2
+# Consecutive failed calls that open the circuit, and seconds before a trial call is let through again
+NUDLS_CIRCUIT_FAILURE_THRESHOLD = 5
+NUDLS_CIRCUIT_RESET_SECONDS = 30
+
+# Background feed poller configs (in seconds)
+# When polling, requests never call NUDLS themselves: they read the snapshot the poller last refreshed.
+FEED_POLL_INTERVAL_SECONDS = 10
+# How long a request waits for the poller's first snapshot after start up before answering 503
+FEED_POLL_STARTUP_WAIT_SECONDS = 5
+
+# Asynchronous (ASGI) serving mode: maximum number of connections kept open to NUDLS
+NUDLS_ASYNC_MAX_CONNECTIONS = 100
+
+# Zones of the park grid, columns A to Z and rows 1 to 16
+PARK_ZONES = tuple(f"{column}{row}" for column in string.ascii_uppercase for row in range(1, 17))
+# Format of a zone identifier: a column A to Z and a row 1 to 16
+ZONE_PATTERN = "[A-Z](?:[1-9]|1[0-6])"
+
+# Batch zone status endpoint: maximum number of zones per request
+MAX_BATCH_ZONES = len(PARK_ZONES)
+
+# Write-behind queue of the status documents inserted into MongoDB
+# Documents are flushed with one bulk insert once WRITE_BEHIND_MAX_BATCH are queued, or every WRITE_BEHIND_FLUSH_SECONDS.
+WRITE_BEHIND_MAX_BATCH = 500
+WRITE_BEHIND_FLUSH_SECONDS = 1
+# Maximum number of documents held in memory, and what to do with new ones while the queue is full:
+# "drop" them, "block" the request for up to WRITE_BEHIND_BLOCK_SECONDS (then answer 503), or "spill" them to disk.
+WRITE_BEHIND_MAX_QUEUED = 10000
+WRITE_BEHIND_OVERFLOW = "block"
+WRITE_BEHIND_BLOCK_SECONDS = 5
+# Path prefix of the spill files, suffixed with the process id
+WRITE_BEHIND_SPILL_PATH = "/tmp/dinopark_status_spill.jsonl"
+# Seconds the queue is drained for on shut down, the documents still queued are then spilled to disk
+WRITE_BEHIND_CLOSE_SECONDS = 10
+
+# Status history
+# Seconds status documents are kept in MongoDB (TTL index on computed_at), None to keep them forever
+STATUS_HISTORY_TTL_SECONDS = 90 * 24 * 3600
+# Default and maximum number of statuses returned per page of a zone history
+HISTORY_DEFAULT_LIMIT = 50
+HISTORY_MAX_LIMIT = 500
+
+# Maximum number of status results kept in memory, keyed by status, zone, NUDLS feed version and day
+STATUS_CACHE_SIZE = 4096
+
+# Readiness: seconds between attempts of a failed start up task, e.g. creating the MongoDB indexes while MongoDB is down
+READINESS_RETRY_SECONDS = 5
+
+# Metrics endpoint: upper bounds (seconds) of the buckets of the latency histograms
+METRICS_LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Level of the structured (JSON lines) logs of the API, overridden by the DINOPARK_LOG_LEVEL environment variable
+LOG_LEVEL = "INFO"
+
+# Zone status stream (Server-Sent Events)
+# Events queued per subscriber, a subscriber falling further behind gets the current statuses again instead
+STATUS_STREAM_MAX_QUEUED = 1000
+# Seconds between keep-alive comments of an idle stream, the feed and the date are checked for changes as often
+STATUS_STREAM_KEEPALIVE_SECONDS = 15
+# Milliseconds a disconnected client waits before reconnecting, sent as the retry field of the stream
+STATUS_STREAM_RETRY_MILLISECONDS = 3000
+
+# Time travel (as_of) queries, answered from the NUDLS events kept in memory
+# The park state is checkpointed every CHECKPOINT_INTERVAL_EVENTS events (by time), a state in the past replays at most
+# as many events on top of the nearest checkpoint. Fewer events between checkpoints replay faster and hold more memory.
+CHECKPOINT_INTERVAL_EVENTS = 1000
+# Park states rebuilt for past instants kept in memory, keyed by the number of events they were built from
+EVENT_STORE_CACHE_SIZE = 32
+
+# Multi-park tenancy (see parks.py)
+# Format of a park name, the first segment of the park's routes e.g. /dinopark_status/v1/<park>/maintenance_status
+PARK_NAME_PATTERN = "[a-z0-9][a-z0-9_-]{0,62}"
+# Estimated memory held by a park state, per zone table entry (the latest event of a zone) and per dinosaur record
+PARK_STATE_BYTES_PER_ZONE_EVENT = 480
+PARK_STATE_BYTES_PER_DINOSAUR = 224
+# Estimated memory held by the event store answering as_of queries, per event kept and per table entry of the
+# checkpoints and rebuilt park states (measured with tracemalloc, see benchmarks.bench_event_store)
+EVENT_STORE_BYTES_PER_EVENT = 440
+EVENT_STORE_BYTES_PER_STATE_ENTRY = 48
+# Estimated memory held by a cached status result and its encoding
+STATUS_CACHE_BYTES_PER_RESULT = 1600
+# Estimated bytes a park may hold (its snapshot, event store and status caches), a park over it is evicted as soon as
+# it is idle
+PARK_MEMORY_BUDGET_BYTES = 256 * 1024 * 1024
+# Estimated bytes every park of the process may hold, past it the least recently used idle parks are evicted
+PARKS_MEMORY_BUDGET_BYTES = 1024 * 1024 * 1024
+# Seconds without a request after which a park is idle
+PARK_IDLE_SECONDS = 300
+# Name of the park of NUDLS_URL, served at the base path when no parks are configured
+DEFAULT_PARK_NAME = "default"
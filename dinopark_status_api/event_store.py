@@ -0,0 +1,296 @@
+"""
+NUDLS events kept in time order with periodic park state checkpoints, to answer statuses as of a past instant.
+
+"""
+
+# System imports
+import bisect
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+# Third-party imports
+from werkzeug.exceptions import BadRequest
+
+# Local imports
+from dinopark_status_api.constants import LOGGER, CHECKPOINT_INTERVAL_EVENTS, EVENT_STORE_CACHE_SIZE, EVENT_STORE_BYTES_PER_EVENT, \
+    EVENT_STORE_BYTES_PER_STATE_ENTRY
+from dinopark_status_api.metrics import phase
+from dinopark_status_api.nudls_client import NudlsUnavailable
+from dinopark_status_api.park_state import ParkState
+from dinopark_status_api.status import STATUS_FUNCTIONS
+from dinopark_status_api.timestamps import epoch_millis, iso_of_millis, local_day
+
+_EPOCH = datetime(1970, 1, 1)
+_MILLISECOND = timedelta(milliseconds=1)
+
+
+def parse_as_of(value, now=time.time):
+    """
+    Validates the as_of argument of a status request.
+    :param value: ISO 8601 date or time. A time without a time zone is UTC, a date alone is the end of that day (UTC).
+    :param now: Function returning the current time in seconds since the epoch, injectable for tests.
+    :return: The instant as milliseconds since the epoch.
+    """
+    try:
+        moment = datetime.fromisoformat(value.rstrip("Z"))
+    except (AttributeError, ValueError):
+        raise BadRequest(f"as_of: {value} is not an ISO 8601 date or time.")
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+    now_millis = int(now() * 1000)
+    if "T" not in value and " " not in value:
+        # The statuses at the end of the day, or now for today
+        return min((moment + timedelta(days=1) - _EPOCH) // _MILLISECOND - 1, now_millis)
+    millis = (moment - _EPOCH) // _MILLISECOND
+    if millis > now_millis:
+        raise BadRequest(f"as_of: {value} is in the future.")
+    return millis
+
+
+def status_as_of(status_type, park_state, zone, millis):
+    """
+    Status of a zone as of an instant, computed for the local day of the instant like the current statuses are for
+    today (see timestamps.Clock), so that as of now gives the current status. Not cached nor stored, unlike the
+    current statuses.
+    :param status_type: Name of the status, see status.STATUS_FUNCTIONS.
+    :param park_state: ParkState as of the instant, see EventStore.state_at.
+    :param zone: Zone identifier.
+    :param millis: The instant, in milliseconds since the epoch.
+    :return: Dictionary of the status result and the instant as as_of.
+    """
+    with phase("algorithm"):
+        result = STATUS_FUNCTIONS[status_type](park_state, zone, local_day(millis / 1000))
+    result["as_of"] = iso_of_millis(millis)
+    return result
+
+
+class EventStore:
+    """
+    The events of the NUDLS feed sorted by time, and the park state after every checkpoint_interval of them.
+
+    The park state as of an instant is the state built from the events up to that instant. Rather than replaying the
+    feed from its start, the nearest checkpoint at or before the instant is copied and only the events between the
+    two are applied (see ParkState.apply_all), at most checkpoint_interval of them. The few states rebuilt last are
+    kept, so that the queries of an incident review, which ask about the same instants, replay nothing.
+
+    The feed only gets new events appended: events are ingested from the latest time stored onwards, and checkpoints
+    are only ever added. The events come from the feed cache, the store never fetches the feed itself. Until the first
+    time travel query it holds nothing: that query has the feed cache fetch the whole feed once (see sync), and from
+    then on the store ingests the events of every feed the cache fetches (see on_feed).
+    """
+
+    def __init__(self, checkpoint_interval=CHECKPOINT_INTERVAL_EVENTS, cache_size=EVENT_STORE_CACHE_SIZE):
+        """
+        Constructor.
+        :param checkpoint_interval: Events between two checkpoints.
+        :param cache_size: Maximum number of rebuilt park states kept, the least recently used are evicted first.
+        """
+        if checkpoint_interval < 1:
+            raise ValueError("The checkpoint interval must be at least one event.")
+        self._interval = checkpoint_interval
+        self._cache_size = cache_size
+        self._logger = logging.getLogger(LOGGER)
+        # Held by the caller ingesting events, so that checkpoints are built by one caller at a time
+        self._ingest_lock = threading.RLock()
+        # Held by the caller syncing the store, so that concurrent queries share one fetch of the feed
+        self._sync_lock = threading.Lock()
+
+        # All state below is guarded by the lock. The lists are only ever appended to.
+        self._lock = threading.Lock()
+        self._events = []
+        # Time of each event, in milliseconds since the epoch
+        self._times = []
+        # Park state after the first i * checkpoint_interval events, the first one is empty
+        self._checkpoints = [ParkState()]
+        # Number of events: tuple of the park state built from them and its table entries, 0 for a checkpoint
+        self._states = OrderedDict()
+        # Table entries of the checkpoints and rebuilt park states, the dictionaries of each are its own
+        self._state_entries = 0
+        # Whether a time travel query was made, the events of the feeds fetched are then ingested
+        self._in_use = False
+        self._stats = {
+            "syncs": 0,
+            "fallbacks": 0,
+            "hits": 0,
+            "misses": 0,
+            "replayed_events": 0
+        }
+
+    def behind(self, feed_version):
+        """
+        :param feed_version: Time of the latest event of the current feed snapshot, see status_cache.feed_version.
+        :return: Whether the feed has events later than the latest event stored.
+        """
+        if feed_version is None:
+            return False
+        with self._lock:
+            return not self._times or epoch_millis(feed_version) > self._times[-1]
+
+    def wants_events(self):
+        """
+        :return: Whether the store ingests the events of the feeds fetched, i.e. a time travel query was made.
+        """
+        with self._lock:
+            return self._in_use
+
+    def on_feed(self, events):
+        """
+        Events listener of the feed cache: ingests the events of a feed just fetched, once the store is in use.
+        :param events: List of the NUDLS events of the feed.
+        """
+        if self.wants_events():
+            self.ingest(events)
+
+    def sync(self, feed_cache, feed_version):
+        """
+        Catches up with the feed cache's snapshot, if the store is behind it: the first time, or after the store was
+        cleared, the feed cache fetches the whole feed again and its events are ingested by on_feed.
+        :param feed_cache: FeedCache whose events listener the store is.
+        :param feed_version: Time of the latest event of the current feed snapshot.
+        """
+        if not self.behind(feed_version):
+            return
+        with self._sync_lock:
+            # Another caller may have synced the store meanwhile
+            if self.behind(feed_version):
+                self.start_sync()
+                feed_cache.reload()
+                self.check_synced(feed_version)
+
+    def start_sync(self):
+        """
+        Starts ingesting the events of the feeds fetched, before the feed cache is asked for the whole feed.
+        """
+        with self._lock:
+            self._in_use = True
+
+    def check_synced(self, feed_version):
+        """
+        Handles a sync whose feed could not be fetched, the store is then still behind the snapshot: the events stored
+        so far keep answering every instant up to the latest of them, unless there are none.
+        :param feed_version: Time of the latest event of the current feed snapshot.
+        """
+        if not self.behind(feed_version):
+            return
+        with self._lock:
+            if not self._events:
+                raise NudlsUnavailable("The NUDLS feed events could not be loaded.")
+            self._stats["fallbacks"] += 1
+        self._logger.error("Time travel served from the stored events, the NUDLS feed could not be loaded")
+
+    def ingest(self, content):
+        """
+        Appends the events of the feed not stored yet, in time order, and builds the checkpoints they complete.
+        :param content: Iterable of NUDLS events, the whole feed or the events added to it, in any order.
+        :return: Number of events ingested.
+        """
+        with self._ingest_lock:
+            with self._lock:
+                latest = self._times[-1] if self._times else None
+                # Events at the latest time stored, an event at that time may or may not be stored yet
+                stored = []
+                index = len(self._times) - 1
+                while index >= 0 and self._times[index] == latest:
+                    stored.append(self._events[index])
+                    index -= 1
+                checkpoint = self._checkpoints[-1]
+                tail = self._events[(len(self._checkpoints) - 1) * self._interval:]
+
+            added = []
+            for event in content:
+                millis = epoch_millis(event["time"])
+                if latest is None or millis > latest or (millis == latest and event not in stored):
+                    added.append((millis, event))
+            # Stable, events at the same time stay in feed order
+            added.sort(key=lambda item: item[0])
+            events = [event for _, event in added]
+
+            # Checkpoints completed by the new events, each built on top of the previous one
+            checkpoints = []
+            tail.extend(events)
+            for start in range(0, len(tail) - self._interval + 1, self._interval):
+                checkpoint = checkpoint.copy()
+                checkpoint.apply_all(tail[start:start + self._interval])
+                checkpoints.append(checkpoint)
+
+            with self._lock:
+                self._events.extend(events)
+                self._times.extend(millis for millis, _ in added)
+                self._checkpoints.extend(checkpoints)
+                self._state_entries += sum(checkpoint.entry_count() for checkpoint in checkpoints)
+                self._stats["syncs"] += 1
+            return len(events)
+
+    def state_at(self, millis):
+        """
+        Park state as of an instant.
+        :param millis: The instant, in milliseconds since the epoch.
+        :return: ParkState built from the events up to the instant included. It is shared and must not be modified.
+        """
+        with self._lock:
+            count = bisect.bisect_right(self._times, millis)
+            state = self._states.get(count)
+            if state is not None:
+                self._states.move_to_end(count)
+                self._stats["hits"] += 1
+                return state[0]
+            self._stats["misses"] += 1
+            index = count // self._interval
+            checkpoint = self._checkpoints[index]
+            replayed = self._events[index * self._interval:count]
+
+        # Replayed outside of the lock, on a copy: checkpoints are shared by every query
+        state = checkpoint
+        entries = 0
+        if replayed:
+            state = checkpoint.copy()
+            state.apply_all(replayed)
+            entries = state.entry_count()
+
+        with self._lock:
+            self._stats["replayed_events"] += len(replayed)
+            # A concurrent miss of the same instant may have rebuilt it already
+            previous = self._states.pop(count, None)
+            if previous is not None:
+                self._state_entries -= previous[1]
+            self._states[count] = (state, entries)
+            self._state_entries += entries
+            while len(self._states) > self._cache_size:
+                self._state_entries -= self._states.popitem(last=False)[1][1]
+        return state
+
+    def clear(self):
+        """
+        Forgets every event and checkpoint to free their memory, and stops ingesting the feeds fetched until the next
+        sync, which has the whole feed fetched again.
+        """
+        with self._ingest_lock, self._lock:
+            self._events = []
+            self._times = []
+            self._checkpoints = [ParkState()]
+            self._states.clear()
+            self._state_entries = 0
+            self._in_use = False
+
+    def estimated_bytes(self):
+        """
+        Estimates the memory held by the events, the checkpoints and the rebuilt park states, in constant time.
+        :return: Estimated bytes.
+        """
+        with self._lock:
+            return len(self._events) * EVENT_STORE_BYTES_PER_EVENT + self._state_entries * EVENT_STORE_BYTES_PER_STATE_ENTRY
+
+    def stats(self):
+        """
+        :return: Dictionary of counters, and the number of events and checkpoints stored.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["events"] = len(self._events)
+            stats["checkpoints"] = len(self._checkpoints)
+            stats["checkpoint_interval"] = self._interval
+            return stats
@@ -0,0 +1,444 @@
+"""
+Shared NUDLS feed cache.
+
+"""
+
+# System imports
+import logging
+import threading
+import time
+
+# Local imports
+from dinopark_status_api.constants import LOGGER, FEED_CACHE_TTL_SECONDS, FEED_CACHE_STALE_SECONDS, FEED_POLL_STARTUP_WAIT_SECONDS
+from dinopark_status_api.metrics import dependency_error, phase
+from dinopark_status_api.nudls_client import NudlsClient, NudlsUnavailable
+from dinopark_status_api.park_state import ParkState
+
+
+class FeedCache:
+    """
+    A TTL-bounded cache of the NUDLS feed shared by every request handled in the process.
+
+    - Fresh (younger than the TTL): the cached feed is served from memory.
+    - Stale (within the stale window after the TTL): the cached feed is served while a single background thread revalidates it.
+    - Expired or empty: the feed is refreshed synchronously. Concurrent callers wait for the same refresh (single-flight)
+      instead of each fetching the feed from NUDLS. If NUDLS is unavailable, the last good snapshot is served instead.
+
+    Once polling is started, a background thread refreshes the feed on an interval instead and callers only ever read
+    the current snapshot, so no request waits on NUDLS.
+
+    Refreshes are conditional (If-None-Match / If-Modified-Since) so an unchanged feed is not downloaded again.
+    The cached value is the snapshot built from the feed (a ParkState by default), so it is built once per fetched feed.
+    Each new snapshot is built from the previous one so that only the events added since are processed, and is swapped
+    in as a whole, so a snapshot being read is never modified.
+    With streaming enabled on the client the feed is parsed while it downloads and its events go straight into the
+    snapshot, so the whole feed is never held in memory as a list.
+
+    With a store, every new snapshot is saved in MongoDB with the feed's validators. The first refresh of the process
+    starts from the saved snapshot instead: it is served right away, and the feed is fetched conditionally on top of it,
+    so a restart downloads nothing when the feed is unchanged and otherwise only applies the events added since.
+
+    Listeners are called with every snapshot swapped in, e.g. to push the statuses that changed (see status_stream),
+    and events listeners with the events of every feed fetched, e.g. to keep them for time travel (see event_store).
+    """
+
+    def __init__(self, client=None, ttl=FEED_CACHE_TTL_SECONDS, stale_ttl=FEED_CACHE_STALE_SECONDS, clock=time.monotonic,
+                 snapshot_factory=ParkState.from_events, startup_wait=FEED_POLL_STARTUP_WAIT_SECONDS, store=None):
+        """
+        Constructor.
+        :param client: NUDLS client fetching the feed. Defaults to a new NudlsClient with the configured settings.
+        :param ttl: Seconds a fetched feed is considered fresh.
+        :param stale_ttl: Seconds after the TTL a feed may still be served while it is revalidated.
+        :param clock: Monotonic clock returning seconds, injectable for tests.
+        :param snapshot_factory: Callable building the cached snapshot from the feed content and the previous snapshot.
+        :param startup_wait: Seconds a caller waits for the poller's first snapshot.
+        :param store: ParkStateStore the snapshots are saved in and restored from, None to keep them in memory only.
+        Requires the default snapshot factory.
+        """
+        self.client = client if client is not None else NudlsClient()
+        self._snapshot_factory = snapshot_factory
+        self._ttl = ttl
+        self._stale_ttl = stale_ttl
+        self._clock = clock
+        self._startup_wait = startup_wait
+        self._store = store
+        self._logger = logging.getLogger(LOGGER)
+        self._poller = None
+        self._stop_polling = threading.Event()
+        self._listeners = []
+        # Tuples of an events listener and the function telling whether it wants the events of the next feed
+        self._events_listeners = []
+
+        # All state below is guarded by the condition's lock.
+        self._cond = threading.Condition()
+        self._snapshot = None
+        self._fetched_at = None
+        self._etag = None
+        self._last_modified = None
+        self._refreshing = False
+        self._generation = 0
+        self._error = None
+        self._restored = store is None
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "not_modified": 0,
+            "errors": 0,
+            "fallbacks": 0,
+            "restored": 0,
+            "saved": 0
+        }
+
+    def get(self):
+        """
+        Returns the snapshot of the NUDLS feed, fetching it from NUDLS only when the cached copy is missing or expired.
+        :return: The feed snapshot, a ParkState by default.
+        """
+        return self.get_with_age()[0]
+
+    def get_with_age(self):
+        """
+        Returns the snapshot of the NUDLS feed and how long ago it was fetched or revalidated.
+        :return: Tuple of the feed snapshot and its age in seconds.
+        """
+        with self._cond:
+            if self._poller is not None:
+                return self._polled_snapshot()
+
+            age = self._age()
+            if age is not None and age < self._ttl:
+                self._stats["hits"] += 1
+                return self._snapshot, age
+
+            if age is not None and age < self._ttl + self._stale_ttl:
+                self._stats["stale_hits"] += 1
+                if not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh_in_background, daemon=True).start()
+                return self._snapshot, age
+
+            self._stats["misses"] += 1
+            if self._refreshing:
+                # Another caller is already fetching the feed, wait for its result instead of fetching again.
+                generation = self._generation
+                while self._generation == generation:
+                    self._cond.wait()
+                return self._result(self._error)
+
+            self._refreshing = True
+
+        return self._refresh(raise_errors=True)
+
+    def refresh(self):
+        """
+        Refreshes the feed now, whatever its age. If a refresh is already running, waits for it instead.
+        Errors are logged and counted, the current snapshot is kept.
+        """
+        with self._cond:
+            if self._refreshing:
+                generation = self._generation
+                while self._generation == generation:
+                    self._cond.wait()
+                return
+            self._refreshing = True
+
+        self._refresh(raise_errors=False)
+
+    def reload(self):
+        """
+        Fetches the whole feed now, without the validators of the cached one, so that the events listeners get every
+        event even when the feed did not change. A refresh already running is waited for first.
+        Errors are logged and counted, the current snapshot is kept.
+        """
+        with self._cond:
+            while self._refreshing:
+                self._cond.wait()
+            self._refreshing = True
+
+        self._refresh(raise_errors=False, revalidate=False)
+
+    def add_listener(self, listener):
+        """
+        Calls a function with every new snapshot once it is swapped in, by the thread that swapped it in and outside of
+        the lock. Revalidated (304) feeds keep their snapshot and call no listener.
+        :param listener: Callable taking the new snapshot. Its errors are logged and do not fail the refresh.
+        """
+        self._listeners.append(listener)
+
+    def add_events_listener(self, listener, wanted=None):
+        """
+        Calls a function with the events of every feed fetched once its snapshot is swapped in, by the thread that
+        swapped it in and outside of the lock. The events are only collected when a listener wants them: a streamed
+        feed is then held as a list until the listeners return.
+        :param listener: Callable taking the list of events of the feed. Its errors are logged and do not fail the refresh.
+        :param wanted: Callable returning whether the listener wants the events of the next feed, defaults to always.
+        """
+        self._events_listeners.append((listener, wanted if wanted is not None else lambda: True))
+
+    def start_polling(self, interval):
+        """
+        Starts a daemon thread refreshing the feed every interval seconds, the first time right away.
+        From then on callers only read the current snapshot and never wait on NUDLS.
+        :param interval: Seconds between the end of a refresh and the start of the next one.
+        """
+        with self._cond:
+            if self._poller is not None:
+                return
+            # Each poller has its own stop event, a poller stopped without waiting for it never outlives it
+            self._stop_polling = threading.Event()
+            self._poller = threading.Thread(target=self._poll, args=(interval, self._stop_polling), name="nudls-feed-poller", daemon=True)
+            self._poller.start()
+
+    def stop_polling(self):
+        """
+        Stops the polling thread, callers go back to refreshing the feed when it expires.
+        """
+        with self._cond:
+            poller = self._poller
+            self._poller = None
+            if poller is not None:
+                self._stop_polling.set()
+        if poller is not None:
+            poller.join()
+
+    def invalidate(self):
+        """
+        Drops the cached feed so the next call fetches it again.
+        """
+        with self._cond:
+            self._snapshot = None
+            self._fetched_at = None
+            self._etag = None
+            self._last_modified = None
+
+    def unload(self):
+        """
+        Stops polling, without waiting for a refresh in progress, and drops the cached feed to free its memory, e.g.
+        when its park is idle. The next call loads it again, starting from the store's saved snapshot if there is one.
+        A refresh in progress still swaps its snapshot in and calls the listeners.
+        """
+        with self._cond:
+            if self._poller is not None:
+                self._poller = None
+                self._stop_polling.set()
+            self._snapshot = None
+            self._fetched_at = None
+            self._etag = None
+            self._last_modified = None
+            self._restored = self._store is None
+        if self._store is not None:
+            self._store.forget()
+
+    def loaded(self):
+        """
+        :return: Whether a snapshot of the feed is cached.
+        """
+        with self._cond:
+            return self._snapshot is not None
+
+    def stats(self):
+        """
+        :return: Dictionary of cache counters and the age of the cached feed.
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            age = self._age()
+            stats["age_seconds"] = round(age, 3) if age is not None else None
+            stats["polling"] = self._poller is not None
+            return stats
+
+    def _age(self):
+        """
+        :return: Seconds since the cached feed was last fetched or revalidated, None if nothing is cached.
+        """
+        if self._fetched_at is None:
+            return None
+        return self._clock() - self._fetched_at
+
+    def _poll(self, interval, stop):
+        """
+        Body of the polling thread.
+        :param interval: Seconds between refreshes.
+        :param stop: Event set to stop polling.
+        """
+        while not stop.is_set():
+            try:
+                self.refresh()
+            except Exception:  # pylint: disable=broad-except
+                pass  # Already logged and counted by the refresh, keep polling
+            stop.wait(interval)
+
+    def _refresh_in_background(self):
+        """
+        Body of the thread revalidating a stale feed. Its errors are logged instead of escaping the thread, and the
+        stale feed keeps being served.
+        """
+        try:
+            self._refresh(raise_errors=False)
+        except Exception as err:  # pylint: disable=broad-except
+            self._logger.error(f"Background feed refresh failed: {err}")
+
+    def _polled_snapshot(self):
+        """
+        Current snapshot while polling. Must be called holding the lock.
+        :return: Tuple of the feed snapshot and its age in seconds.
+        """
+        if self._snapshot is None:
+            # Right after start up, give the poller's first refresh a chance to land.
+            deadline = time.monotonic() + self._startup_wait
+            while self._snapshot is None and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            if self._snapshot is None:
+                self._stats["misses"] += 1
+                raise NudlsUnavailable("The NUDLS feed has not been loaded yet.")
+
+        self._stats["hits"] += 1
+        return self._snapshot, self._age()
+
+    def _refresh(self, raise_errors, revalidate=True):
+        """
+        Fetches the feed from NUDLS and publishes the result to waiting callers.
+        Must only be called by the caller that set self._refreshing. Whatever happens, it is reset and the waiting
+        callers are woken up.
+        :param raise_errors: Whether to re-raise a failed fetch. Background refreshes keep serving the stale feed instead.
+        :param revalidate: Whether the fetch is conditional on the validators of the cached feed.
+        :return: Tuple of the feed snapshot and its age in seconds.
+        """
+        published = False
+        try:
+            if not self._restored:
+                self._restore()
+
+            error = None
+            snapshot = None
+            previous = self._snapshot
+            listeners = [listener for listener, wanted in self._events_listeners if wanted()]
+            events = None
+            try:
+                with phase("feed_fetch"):
+                    resp = self.client.fetch_feed(*((self._etag, self._last_modified) if revalidate else (None, None)))
+                if resp.status_code != 304:
+                    # Build the snapshot outside of the lock so that readers keep being served meanwhile.
+                    # A streamed feed is parsed while the snapshot is built, both are timed together.
+                    with phase("json_parse"):
+                        events = self.client.events(resp)
+                        if listeners:
+                            events = list(events)
+                        snapshot = self._snapshot_factory(events, previous=previous)
+            except Exception as err:  # pylint: disable=broad-except
+                self._logger.error(err)
+                error = err
+
+            if self._store is not None and snapshot is not None and (previous is None or snapshot.high_water_mark != previous.high_water_mark):
+                try:
+                    saved = self._store.save(snapshot, resp.headers.get("ETag"), resp.headers.get("Last-Modified"))
+                except Exception as err:  # pylint: disable=broad-except
+                    # The snapshot is served all the same, the next one is saved again
+                    self._logger.error(f"Could not save the park state: {err}")
+                    saved = False
+                with self._cond:
+                    self._stats["saved"] += saved
+
+            with self._cond:
+                self._stats["refreshes"] += 1
+                if error is not None:
+                    self._stats["errors"] += 1
+                elif resp.status_code == 304:
+                    self._stats["not_modified"] += 1
+                    self._fetched_at = self._clock()
+                else:
+                    self._snapshot = snapshot
+                    self._etag = resp.headers.get("ETag")
+                    self._last_modified = resp.headers.get("Last-Modified")
+                    self._fetched_at = self._clock()
+
+                self._error = error
+                self._refreshing = False
+                self._generation += 1
+                self._cond.notify_all()
+                published = True
+
+                # A failed refresh raises here, it swapped nothing in
+                result = self._result(error) if raise_errors else (self._snapshot, self._age())
+        except BaseException as err:
+            if not published:
+                # Failed before publishing anything, e.g. restoring or saving the park state: the waiting callers
+                # get the error and the next call refreshes again.
+                self._logger.error(f"Feed refresh failed: {err}")
+                if self._store is not None and isinstance(err, Exception):
+                    dependency_error("mongo", err.__class__.__name__)
+                with self._cond:
+                    self._stats["errors"] += 1
+                    self._error = err
+                    self._refreshing = False
+                    self._generation += 1
+                    self._cond.notify_all()
+            raise
+
+        if error is None and snapshot is not None:
+            self._notify(snapshot)
+            self._notify_events(listeners, events)
+        return result
+
+    def _restore(self):
+        """
+        Publishes the snapshot saved by a previous process, if any, as the current one.
+        Must only be called by the caller that set self._refreshing.
+        """
+        self._restored = True
+        try:
+            restored = self._store.load()
+        except Exception as err:  # pylint: disable=broad-except
+            # The park state is rebuilt from the whole feed instead
+            self._logger.error(f"Could not restore the park state: {err}")
+            restored = None
+        if restored is None:
+            return
+        snapshot, etag, last_modified, age = restored
+        with self._cond:
+            if self._snapshot is not None:
+                return
+            self._snapshot = snapshot
+            self._etag = etag
+            self._last_modified = last_modified
+            self._fetched_at = self._clock() - age
+            self._stats["restored"] += 1
+            # Wake up callers waiting for the poller's first snapshot
+            self._cond.notify_all()
+        self._notify(snapshot)
+
+    def _notify(self, snapshot):
+        """
+        Calls the listeners with a snapshot just swapped in. Must be called without holding the lock.
+        """
+        for listener in self._listeners:
+            try:
+                listener(snapshot)
+            except Exception as err:  # pylint: disable=broad-except
+                self._logger.error(f"Feed listener failed: {err}")
+
+    def _notify_events(self, listeners, events):
+        """
+        Calls the events listeners that wanted the events of a feed just swapped in. Must be called without holding
+        the lock.
+        """
+        for listener in listeners:
+            try:
+                listener(events)
+            except Exception as err:  # pylint: disable=broad-except
+                self._logger.error(f"Feed events listener failed: {err}")
+
+    def _result(self, error):
+        """
+        Result of a synchronous refresh for the callers waiting on it. Must be called holding the lock.
+        :param error: The error the refresh failed with, None if it succeeded.
+        :return: Tuple of the feed snapshot, or the last good one if NUDLS is unavailable, and its age in seconds.
+        """
+        if error is None:
+            return self._snapshot, self._age()
+        if isinstance(error, NudlsUnavailable) and self._snapshot is not None:
+            self._stats["fallbacks"] += 1
+            return self._snapshot, self._age()
+        raise error
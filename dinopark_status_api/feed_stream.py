@@ -0,0 +1,123 @@
+"""
+Streaming parsers for the NUDLS feed.
+
+The NUDLS feed is a JSON array of events. These parsers yield one event at a time from the response body as it is
+downloaded, so the events can be applied to the park state without ever holding the whole feed in memory.
+
+"""
+
+# System imports
+import codecs
+import json
+
+# Content types of a newline delimited JSON feed, one event per line
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/jsonl", "application/json-seq")
+
+# Size of the chunks read from the response body
+CHUNK_SIZE = 64 * 1024
+
+# Consumed characters are dropped from the parse buffer once there are more than this many
+_COMPACT_THRESHOLD = 64 * 1024
+
+_WHITESPACE = " \t\n\r"
+
+
+def iter_json_array(chunks):
+    """
+    Incrementally parses a top level JSON array from chunks of bytes and yields its items.
+    :param chunks: Iterable of bytes, e.g. response.iter_content().
+    :return: Generator of the decoded array items.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buffer = ""
+    pos = 0
+    eof = False
+    started = False
+    # Once the array started: whether an item comes next (after "[" or ","), and whether "]" may close the array there
+    # (only right after "[", a comma is always followed by an item)
+    expect_item = True
+    may_end = True
+
+    while True:
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+
+        if pos < len(buffer):
+            char = buffer[pos]
+            if not started:
+                if char != "[":
+                    raise ValueError(f"Expected a JSON array, got {char!r}")
+                started = True
+                pos += 1
+                continue
+
+            if char == "]" and (may_end or not expect_item):
+                return
+            if not expect_item:
+                if char != ",":
+                    raise ValueError(f"Expected ',' or ']' after an array item, got {char!r}")
+                expect_item = True
+                pos += 1
+                continue
+            if char in ",]":
+                raise ValueError(f"Expected an array item, got {char!r}")
+
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except ValueError:
+                # The item is not fully downloaded yet, unless there is nothing more to download.
+                if eof:
+                    raise
+            else:
+                # A bare number at the end of the buffer may still be missing digits.
+                if end < len(buffer) or eof:
+                    yield item
+                    pos = end
+                    expect_item = False
+                    may_end = False
+                    continue
+        elif eof:
+            raise ValueError("Unexpected end of JSON array")
+
+        # Read the next chunk, dropping what was consumed so that the buffer stays small.
+        if pos > _COMPACT_THRESHOLD:
+            buffer = buffer[pos:]
+            pos = 0
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+            buffer += utf8.decode(b"", final=True)
+        else:
+            buffer += utf8.decode(chunk)
+
+
+def iter_ndjson(lines):
+    """
+    Parses newline delimited JSON and yields one item per non-empty line.
+    :param lines: Iterable of bytes lines, e.g. response.iter_lines().
+    :return: Generator of the decoded items.
+    """
+    for line in lines:
+        line = line.strip()
+        # Skip blank lines and the record separator of application/json-seq
+        line = line.lstrip(b"\x1e")
+        if line:
+            yield json.loads(line)
+
+
+def iter_response_events(resp):
+    """
+    Yields the events of a streamed NUDLS response, picking the parser from the response content type.
+    :param resp: A requests response opened with stream=True.
+    :return: Generator of NUDLS events.
+    """
+    content_type = resp.headers.get("Content-Type", "").split(";")[0].strip()
+    try:
+        if content_type in NDJSON_CONTENT_TYPES:
+            yield from iter_ndjson(resp.iter_lines(chunk_size=CHUNK_SIZE))
+        else:
+            yield from iter_json_array(resp.iter_content(chunk_size=CHUNK_SIZE))
+    finally:
+        resp.close()
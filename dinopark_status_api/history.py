@@ -0,0 +1,201 @@
+"""
+Status history collection: stored documents, indexes and the zone history query.
+
+"""
+
+# System imports
+import base64
+import json
+import logging
+from datetime import datetime
+
+# Third-party imports
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import OperationFailure, PyMongoError
+from werkzeug.exceptions import BadRequest
+
+# Local imports
+from dinopark_status_api.constants import LOGGER, STATUS_HISTORY_TTL_SECONDS, HISTORY_DEFAULT_LIMIT, HISTORY_MAX_LIMIT
+from dinopark_status_api.metrics import dependency_error
+from dinopark_status_api.status import parse_zone
+
+# Fields of the stored status documents that the history query can return
+HISTORY_FIELDS = ("zone", "status_type", "feed_version", "date", "computed_at", "maintenance_required", "safety_status", "info")
+
+# Fields identifying a stored status: one document per status, zone, NUDLS feed version and day (see StatusCache)
+STATUS_KEY_FIELDS = ("status_type", "zone", "feed_version", "date")
+
+# Newest first, _id breaks ties between documents computed at the same time
+HISTORY_SORT = [("computed_at", DESCENDING), ("_id", DESCENDING)]
+
+# MongoDB error code of an index that exists with different options
+INDEX_OPTIONS_CONFLICT = 85
+
+# Indexes created by previous versions and covered by the current ones, dropped by ensure_indexes
+SUPERSEDED_INDEXES = ("zone_computed_at",)
+
+
+def status_document(result, key, computed_at=None):
+    """
+    Document stored in the status collection for a computed status.
+    :param result: Status result returned to the client.
+    :param key: Dictionary of the STATUS_KEY_FIELDS of the result, see StatusCache.get.
+    :param computed_at: Time the status was computed, defaults to now (UTC).
+    :return: A new dictionary, the result is left untouched.
+    """
+    document = dict(result)
+    document.update(key)
+    document["computed_at"] = computed_at if computed_at is not None else datetime.utcnow()
+    return document
+
+
+def upsert_requests(documents):
+    """
+    Bulk write requests storing status documents, each only if no document with the same key is stored yet.
+    Processes computing the same status concurrently then store it once.
+    :param documents: Documents built by status_document.
+    :return: List of UpdateOne requests.
+    """
+    return [UpdateOne({field: document[field] for field in STATUS_KEY_FIELDS}, {"$setOnInsert": document}, upsert=True)
+            for document in documents]
+
+
+def index_specs(ttl_seconds=STATUS_HISTORY_TTL_SECONDS):
+    """
+    :param ttl_seconds: Seconds status documents are kept, None to keep them forever.
+    :return: List of (keys, options) of the indexes of the status collection.
+    """
+    specs = [
+        # The history query: equality on the zone, then sorted by HISTORY_SORT with no in-memory sort
+        ([("zone", ASCENDING)] + HISTORY_SORT, {"name": "zone_history"}),
+        # Upserts look statuses up by key. Documents stored before statuses had a key are left out of the index.
+        ([(field, ASCENDING) for field in STATUS_KEY_FIELDS],
+         {"name": "status_key", "unique": True, "partialFilterExpression": {"feed_version": {"$exists": True}}})
+    ]
+    if ttl_seconds:
+        specs.append(([("computed_at", ASCENDING)], {"name": "computed_at_ttl", "expireAfterSeconds": ttl_seconds}))
+    return specs
+
+
+def ensure_indexes(collection, ttl_seconds=STATUS_HISTORY_TTL_SECONDS):
+    """
+    Creates the indexes of the status collection if missing, updates the TTL if it changed and drops the superseded
+    indexes.
+    Errors are logged, the app keeps serving without the indexes.
+    :param collection: The status collection.
+    :param ttl_seconds: Seconds status documents are kept, None to keep them forever.
+    :return: Whether the indexes are up to date.
+    """
+    logger = logging.getLogger(LOGGER)
+    try:
+        for keys, options in index_specs(ttl_seconds):
+            try:
+                collection.create_index(keys, **options)
+            except OperationFailure as err:
+                if err.code != INDEX_OPTIONS_CONFLICT or "expireAfterSeconds" not in options:
+                    raise
+                collection.database.command("collMod", collection.name, index={
+                    "keyPattern": dict(keys),
+                    "expireAfterSeconds": options["expireAfterSeconds"]
+                })
+        existing = collection.index_information()
+        for name in SUPERSEDED_INDEXES:
+            if name in existing:
+                collection.drop_index(name)
+    except PyMongoError as err:
+        logger.error(f"Could not create the indexes of the status collection: {err}")
+        dependency_error("mongo", err.__class__.__name__)
+        return False
+    return True
+
+
+def history_query(zone, since=None, limit=None, fields=None, cursor=None):
+    """
+    Validates the arguments of a zone history request and builds the MongoDB query.
+    :param zone: Zone identifier.
+    :param since: Only return statuses computed at or after this ISO 8601 date or time (UTC).
+    :param limit: Maximum number of statuses returned, as a string.
+    :param fields: Comma separated fields to return, see HISTORY_FIELDS. Defaults to all.
+    :param cursor: Cursor returned with the previous page.
+    :return: Tuple of the filter, the projection and the limit of the query.
+    """
+    query = {"zone": parse_zone(zone)}
+
+    if since:
+        try:
+            query["computed_at"] = {"$gte": datetime.fromisoformat(since.rstrip("Z"))}
+        except ValueError:
+            raise BadRequest(f"since: {since} is not an ISO 8601 date or time.")
+
+    if limit is None or limit == "":
+        limit = HISTORY_DEFAULT_LIMIT
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= HISTORY_MAX_LIMIT:
+            raise BadRequest(f"limit must be an integer between 1 and {HISTORY_MAX_LIMIT}.")
+
+    projection = {field: True for field in HISTORY_FIELDS}
+    if fields:
+        requested = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in requested if field not in HISTORY_FIELDS]
+        if unknown or not requested:
+            raise BadRequest(f"Provide fields among: {', '.join(HISTORY_FIELDS)}.")
+        # The sort keys are always read for the cursor
+        projection = {field: True for field in requested + ["computed_at"]}
+
+    if cursor:
+        computed_at, last_id = _decode_cursor(cursor)
+        query["$or"] = [
+            {"computed_at": {"$lt": computed_at}},
+            {"computed_at": computed_at, "_id": {"$lt": last_id}}
+        ]
+
+    return query, projection, limit
+
+
+def history_page(documents, limit, fields=None):
+    """
+    Response body of a zone history request.
+    :param documents: Documents found by the query of history_query, sorted by HISTORY_SORT, at most limit + 1 of them.
+    :param limit: Limit returned by history_query.
+    :param fields: Fields requested, as given to history_query.
+    :return: Dictionary of the statuses and the cursor of the next page, None on the last page.
+    """
+    requested = None
+    if fields:
+        requested = {field.strip() for field in fields.split(",") if field.strip()}
+
+    page = documents[:limit]
+    next_cursor = _encode_cursor(page[-1]) if len(documents) > limit else None
+
+    items = []
+    for document in page:
+        item = {key: value for key, value in document.items() if key != "_id" and (requested is None or key in requested)}
+        if "computed_at" in item:
+            item["computed_at"] = item["computed_at"].isoformat(timespec="milliseconds") + "Z"
+        items.append(item)
+
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def _encode_cursor(document):
+    """
+    :return: Opaque cursor pointing after the given document.
+    """
+    position = [document["computed_at"].isoformat(), str(document["_id"])]
+    return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor):
+    """
+    :return: Tuple of the computed_at and _id the cursor points after.
+    """
+    try:
+        computed_at, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return datetime.fromisoformat(computed_at), ObjectId(last_id)
+    except Exception:  # pylint: disable=broad-except
+        raise BadRequest("cursor is not a cursor returned by a previous page.")
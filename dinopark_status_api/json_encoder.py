@@ -1,12 +1,20 @@
 """
 Custom JSON Encoder
 
+Response bodies are encoded with orjson when it is installed, with the standard library encoder otherwise.
+
 """
 
 # System imports
 import json
 import bson
 
+# Third-party imports
+try:
+    import orjson
+except ImportError:  # pragma: no cover - the standard library encoder is used instead
+    orjson = None
+
 
 class MongoJsonEncoder(json.JSONEncoder):
     """
@@ -17,3 +25,33 @@ class MongoJsonEncoder(json.JSONEncoder):
             return str(obj)
 
         return json.JSONEncoder.default(self, obj)
+
+
+def _default(obj):
+    """
+    Encodes the types orjson does not know about, see MongoJsonEncoder.
+    """
+    if isinstance(obj, bson.ObjectId):
+        return str(obj)
+    raise TypeError(f"Object of type {obj.__class__.__name__} is not JSON serializable")
+
+
+def dumps(obj):
+    """
+    :param obj: JSON-serializable object, MongoDB ObjectIds are encoded as strings.
+    :return: The compact JSON encoding of the object, as UTF-8 bytes.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, cls=MongoJsonEncoder, separators=(",", ":")).encode("utf-8")
+
+
+def add_field(body, name, value):
+    """
+    Adds a field to an already encoded JSON object without decoding it, e.g. the snapshot age of a cached status.
+    :param body: JSON object encoded by dumps, with at least one field.
+    :param name: Name of the field, must not be in the object yet.
+    :param value: JSON-serializable value of the field.
+    :return: The encoded JSON object with the field added last.
+    """
+    return b"".join((body[:-1], b",", dumps(name), b":", dumps(value), b"}"))
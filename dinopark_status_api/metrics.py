@@ -0,0 +1,303 @@
+"""
+Metrics of the process in the Prometheus text format: request latencies by route and phase, requests in flight and
+errors of the calls to NUDLS and MongoDB.
+
+"""
+
+# System imports
+import bisect
+import contextvars
+import threading
+import time
+
+# Local imports
+from dinopark_status_api.constants import METRICS_LATENCY_BUCKETS
+
+# Content type of the Prometheus text format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Route of the request being served by the current thread or task, phases timed outside of requests (e.g. the feed
+# poller or the write-behind queue) are recorded under the background route
+BACKGROUND_ROUTE = "background"
+_route = contextvars.ContextVar("dinopark_route", default=BACKGROUND_ROUTE)
+
+
+class Metric:
+    """
+    A metric with labels, holding one value per combination of label values.
+    """
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        Constructor.
+        :param name: Name of the metric.
+        :param documentation: Help text of the metric.
+        :param labelnames: Names of the labels, their values are given positionally when recording.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def samples(self):
+        """
+        :return: List of (name suffix, label names and values, value) of the metric.
+        """
+        with self._lock:
+            values = dict(self._values)
+        return [("", tuple(zip(self.labelnames, labelvalues)), value) for labelvalues, value in sorted(values.items())]
+
+
+class Counter(Metric):
+    """
+    A count that only goes up, e.g. of errors.
+    """
+    type_name = "counter"
+
+    def inc(self, *labelvalues, amount=1):
+        """
+        :param labelvalues: Values of the labels.
+        :param amount: Amount added.
+        """
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down, e.g. requests in flight, or read from a function when rendered.
+    """
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        """
+        Constructor, see Metric.
+        """
+        super().__init__(name, documentation, labelnames)
+        self._function = None
+
+    def inc(self, *labelvalues, amount=1):
+        """
+        :param labelvalues: Values of the labels.
+        :param amount: Amount added.
+        """
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def dec(self, *labelvalues, amount=1):
+        """
+        :param labelvalues: Values of the labels.
+        :param amount: Amount subtracted.
+        """
+        self.inc(*labelvalues, amount=-amount)
+
+    def set_function(self, function):
+        """
+        Reads the value of a gauge without labels from a function when the metrics are rendered.
+        :param function: Callable returning the value, None if unknown.
+        """
+        self._function = function
+
+    def samples(self):
+        """
+        :return: List of (name suffix, label names and values, value) of the metric.
+        """
+        if self._function is not None:
+            value = self._function()
+            return [("", (), value)] if value is not None else []
+        return super().samples()
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values, e.g. durations, counted in cumulative buckets.
+    """
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=METRICS_LATENCY_BUCKETS):
+        """
+        Constructor, see Metric.
+        :param buckets: Upper bounds of the buckets, in increasing order.
+        """
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labelvalues):
+        """
+        :param value: Observed value.
+        :param labelvalues: Values of the labels.
+        """
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(labelvalues)
+            if counts is None:
+                # Count of each bucket (not cumulated, the last one is +Inf) and the sum of the values
+                counts = self._values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[index] += 1
+            counts[-1] += value
+
+    def samples(self):
+        """
+        :return: List of (name suffix, label names and values, value) of the metric.
+        """
+        with self._lock:
+            values = {labelvalues: list(counts) for labelvalues, counts in self._values.items()}
+
+        samples = []
+        bounds = [_format_value(bound) for bound in self.buckets] + ["+Inf"]
+        for labelvalues, counts in sorted(values.items()):
+            labels = tuple(zip(self.labelnames, labelvalues))
+            cumulated = 0
+            for bound, count in zip(bounds, counts):
+                cumulated += count
+                samples.append(("_bucket", labels + (("le", bound),), cumulated))
+            samples.append(("_sum", labels, counts[-1]))
+            samples.append(("_count", labels, cumulated))
+        return samples
+
+
+class Registry:
+    """
+    The metrics of the process, rendered by the metrics endpoint.
+    """
+
+    def __init__(self):
+        """
+        Constructor.
+        """
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def counter(self, name, documentation, labelnames=()):
+        """
+        :return: The Counter of the given name, created if missing.
+        """
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        """
+        :return: The Gauge of the given name, created if missing.
+        """
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=METRICS_LATENCY_BUCKETS):
+        """
+        :return: The Histogram of the given name, created if missing.
+        """
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        """
+        :return: Every metric in the Prometheus text format, as UTF-8 bytes.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for suffix, labels, value in metric.samples():
+                label_text = ",".join(f'{label}="{_escape(label_value)}"' for label, label_value in labels)
+                lines.append(f"{metric.name}{suffix}{{{label_text}}} {_format_value(value)}" if label_text else
+                             f"{metric.name}{suffix} {_format_value(value)}")
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def _get_or_create(self, metric_class, name, documentation, labelnames, **kwargs):
+        """
+        :return: The metric of the given name, created if missing.
+        """
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, metric_class) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with another type or labels.")
+            return metric
+
+
+def _escape(value):
+    """
+    :return: The label value escaped for the text format.
+    """
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_value(value):
+    """
+    :return: The sample value in the text format.
+    """
+    if isinstance(value, float):
+        if value != value or value in (float("inf"), float("-inf")):
+            return {"nan": "NaN", "inf": "+Inf", "-inf": "-Inf"}[repr(value)]
+        if not value.is_integer():
+            return repr(value)
+    return str(int(value))
+
+
+# Metrics of the process
+REGISTRY = Registry()
+REQUEST_SECONDS = REGISTRY.histogram("dinopark_request_duration_seconds", "Duration of the HTTP requests.", ("route", "method", "code"))
+PHASE_SECONDS = REGISTRY.histogram("dinopark_phase_duration_seconds", "Time spent serving statuses by phase: feed_fetch, json_parse, "
+                                   "index_lookup, algorithm, serialize and mongo_write.", ("route", "phase"))
+REQUESTS_IN_FLIGHT = REGISTRY.gauge("dinopark_requests_in_flight", "Number of HTTP requests being served.", ("route",))
+DEPENDENCY_ERRORS = REGISTRY.counter("dinopark_dependency_errors_total", "Errors of the calls to NUDLS and MongoDB.", ("dependency", "error"))
+
+
+def set_route(route):
+    """
+    Sets the route phases are recorded under, for the current thread or task.
+    :param route: Route name, e.g. the endpoint of the request.
+    :return: Token to pass to reset_route.
+    """
+    return _route.set(route)
+
+
+def reset_route(token):
+    """
+    Restores the route phases were recorded under before set_route.
+    :param token: Token returned by set_route.
+    """
+    _route.reset(token)
+
+
+class phase:  # pylint: disable=invalid-name
+    """
+    Context manager timing a phase of the current request, e.g. `with phase("algorithm"): ...`
+    """
+    __slots__ = ("_name", "_start")
+
+    def __init__(self, name):
+        """
+        Constructor.
+        :param name: Name of the phase.
+        """
+        self._name = name
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe_phase(self._name, time.perf_counter() - self._start)
+
+
+def observe_phase(name, seconds):
+    """
+    Records the duration of a phase of the current request.
+    :param name: Name of the phase.
+    :param seconds: Duration of the phase.
+    """
+    PHASE_SECONDS.observe(seconds, _route.get(), name)
+
+
+def dependency_error(dependency, error):
+    """
+    Counts a failed call to a dependency.
+    :param dependency: nudls or mongo.
+    :param error: Name of the error, e.g. the exception class.
+    """
+    DEPENDENCY_ERRORS.inc(dependency, error)
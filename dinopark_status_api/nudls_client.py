@@ -0,0 +1,348 @@
+"""
+NUDLS HTTP client.
+
+"""
+
+# System imports
+import logging
+import random
+import threading
+import time
+
+# Third-party imports
+import requests
+from requests.adapters import HTTPAdapter
+from werkzeug.exceptions import ServiceUnavailable
+
+# Local imports
+from dinopark_status_api.constants import LOGGER, NUDLS_URL, NUDLS_STREAMING, NUDLS_CONNECT_TIMEOUT_SECONDS, NUDLS_READ_TIMEOUT_SECONDS, \
+    NUDLS_POOL_SIZE, NUDLS_MAX_RETRIES, NUDLS_BACKOFF_SECONDS, NUDLS_BACKOFF_MAX_SECONDS, NUDLS_CIRCUIT_FAILURE_THRESHOLD, \
+    NUDLS_CIRCUIT_RESET_SECONDS
+from dinopark_status_api.feed_stream import iter_response_events, NDJSON_CONTENT_TYPES
+from dinopark_status_api.metrics import dependency_error
+
+# Response status codes worth retrying, the upstream may answer differently on the next attempt
+RETRYABLE_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
+
+
+class NudlsUnavailable(ServiceUnavailable):
+    """
+    Raised when NUDLS could not be reached after retrying, or while the circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker counting consecutive failed calls.
+
+    - Closed: calls go through.
+    - Open (after failure_threshold consecutive failures): calls fail fast for reset_timeout seconds.
+    - Half open (after reset_timeout): a single trial call goes through, its outcome closes or re-opens the circuit.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold, reset_timeout, clock=time.monotonic):
+        """
+        Constructor.
+        :param failure_threshold: Consecutive failures that open the circuit.
+        :param reset_timeout: Seconds the circuit stays open before a trial call is allowed.
+        :param clock: Monotonic clock returning seconds.
+        """
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = None
+
+    @property
+    def state(self):
+        """
+        :return: The circuit state, one of closed, open or half_open.
+        """
+        with self._lock:
+            return self._state
+
+    def allow(self):
+        """
+        :return: Whether a call may go through now.
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN and self._clock() - self._opened_at >= self._reset_timeout:
+                # Let a single trial call through
+                self._state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        """
+        Closes the circuit.
+        """
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+
+    def record_failure(self):
+        """
+        Counts a failed call, opening the circuit past the threshold or when the trial call failed.
+        """
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self._failure_threshold:
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+
+
+class NudlsClientBase:
+    """
+    Configuration, circuit breaker and call metrics shared by the blocking and the asynchronous NUDLS clients.
+    """
+
+    def __init__(self, url=NUDLS_URL, connect_timeout=NUDLS_CONNECT_TIMEOUT_SECONDS, read_timeout=NUDLS_READ_TIMEOUT_SECONDS,
+                 max_retries=NUDLS_MAX_RETRIES, backoff=NUDLS_BACKOFF_SECONDS, backoff_max=NUDLS_BACKOFF_MAX_SECONDS,
+                 failure_threshold=NUDLS_CIRCUIT_FAILURE_THRESHOLD, reset_timeout=NUDLS_CIRCUIT_RESET_SECONDS, clock=time.monotonic):
+        """
+        Constructor.
+        :param url: NUDLS feed endpoint.
+        :param connect_timeout: Seconds to wait for a connection to NUDLS.
+        :param read_timeout: Seconds to wait for NUDLS to send data.
+        :param max_retries: Retries of a failed call.
+        :param backoff: Base of the exponential backoff between retries, in seconds.
+        :param backoff_max: Maximum backoff between retries, in seconds.
+        :param failure_threshold: Consecutive failed calls that open the circuit.
+        :param reset_timeout: Seconds the circuit stays open.
+        :param clock: Monotonic clock returning seconds, injectable for tests.
+        """
+        self._url = url
+        self._connect_timeout = connect_timeout
+        self._read_timeout = read_timeout
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._backoff_max = backoff_max
+        self._clock = clock
+        self._logger = logging.getLogger(LOGGER)
+        self._breaker = CircuitBreaker(failure_threshold, reset_timeout, clock)
+
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "calls": 0,
+            "attempts": 0,
+            "retries": 0,
+            "successes": 0,
+            "not_modified": 0,
+            "failures": 0,
+            "rejected_by_circuit": 0,
+            "errors": {},
+            "latency_ms_total": 0.0,
+            "latency_ms_max": 0.0
+        }
+
+    def stats(self):
+        """
+        :return: Dictionary of call counters, error counts by type, latencies and the circuit breaker state.
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+            stats["errors"] = dict(self._stats["errors"])
+        attempts = stats["attempts"]
+        stats["latency_ms_avg"] = round(stats["latency_ms_total"] / attempts, 3) if attempts else None
+        stats["latency_ms_total"] = round(stats["latency_ms_total"], 3)
+        stats["latency_ms_max"] = round(stats["latency_ms_max"], 3)
+        stats["circuit"] = self._breaker.state
+        return stats
+
+    def _headers(self, etag, last_modified, accept=None):
+        """
+        :return: Request headers, with the validators of the cached feed for a conditional request.
+        """
+        headers = {}
+        if accept:
+            headers["Accept"] = accept
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def _start_call(self):
+        """
+        Counts a call and fails it fast while the circuit is open.
+        """
+        self._count("calls")
+        if not self._breaker.allow():
+            self._count("rejected_by_circuit")
+            raise NudlsUnavailable("NUDLS is unavailable, requests to it are suspended for now.")
+
+    def _backoff_delay(self, attempt):
+        """
+        :param attempt: Number of the attempt about to be retried, starting at 1.
+        :return: Seconds to wait before the retry, exponential with full jitter.
+        """
+        self._count("retries")
+        return random.uniform(0, min(self._backoff_max, self._backoff * 2 ** (attempt - 1)))
+
+    def _exhausted(self, last_error):
+        """
+        Records a call that failed on every attempt.
+        :return: The NudlsUnavailable error to raise.
+        """
+        self._count("failures")
+        self._breaker.record_failure()
+        return NudlsUnavailable(f"NUDLS is unavailable after {self._max_retries + 1} attempts: {last_error}")
+
+    def _count(self, key):
+        """
+        Increments a counter.
+        """
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _record_attempt(self, start, error=None):
+        """
+        Records the latency and error, if any, of a single attempt.
+        :param start: Clock reading when the attempt started.
+        :param error: Name of the error the attempt failed with.
+        """
+        latency_ms = (self._clock() - start) * 1000
+        with self._stats_lock:
+            self._stats["attempts"] += 1
+            self._stats["latency_ms_total"] += latency_ms
+            self._stats["latency_ms_max"] = max(self._stats["latency_ms_max"], latency_ms)
+            if error is not None:
+                self._stats["errors"][error] = self._stats["errors"].get(error, 0) + 1
+        if error is not None:
+            dependency_error("nudls", error)
+
+
+class NudlsClient(NudlsClientBase):
+    """
+    Client of the NUDLS feed endpoint.
+
+    Calls share a pooled keep-alive requests.Session, have connect/read timeouts, and are retried a bounded number
+    of times with jittered exponential backoff. A circuit breaker makes calls fail fast while NUDLS is down.
+    """
+
+    def __init__(self, url=NUDLS_URL, pool_size=NUDLS_POOL_SIZE, streaming=NUDLS_STREAMING, sleep=time.sleep, **kwargs):
+        """
+        Constructor.
+        :param url: NUDLS feed endpoint.
+        :param pool_size: Number of keep-alive connections kept in the pool.
+        :param streaming: Whether to parse the feed incrementally while it downloads.
+        :param sleep: Sleep function, injectable for tests.
+        :param kwargs: Timeouts, retry and circuit breaker settings, see NudlsClientBase.
+        """
+        super().__init__(url, **kwargs)
+        self._streaming = streaming
+        self._sleep = sleep
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def fetch_feed(self, etag=None, last_modified=None):
+        """
+        Requests the feed, conditionally when the validators of the cached feed are given.
+        :param etag: ETag of the cached feed.
+        :param last_modified: Last-Modified of the cached feed.
+        :return: The NUDLS response, with status code 304 if the cached feed is still current.
+        """
+        accept = ", ".join(NDJSON_CONTENT_TYPES + ("application/json;q=0.9",)) if self._streaming else None
+        headers = self._headers(etag, last_modified, accept)
+        self._start_call()
+
+        last_error = None
+        for attempt in range(self._max_retries + 1):
+            if attempt:
+                self._sleep(self._backoff_delay(attempt))
+
+            start = self._clock()
+            try:
+                resp = self._session.get(self._url, headers=headers, timeout=(self._connect_timeout, self._read_timeout), stream=self._streaming)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+                self._record_attempt(start, err.__class__.__name__)
+                self._logger.warning(f"NUDLS call attempt {attempt + 1} failed: {err}")
+                last_error = err
+                continue
+            except Exception as err:
+                self._record_attempt(start, err.__class__.__name__)
+                self._breaker.record_failure()
+                raise
+
+            if resp.status_code in RETRYABLE_STATUS_CODES:
+                self._record_attempt(start, f"HTTP {resp.status_code}")
+                self._logger.warning(f"NUDLS call attempt {attempt + 1} failed: HTTP {resp.status_code}")
+                last_error = f"HTTP {resp.status_code}"
+                resp.close()
+                continue
+
+            self._record_attempt(start)
+            if resp.status_code == 304:
+                self._breaker.record_success()
+                self._count("not_modified")
+                resp.close()
+                return resp
+
+            try:
+                resp.raise_for_status()
+            except requests.exceptions.HTTPError:
+                self._breaker.record_success()
+                self._count("failures")
+                resp.close()
+                raise
+            # The call only succeeded once its body is read, see events()
+            return resp
+
+        raise self._exhausted(last_error)
+
+    def events(self, resp):
+        """
+        Reads the body of a successful NUDLS feed response, recording the outcome of the call once it is read.
+        :param resp: A successful NUDLS feed response.
+        :return: Iterable of NUDLS events, parsed incrementally when streaming is enabled.
+        """
+        if self._streaming:
+            return self._iter_events(resp)
+        try:
+            events = resp.json()
+        except Exception as err:
+            self._body_failed(err)
+            raise
+        self._body_read()
+        return events
+
+    def _iter_events(self, resp):
+        """
+        :param resp: A successful NUDLS feed response opened with stream=True.
+        :return: Generator of NUDLS events, recording the outcome of the call once the feed is exhausted.
+        """
+        try:
+            yield from iter_response_events(resp)
+        except Exception as err:
+            self._body_failed(err)
+            raise
+        self._body_read()
+
+    def _body_read(self):
+        """
+        Records a call whose body was read in full.
+        """
+        self._count("successes")
+        self._breaker.record_success()
+
+    def _body_failed(self, err):
+        """
+        Records a call whose body could not be read or parsed, e.g. a connection dropped mid-stream.
+        :param err: The error reading the body failed with.
+        """
+        self._count("failures")
+        with self._stats_lock:
+            self._stats["errors"][err.__class__.__name__] = self._stats["errors"].get(err.__class__.__name__, 0) + 1
+        dependency_error("nudls", err.__class__.__name__)
+        self._breaker.record_failure()
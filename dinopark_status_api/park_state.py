@@ -0,0 +1,294 @@
+"""
+Park state indexes built from a NUDLS feed snapshot.
+
+"""
+
+# System imports
+import sys
+
+# Local imports
+from dinopark_status_api.constants import PARK_STATE_BYTES_PER_ZONE_EVENT, PARK_STATE_BYTES_PER_DINOSAUR
+from dinopark_status_api.timestamps import epoch_day, epoch_millis
+
+
+class Dinosaur:
+    """
+    What the NUDLS feed tells about a dinosaur, as a compact record.
+
+    Times are milliseconds since the epoch, None until the dinosaur has an event of that kind. Records are shared
+    between snapshots: once a snapshot is built they are never modified, the next one updates copies of them.
+    """
+
+    __slots__ = ("species", "herbivore", "digestion_days", "added_at", "removed_at", "fed_at")
+
+    def __init__(self, species=None, herbivore=None, digestion_days=None, added_at=None, removed_at=None, fed_at=None):
+        """
+        Constructor.
+        :param species: Species name, interned so that dinosaurs of the same species share it.
+        :param herbivore: Whether the dinosaur is a herbivore, None if it was never added.
+        :param digestion_days: Digestion period in whole days.
+        :param added_at: Time of the dino_added event the species, diet and digestion period come from.
+        :param removed_at: Time of the latest dino_removed event.
+        :param fed_at: Time of the latest dino_fed event.
+        """
+        self.species = species
+        self.herbivore = herbivore
+        self.digestion_days = digestion_days
+        self.added_at = added_at
+        self.removed_at = removed_at
+        self.fed_at = fed_at
+
+    @property
+    def diet(self):
+        """
+        :return: herbivore or carnivore.
+        """
+        return "herbivore" if self.herbivore else "carnivore"
+
+    def copy(self):
+        """
+        :return: A copy of the record.
+        """
+        return Dinosaur(self.species, self.herbivore, self.digestion_days, self.added_at, self.removed_at, self.fed_at)
+
+    def __eq__(self, other):
+        return isinstance(other, Dinosaur) and all(getattr(self, field) == getattr(other, field) for field in self.__slots__)
+
+    def __repr__(self):
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in self.__slots__)
+        return f"Dinosaur({fields})"
+
+
+class ParkState:
+    """
+    Zone and dinosaur look up tables built once per fetched NUDLS feed.
+
+    Every request against the same feed snapshot shares one ParkState, so answering a zone query is a dictionary
+    look up instead of a scan over the whole feed.
+
+    The tables are filled by a single pass over the events, dispatching each event on its kind. The latest event wins:
+    an event only replaces the entry of its zone or dinosaur when its time is strictly later than the entry's time,
+    so the result does not depend on the order the feed lists the events in, and applying an event twice is a no-op.
+    """
+
+    def __init__(self):
+        """
+        Constructor. Creates an empty park state, events are added with apply().
+        """
+        # Latest maintenance_performed event per zone e.g. {"O4": {...}}
+        self.maintenance_by_zone = {}
+        # Latest dino_location_updated event per zone e.g. {"V16": {...}}
+        self.location_by_zone = {}
+        # Day (since the epoch) of the latest event of each zone table e.g. {"O4": 18661}
+        self.maintenance_day_by_zone = {}
+        self.location_day_by_zone = {}
+        # Dinosaur record per integer id e.g. {1032: Dinosaur(species="Tyrannosaurus rex", ...)}
+        self.dinosaurs = {}
+        # Time of the most recent event applied
+        self.high_water_mark = None
+        # Ids of the dinosaur records created by the apply_all call in progress, which may be modified in place
+        self._owned = set()
+
+    @classmethod
+    def from_events(cls, content, previous=None):
+        """
+        Builds the look up tables from NUDLS feed content.
+        :param content: Iterable of NUDLS events.
+        :param previous: ParkState of the previous snapshot of the same feed. When given, only the events from its
+        high water mark onwards are applied on top of a copy of it, instead of rebuilding from the whole feed.
+        :return: A ParkState instance.
+        """
+        if previous is None:
+            park_state = cls()
+            park_state.apply_all(content)
+            return park_state
+
+        park_state = previous.copy()
+        park_state.apply_all(previous.delta(content))
+        return park_state
+
+    def entries(self, saved=None):
+        """
+        The entries of the look up tables, to be saved one by one (see park_state_store), see from_entries.
+        :param saved: ParkState saved before. When given, only the entries this state does not share with it are
+        returned: tables are only ever added to, and events and dinosaur records are replaced rather than modified.
+        :return: Generator of (table, key, value) tuples, table is maintenance, location or dinosaur.
+        """
+        previous = saved if saved is not None else ParkState()
+        for zone, event in self.maintenance_by_zone.items():
+            if previous.maintenance_by_zone.get(zone) is not event:
+                yield "maintenance", zone, event
+        for zone, event in self.location_by_zone.items():
+            if previous.location_by_zone.get(zone) is not event:
+                yield "location", zone, event
+        for dino_id, dinosaur in self.dinosaurs.items():
+            if previous.dinosaurs.get(dino_id) is not dinosaur:
+                # Each record is a list of its fields
+                yield "dinosaur", str(dino_id), [getattr(dinosaur, field) for field in Dinosaur.__slots__]
+
+    @classmethod
+    def from_entries(cls, entries, high_water_mark):
+        """
+        Rebuilds a park state from the entries returned by entries().
+        :param entries: Iterable of (table, key, value) tuples.
+        :param high_water_mark: Time of the most recent event the entries were built from.
+        :return: A ParkState instance.
+        """
+        park_state = cls()
+        for table, key, value in entries:
+            if table == "maintenance":
+                park_state.maintenance_by_zone[key] = value
+                park_state.maintenance_day_by_zone[key] = epoch_day(value["time"])
+            elif table == "location":
+                park_state.location_by_zone[key] = value
+                park_state.location_day_by_zone[key] = epoch_day(value["time"])
+            elif table == "dinosaur":
+                dinosaur = Dinosaur(*value)
+                if dinosaur.species is not None:
+                    dinosaur.species = sys.intern(dinosaur.species)
+                park_state.dinosaurs[int(key)] = dinosaur
+            else:
+                raise ValueError(f"Unknown park state table: {table}")
+        park_state.high_water_mark = high_water_mark
+        return park_state
+
+    def copy(self):
+        """
+        Copies the look up tables so that new events can be applied without changing a snapshot being served.
+        The events and dinosaur records themselves are shared, they are never modified.
+        :return: A ParkState instance.
+        """
+        park_state = ParkState()
+        park_state.maintenance_by_zone = dict(self.maintenance_by_zone)
+        park_state.location_by_zone = dict(self.location_by_zone)
+        park_state.maintenance_day_by_zone = dict(self.maintenance_day_by_zone)
+        park_state.location_day_by_zone = dict(self.location_day_by_zone)
+        park_state.dinosaurs = dict(self.dinosaurs)
+        park_state.high_water_mark = self.high_water_mark
+        return park_state
+
+    def estimated_bytes(self):
+        """
+        Estimates the memory held by the look up tables from their sizes, in constant time.
+        :return: Estimated bytes.
+        """
+        return ((len(self.maintenance_by_zone) + len(self.location_by_zone)) * PARK_STATE_BYTES_PER_ZONE_EVENT
+                + len(self.dinosaurs) * PARK_STATE_BYTES_PER_DINOSAUR)
+
+    def entry_count(self):
+        """
+        :return: Number of entries of the zone tables and of dinosaur records, see entries().
+        """
+        return len(self.maintenance_by_zone) + len(self.location_by_zone) + len(self.dinosaurs)
+
+    def delta(self, content):
+        """
+        Selects the events not yet applied to this state, i.e. the events at or after its high water mark.
+        Events at the high water mark itself are included since re-applying an event does not change the state.
+        :param content: Iterable of NUDLS events.
+        :return: Generator of NUDLS events.
+        """
+        high_water_mark = self.high_water_mark
+        if high_water_mark is None:
+            return (event for event in content)
+        return (event for event in content if event["time"] >= high_water_mark)
+
+    def apply_all(self, content):
+        """
+        Applies NUDLS events in a single pass.
+        :param content: Iterable of NUDLS events.
+        """
+        handlers = self._HANDLERS
+        try:
+            for event in content:
+                handler = handlers.get(event["kind"])
+                if handler is not None:
+                    handler(self, event)
+
+                if self.high_water_mark is None or event["time"] > self.high_water_mark:
+                    self.high_water_mark = event["time"]
+        finally:
+            # Records may be shared with a copy from now on
+            self._owned = set()
+
+    def apply(self, event):
+        """
+        Applies a single NUDLS event.
+        :param event: NUDLS event.
+        """
+        self.apply_all((event,))
+
+    def _on_maintenance_performed(self, event):
+        """
+        Keeps the latest maintenance of the zone.
+        """
+        current = self.maintenance_by_zone.get(event["location"])
+        if current is None or event["time"] > current["time"]:
+            self.maintenance_by_zone[event["location"]] = event
+            self.maintenance_day_by_zone[event["location"]] = epoch_day(event["time"])
+
+    def _on_dino_location_updated(self, event):
+        """
+        Keeps the latest location update of the zone.
+        """
+        current = self.location_by_zone.get(event["location"])
+        if current is None or event["time"] > current["time"]:
+            self.location_by_zone[event["location"]] = event
+            self.location_day_by_zone[event["location"]] = epoch_day(event["time"])
+
+    def _writable(self, dino_id):
+        """
+        Record of the dinosaur that the current event may modify: copied the first time an apply_all call modifies it,
+        so that records shared with other snapshots are left untouched.
+        :return: A Dinosaur record.
+        """
+        if dino_id in self._owned:
+            return self.dinosaurs[dino_id]
+        dinosaur = self.dinosaurs.get(dino_id)
+        dinosaur = dinosaur.copy() if dinosaur is not None else Dinosaur()
+        self.dinosaurs[dino_id] = dinosaur
+        self._owned.add(dino_id)
+        return dinosaur
+
+    def _on_dino_added(self, event):
+        """
+        Keeps the latest species, diet and digestion time of the dinosaur.
+        """
+        dino_id = int(event["id"])
+        added_at = epoch_millis(event["time"])
+        current = self.dinosaurs.get(dino_id)
+        if current is None or current.added_at is None or added_at > current.added_at:
+            dinosaur = self._writable(dino_id)
+            dinosaur.species = sys.intern(event["species"])
+            dinosaur.herbivore = event["herbivore"] is not False
+            dinosaur.digestion_days = int(event["digestion_period_in_hours"] / 24)  # convert to days
+            dinosaur.added_at = added_at
+
+    def _on_dino_removed(self, event):
+        """
+        Keeps the latest removal time of the dinosaur.
+        """
+        dino_id = int(event["dinosaur_id"])
+        removed_at = epoch_millis(event["time"])
+        current = self.dinosaurs.get(dino_id)
+        if current is None or current.removed_at is None or removed_at > current.removed_at:
+            self._writable(dino_id).removed_at = removed_at
+
+    def _on_dino_fed(self, event):
+        """
+        Keeps the latest fed time of the dinosaur.
+        """
+        dino_id = int(event["dinosaur_id"])
+        fed_at = epoch_millis(event["time"])
+        current = self.dinosaurs.get(dino_id)
+        if current is None or current.fed_at is None or fed_at > current.fed_at:
+            self._writable(dino_id).fed_at = fed_at
+
+    # Event kind to handler dispatch table, unknown kinds are ignored.
+    _HANDLERS = {
+        "maintenance_performed": _on_maintenance_performed,
+        "dino_location_updated": _on_dino_location_updated,
+        "dino_added": _on_dino_added,
+        "dino_removed": _on_dino_removed,
+        "dino_fed": _on_dino_fed,
+    }
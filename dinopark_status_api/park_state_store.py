@@ -0,0 +1,123 @@
+"""
+Park state persisted in MongoDB.
+
+"""
+
+# System imports
+import logging
+import re
+import time
+
+# Third-party imports
+from pymongo import ReplaceOne
+
+# Local imports
+from dinopark_status_api.constants import LOGGER, PARK_STATE_SAVE_BATCH
+from dinopark_status_api.metrics import dependency_error
+from dinopark_status_api.park_state import ParkState
+
+# Version of the layout of the saved documents, a park state saved with another layout is not loaded
+_FORMAT = 2
+
+
+class ParkStateStore:
+    """
+    Saves the park state built from a NUDLS feed in MongoDB, so that a restarted process resumes from it instead of
+    rebuilding the state from the whole feed.
+
+    Every zone table entry and dinosaur record is a document of its own, so no document grows with the park (MongoDB
+    documents are limited to 16 MB), and each save only upserts the entries changed since the previous one. A header
+    document holds the feed's high water mark and validators, it is written last: a save interrupted half way leaves
+    entries newer than the header's high water mark, which the events applied on top of the loaded state replace
+    with the same values.
+
+    Errors are logged and counted, the feed cache keeps working from NUDLS alone.
+    """
+
+    def __init__(self, collection, feed_id, clock=time.time, batch_size=PARK_STATE_SAVE_BATCH):
+        """
+        Constructor.
+        :param collection: MongoDB collection the park state is saved in.
+        :param feed_id: Identifier of the NUDLS feed, e.g. its URL, used as the _id of the header document and the
+        prefix of the _id of the entries.
+        :param clock: Wall clock returning seconds since the epoch, injectable for tests.
+        :param batch_size: Maximum number of entries upserted by one bulk write.
+        """
+        self._collection = collection
+        self._feed_id = feed_id
+        self._clock = clock
+        self._batch_size = batch_size
+        self._logger = logging.getLogger(LOGGER)
+        # Park state saved or loaded last, the next save only writes the entries changed since
+        self._saved = None
+
+    def load(self):
+        """
+        Loads the saved park state.
+        :return: Tuple of the ParkState, the ETag and Last-Modified validators of the feed it was built from and the
+        seconds since it was saved, or None if there is no saved state or it can't be read.
+        """
+        try:
+            header = self._collection.find_one({"_id": self._feed_id})
+            if header is None or header.get("format") != _FORMAT:
+                return None
+            documents = self._collection.find({"_id": {"$regex": "^" + re.escape(self._entry_id(""))}})
+            park_state = ParkState.from_entries(((document["table"], document["key"], document["value"]) for document in documents),
+                                                header["high_water_mark"])
+            if park_state.entry_count() < header["entries"]:
+                raise ValueError(f"{header['entries'] - park_state.entry_count()} entries are missing.")
+        except Exception as err:  # pylint: disable=broad-except
+            self._logger.error(f"Could not load the park state: {err}")
+            dependency_error("mongo", err.__class__.__name__)
+            return None
+        self._saved = park_state
+        age = max(self._clock() - header["saved_at"], 0.0)
+        return park_state, header.get("etag"), header.get("last_modified"), age
+
+    def save(self, park_state, etag=None, last_modified=None):
+        """
+        Saves a park state, upserting the entries changed since the park state saved or loaded last.
+        :param park_state: ParkState built from the feed.
+        :param etag: ETag of the feed response the park state was built from.
+        :param last_modified: Last-Modified of the feed response the park state was built from.
+        :return: Whether the park state was saved.
+        """
+        try:
+            batch = []
+            for table, key, value in park_state.entries(self._saved):
+                entry_id = self._entry_id(f"{table}:{key}")
+                batch.append(ReplaceOne({"_id": entry_id}, {"_id": entry_id, "table": table, "key": key, "value": value}, upsert=True))
+                if len(batch) == self._batch_size:
+                    self._collection.bulk_write(batch, ordered=False)
+                    batch = []
+            if batch:
+                self._collection.bulk_write(batch, ordered=False)
+            header = {
+                "format": _FORMAT,
+                "high_water_mark": park_state.high_water_mark,
+                "entries": park_state.entry_count(),
+                "etag": etag,
+                "last_modified": last_modified,
+                "saved_at": self._clock()
+            }
+            self._collection.replace_one({"_id": self._feed_id}, header, upsert=True)
+        except Exception as err:  # pylint: disable=broad-except
+            # The entries written so far are written again by the next save
+            self._logger.error(f"Could not save the park state: {err}")
+            dependency_error("mongo", err.__class__.__name__)
+            return False
+        self._saved = park_state
+        return True
+
+    def forget(self):
+        """
+        Drops the park state saved or loaded last to free its memory, e.g. when the feed cache unloads it. The next
+        save writes every entry again, unless a load comes first.
+        """
+        self._saved = None
+
+    def _entry_id(self, entry):
+        """
+        :return: _id of the document of an entry of the park state.
+        """
+        return f"{self._feed_id}|{entry}"
@@ -0,0 +1,102 @@
+"""
+Whole-park status, computed once per NUDLS feed snapshot and calendar day.
+
+"""
+
+# System imports
+import hashlib
+import json
+import threading
+
+# Local imports
+from dinopark_status_api.constants import PARK_ZONES
+from dinopark_status_api.metrics import phase
+from dinopark_status_api.status import STATUS_FUNCTIONS, batch_status
+from dinopark_status_api.timestamps import epoch_day_of_date, today_iso
+
+
+class ParkStatusCache:
+    """
+    Maintenance and safety statuses of every zone of the park, encoded once and served from memory.
+
+    The statuses only depend on the feed snapshot and on today's date, so the encoded response is rebuilt only
+    when the feed cache swaps in a new snapshot or the date changes. The response body only holds data derived
+    from those two, so its strong ETag (a hash of the body) is the same in every process serving the same feed.
+    """
+
+    def __init__(self, zones=PARK_ZONES, today=today_iso):
+        """
+        Constructor.
+        :param zones: Zone identifiers of the park.
+        :param today: Function returning today's date as YYYY-MM-DD, injectable for tests.
+        """
+        self._zones = zones
+        self._today = today
+        self._lock = threading.Lock()
+        self._key = None
+        self._body = None
+        self._etag = None
+
+    def get(self, park_state):
+        """
+        :param park_state: ParkState of the current NUDLS feed snapshot.
+        :return: Tuple of the encoded JSON response body and its ETag.
+        """
+        key = (park_state, self._today())
+        with self._lock:
+            # Compare the snapshot by identity, a refreshed feed is always a new ParkState
+            if self._key is None or self._key[0] is not key[0] or self._key[1] != key[1]:
+                self._body = self._encode(park_state, key[1])
+                self._etag = hashlib.sha1(self._body).hexdigest()
+                self._key = key
+            return self._body, self._etag
+
+    def estimated_bytes(self):
+        """
+        :return: Estimated bytes held by the encoded response.
+        """
+        with self._lock:
+            return len(self._body) if self._body is not None else 0
+
+    def clear(self):
+        """
+        Forgets the encoded response, and the snapshot it was computed from so that it can be freed.
+        """
+        with self._lock:
+            self._key = None
+            self._body = None
+            self._etag = None
+
+    def _encode(self, park_state, today):
+        """
+        :return: The encoded JSON response body.
+        """
+        with phase("algorithm"):
+            results, _ = batch_status(park_state, self._zones, list(STATUS_FUNCTIONS), day=epoch_day_of_date(today))
+        with phase("serialize"):
+            return json.dumps({
+                "date": today,
+                "feed_time": park_state.high_water_mark,
+                "results": results
+            }, sort_keys=True, separators=(",", ":")).encode("utf-8")
+
+
+def etag_matches(if_none_match, etag):
+    """
+    :param if_none_match: Value of the If-None-Match request header, None if absent.
+    :param etag: ETag of the current representation, without quotes.
+    :return: Whether the client's cached representation is current, i.e. a 304 Not Modified can be answered.
+    """
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        # Any current representation matches, see RFC 7232
+        if tag == "*":
+            return True
+        # Weak comparison, as for GET requests: the weakness indicator is ignored
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"') == etag:
+            return True
+    return False
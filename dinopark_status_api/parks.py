@@ -0,0 +1,301 @@
+"""
+Parks served by one process: their configuration, the caches and collections of each, and the memory their NUDLS feed
+snapshots hold.
+
+"""
+
+# System imports
+import logging
+import os
+import re
+import threading
+import time
+
+# Local imports
+from dinopark_status_api.constants import LOGGER, COLLECTION_NAME, PARK_STATE_COLLECTION_NAME, FEED_POLL_INTERVAL_SECONDS, \
+    PARK_NAME_PATTERN, PARK_MEMORY_BUDGET_BYTES, PARKS_MEMORY_BUDGET_BYTES, PARK_IDLE_SECONDS, WRITE_BEHIND_SPILL_PATH
+from dinopark_status_api.event_store import EventStore
+from dinopark_status_api.feed_cache import FeedCache
+from dinopark_status_api.history import upsert_requests
+from dinopark_status_api.metrics import REGISTRY
+from dinopark_status_api.nudls_client import NudlsClient
+from dinopark_status_api.park_state_store import ParkStateStore
+from dinopark_status_api.park_status import ParkStatusCache
+from dinopark_status_api.status_cache import StatusCache
+from dinopark_status_api.status_stream import StatusStream
+from dinopark_status_api.structured_logging import log_event
+from dinopark_status_api.write_behind import WriteBehindQueue
+
+_PARK_NAME = re.compile(PARK_NAME_PATTERN)
+
+# Routes of the API a park name would shadow
+RESERVED_PARK_NAMES = frozenset(["ready", "metrics"])
+
+PARK_EVICTIONS = REGISTRY.counter("dinopark_park_evictions_total", "Parks whose feed snapshot was evicted from memory.", ("park", "reason"))
+
+
+class Park:
+    """
+    Configuration of a park: its NUDLS feed, its MongoDB collections, how often its feed is refreshed and how much
+    memory its feed snapshot may hold.
+    """
+
+    def __init__(self, name, nudls_url, collection_name=None, park_state_collection_name=None, poll_interval=FEED_POLL_INTERVAL_SECONDS,
+                 memory_budget=PARK_MEMORY_BUDGET_BYTES):
+        """
+        Constructor.
+        :param name: Name of the park, the first segment of its routes, e.g. isla-nublar.
+        :param nudls_url: NUDLS feed endpoint of the park.
+        :param collection_name: MongoDB collection of the park's statuses. Defaults to the status collection suffixed with
+        the park name.
+        :param park_state_collection_name: MongoDB collection the park state is saved in. Defaults to the park state
+        collection suffixed with the park name.
+        :param poll_interval: Seconds between background refreshes of the park's feed while the park is in use, None to
+        refresh it on requests once it expires.
+        :param memory_budget: Estimated bytes the park's snapshot may hold, see ParkRegistry.
+        """
+        if not _PARK_NAME.fullmatch(name) or name in RESERVED_PARK_NAMES:
+            raise ValueError(f"Invalid park name: {name}. Use lowercase letters, digits, - and _.")
+        self.name = name
+        self.nudls_url = nudls_url
+        self.collection_name = collection_name or f"{COLLECTION_NAME}_{name}"
+        self.park_state_collection_name = park_state_collection_name or f"{PARK_STATE_COLLECTION_NAME}_{name}"
+        self.poll_interval = poll_interval
+        self.memory_budget = memory_budget
+
+    def __repr__(self):
+        return f"Park({self.name!r}, {self.nudls_url!r})"
+
+
+class ParkServices:
+    """
+    The caches, queue and collections serving one park, none of them shared with another park.
+    """
+
+    def __init__(self, park, database, feed_cache=None, write_behind=None, spill_path=None):
+        """
+        Constructor.
+        :param park: The Park.
+        :param database: MongoDB database of the park's collections.
+        :param feed_cache: The park's NUDLS feed cache. Defaults to a new FeedCache of the park's feed, saving its park state
+        in the park's park state collection.
+        :param write_behind: The queue status documents are stored in the park's collection through. Defaults to a new
+        WriteBehindQueue upserting statuses by key.
+        :param spill_path: Path prefix of the spill files of the write-behind queue. Defaults to one per park.
+        """
+        self.park = park
+        self.collection = database[park.collection_name]
+        if feed_cache is None:
+            feed_cache = FeedCache(client=NudlsClient(url=park.nudls_url),
+                                   store=ParkStateStore(database[park.park_state_collection_name], park.nudls_url))
+        self.feed_cache = feed_cache
+        if write_behind is None:
+            if spill_path is None:
+                root, extension = os.path.splitext(WRITE_BEHIND_SPILL_PATH)
+                spill_path = f"{root}_{park.name}{extension}"
+            write_behind = WriteBehindQueue(self.collection, spill_path=spill_path, to_requests=upsert_requests)
+        self.write_behind = write_behind
+        self.status_cache = StatusCache()
+        self.park_status_cache = ParkStatusCache()
+        self.event_store = EventStore()
+        self.status_stream = StatusStream()
+        feed_cache.add_listener(self.status_stream.on_snapshot)
+        feed_cache.add_events_listener(self.event_store.on_feed, self.event_store.wants_events)
+        # Estimated bytes of the current snapshot, see ParkState.estimated_bytes
+        self._snapshot_bytes = 0
+        feed_cache.add_listener(self._on_snapshot)
+
+    def load(self):
+        """
+        Starts refreshing the park's feed in the background, if it has a refresh schedule.
+        """
+        if self.park.poll_interval:
+            self.feed_cache.start_polling(self.park.poll_interval)
+
+    def unload(self):
+        """
+        Frees the memory of the park: stops refreshing its feed and drops its snapshot, the statuses computed from it
+        and the events kept for time travel. The next request loads the snapshot again.
+        """
+        self.feed_cache.unload()
+        self._snapshot_bytes = 0
+        self.status_cache.clear()
+        self.park_status_cache.clear()
+        self.status_stream.clear()
+        self.event_store.clear()
+
+    def loaded(self):
+        """
+        :return: Whether the park holds a snapshot of its feed.
+        """
+        return self.feed_cache.loaded()
+
+    def estimated_bytes(self):
+        """
+        Estimates the memory held by the park: its snapshot, the events and park states kept for time travel, and the
+        cached statuses. Each is estimated from its size, in constant time.
+        :return: Estimated bytes.
+        """
+        return (self._snapshot_bytes + self.event_store.estimated_bytes() + self.status_cache.estimated_bytes()
+                + self.park_status_cache.estimated_bytes())
+
+    def busy(self):
+        """
+        :return: Whether the park is in use without sending requests, i.e. someone is subscribed to its status stream.
+        """
+        return self.status_stream.stats()["subscribers"] > 0
+
+    def _on_snapshot(self, park_state):
+        """
+        Listener of the park's feed cache: estimates the size of the new snapshot.
+        """
+        self._snapshot_bytes = park_state.estimated_bytes()
+
+
+class ParkRegistry:
+    """
+    The parks served by the process, and the memory they hold.
+
+    Parks are loaded on demand: a park's feed is only fetched, and refreshed on its schedule, once the park is used.
+    The memory held by each park, its snapshot and everything built from it (see ParkServices.estimated_bytes), is
+    estimated and the budgets are enforced after every request to a park and every time a snapshot is swapped in:
+    - a park over its own budget is evicted as soon as it is idle,
+    - past the budget of the process, the idle parks are evicted, least recently used first.
+    A park is idle once it has not been used for idle_seconds and no one is subscribed to its status stream. The
+    parks in use are never evicted, so the budgets can be exceeded while they are.
+    """
+
+    def __init__(self, parks, memory_budget=PARKS_MEMORY_BUDGET_BYTES, idle_seconds=PARK_IDLE_SECONDS, clock=time.monotonic):
+        """
+        Constructor.
+        :param parks: Iterable of Park.
+        :param memory_budget: Estimated bytes every park may hold.
+        :param idle_seconds: Seconds without a request after which a park is idle.
+        :param clock: Monotonic clock returning seconds, injectable for tests.
+        """
+        self._parks = {}
+        for park in parks:
+            if park.name in self._parks:
+                raise ValueError(f"Park {park.name} is configured twice.")
+            self._parks[park.name] = park
+        self._memory_budget = memory_budget
+        self._idle_seconds = idle_seconds
+        self._clock = clock
+        self._logger = logging.getLogger(LOGGER)
+
+        # All state below is guarded by the lock.
+        self._lock = threading.Lock()
+        # Park name: ParkServices, once attached
+        self._services = {}
+        # Park name: clock reading of its latest use
+        self._last_used = {}
+        self._stats = {
+            "evictions": 0
+        }
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """
+        Builds a registry from a dictionary, e.g. read from a JSON configuration.
+        :param config: Dictionary of park name to the keyword arguments of its Park, e.g. {"isla-nublar": {"nudls_url": "..."}}
+        :param kwargs: Budget and idle settings, see the constructor.
+        :return: A ParkRegistry.
+        """
+        return cls([Park(name, **settings) for name, settings in config.items()], **kwargs)
+
+    def __iter__(self):
+        """
+        :return: Iterator of the Park of each park, in configuration order.
+        """
+        return iter(list(self._parks.values()))
+
+    def __len__(self):
+        return len(self._parks)
+
+    def attach(self, services):
+        """
+        Registers the services of a park, so that its memory is accounted for and it can be loaded and evicted.
+        :param services: ParkServices of a park of the registry.
+        """
+        name = services.park.name
+        if name not in self._parks:
+            raise ValueError(f"Park {name} is not in the registry.")
+        with self._lock:
+            self._services[name] = services
+        services.feed_cache.add_listener(self._on_snapshot)
+
+    def use(self, name):
+        """
+        Marks a park used now, loading it if needed. The budgets are enforced once the request is done, see enforce.
+        :param name: Name of an attached park.
+        """
+        with self._lock:
+            self._last_used[name] = self._clock()
+            services = self._services[name]
+        services.load()
+
+    def enforce(self):
+        """
+        Evicts the idle parks over their budget, then the least recently used idle parks while every park is over the
+        budget of the process.
+        :return: List of the names of the parks evicted.
+        """
+        now = self._clock()
+        with self._lock:
+            services = dict(self._services)
+        # Sizes and streams are read outside of the lock, a park whose stream is subscribed to is kept
+        loaded_bytes = {name: park_services.estimated_bytes() for name, park_services in services.items() if park_services.loaded()}
+        busy = {name for name in loaded_bytes if services[name].busy()}
+
+        with self._lock:
+            total = sum(loaded_bytes.values())
+            idle = sorted((self._last_used.get(name, float("-inf")), name) for name in loaded_bytes
+                          if name not in busy and now - self._last_used.get(name, float("-inf")) >= self._idle_seconds)
+            evicted = []
+            for _, name in idle:
+                if loaded_bytes[name] > self._parks[name].memory_budget:
+                    evicted.append((name, "park_budget"))
+                    total -= loaded_bytes[name]
+            for _, name in idle:
+                if total <= self._memory_budget:
+                    break
+                if (name, "park_budget") not in evicted:
+                    evicted.append((name, "process_budget"))
+                    total -= loaded_bytes[name]
+            self._stats["evictions"] += len(evicted)
+
+        for name, reason in evicted:
+            services[name].unload()
+            PARK_EVICTIONS.inc(name, reason)
+            log_event(self._logger, logging.INFO, "park_evicted", park=name, reason=reason, memory_bytes=loaded_bytes[name])
+        return [name for name, _ in evicted]
+
+    def stats(self):
+        """
+        :return: Dictionary of the eviction counter, the estimated bytes held by the parks and the budget of the
+        process, and per park whether it holds a snapshot, its estimated bytes, its budget and seconds since its latest use.
+        """
+        now = self._clock()
+        with self._lock:
+            services = dict(self._services)
+        loaded_bytes = {name: park_services.estimated_bytes() for name, park_services in services.items() if park_services.loaded()}
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_bytes"] = sum(loaded_bytes.values())
+            stats["memory_budget"] = self._memory_budget
+            stats["parks"] = {
+                name: {
+                    "loaded": name in loaded_bytes,
+                    "memory_bytes": loaded_bytes.get(name, 0),
+                    "memory_budget": park.memory_budget,
+                    "idle_seconds": round(now - self._last_used[name], 3) if name in self._last_used else None
+                }
+                for name, park in self._parks.items()
+            }
+            return stats
+
+    def _on_snapshot(self, park_state):  # pylint: disable=unused-argument
+        """
+        Listener of the parks' feed caches: enforces the budgets with the new snapshot accounted for.
+        """
+        self.enforce()
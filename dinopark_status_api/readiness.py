@@ -0,0 +1,86 @@
+"""
+Readiness of the process to serve traffic.
+
+"""
+
+# System imports
+import logging
+import threading
+import time
+
+# Local imports
+from dinopark_status_api.constants import LOGGER, READINESS_RETRY_SECONDS
+
+
+class Readiness:
+    """
+    Start up work the process needs before it serves traffic, and whether it is done.
+
+    Slow start up tasks, e.g. creating the MongoDB indexes, run in background threads instead of delaying the start
+    of the process, so that the health endpoint answers right away. The readiness endpoint reports the process ready
+    once every task succeeded and every check passes, e.g. the NUDLS feed has been loaded.
+    """
+
+    def __init__(self, retry_interval=READINESS_RETRY_SECONDS):
+        """
+        Constructor.
+        :param retry_interval: Seconds between attempts of a failed task.
+        """
+        self._retry_interval = retry_interval
+        self._logger = logging.getLogger(LOGGER)
+        self._lock = threading.Lock()
+        self._done = threading.Condition(self._lock)
+        self._tasks = {}
+        self._checks = {}
+
+    def start(self, name, task):
+        """
+        Runs a start up task in a daemon thread, again every retry interval until it succeeds.
+        Starting a task that is already started does nothing.
+        :param name: Name of the task, reported by status.
+        :param task: Callable returning whether it succeeded.
+        """
+        with self._lock:
+            if name in self._tasks:
+                return
+            self._tasks[name] = False
+        threading.Thread(target=self._run, args=(name, task), name=f"startup-{name}", daemon=True).start()
+
+    def add_check(self, name, check):
+        """
+        Adds a condition evaluated on every status call.
+        :param name: Name of the check, reported by status.
+        :param check: Callable returning whether the condition is met.
+        """
+        with self._lock:
+            self._checks[name] = check
+
+    def status(self):
+        """
+        :return: Tuple of whether the process is ready and a dictionary of whether each task and check passed.
+        """
+        with self._lock:
+            results = dict(self._tasks)
+            checks = dict(self._checks)
+        results.update({name: bool(check()) for name, check in checks.items()})
+        return all(results.values()), results
+
+    def wait(self, timeout=None):
+        """
+        Waits for every start up task to succeed.
+        :param timeout: Maximum seconds to wait, None to wait forever.
+        :return: Whether every task succeeded.
+        """
+        with self._done:
+            return self._done.wait_for(lambda: all(self._tasks.values()), timeout)
+
+    def _run(self, name, task):
+        """
+        Body of a task thread.
+        """
+        while not task():
+            self._logger.error(f"Start up task {name} failed, retrying in {self._retry_interval} seconds")
+            time.sleep(self._retry_interval)
+        with self._done:
+            self._tasks[name] = True
+            self._done.notify_all()
@@ -5,17 +5,54 @@ API resource mapped to REST routes.
 
 # System imports
 import logging
-import requests
-import time
-from datetime import datetime, timedelta
-from werkzeug.exceptions import BadRequest
+import threading
 
 # Third-party imports
-from flask import make_response, jsonify
-from flask_restful import Resource, reqparse
+from flask import Response, make_response, request
+from flask_restful import Resource
+from werkzeug.exceptions import BadRequest
 
 # Local imports
-from dinopark_status_api.constants import LOGGER, NUDLS_URL
+from dinopark_status_api.constants import LOGGER
+from dinopark_status_api.event_store import parse_as_of, status_as_of
+from dinopark_status_api.history import status_document, history_query, history_page, HISTORY_SORT
+from dinopark_status_api.json_encoder import dumps, add_field
+from dinopark_status_api.metrics import REGISTRY, CONTENT_TYPE, phase
+from dinopark_status_api.status import parse_zone, parse_batch, batch_status
+from dinopark_status_api.status_stream import CONTENT_TYPE as STREAM_CONTENT_TYPE, event_stream, parse_stream_filter
+from dinopark_status_api.structured_logging import log_event
+
+
+def json_response(data, code=200, headers=None):
+    """
+    Makes a Flask response with a JSON body, also used by the API for the bodies returned by resources and for errors.
+    :param data: JSON-serializable body, or an already encoded one.
+    :param code: HTTP status code.
+    :param headers: Extra response headers.
+    :return: The Flask response.
+    """
+    with phase("serialize"):
+        response = make_response(data if isinstance(data, bytes) else dumps(data) + b"\n", code)
+    response.content_type = "application/json"
+    response.headers.extend(headers or {})
+    return response
+
+
+def status_as_of_response(status_type, zone, as_of, feed_cache, event_store):
+    """
+    Makes the response of a status request asking for the status as of a past instant.
+    :param status_type: Name of the status, see status.STATUS_FUNCTIONS.
+    :param zone: Validated zone identifier.
+    :param as_of: The as_of argument of the request, see event_store.parse_as_of.
+    :param feed_cache: The NUDLS feed cache, whose snapshot tells whether the event store is behind the feed and
+    whose events listener the event store is.
+    :param event_store: The EventStore the park state as of the instant is rebuilt from.
+    :return: The Flask response.
+    """
+    millis = parse_as_of(as_of)
+    park_state = feed_cache.get()
+    event_store.sync(feed_cache, park_state.high_water_mark)
+    return json_response(status_as_of(status_type, event_store.state_at(millis), zone, millis))
 
 
 class Health(Resource):
@@ -23,17 +60,105 @@ class Health(Resource):
     The health check endpoint.
     """
 
+    def __init__(self, **kwargs):
+        """
+        Constructor.
+        :param kwargs: key word args sent from the main API package.
+
+        """
+        # feed cache, write-behind queue, status cache and event store objects passed from the main API package.
+        self._feed_cache = kwargs["feed_cache"]
+        self._write_behind = kwargs["write_behind"]
+        self._status_cache = kwargs["status_cache"]
+        self._event_store = kwargs["event_store"]
+
+    def get(self):
+        """
+        :return: The response containing status of API, the NUDLS feed cache counters, the NUDLS client metrics, the
+        MongoDB write-behind queue metrics, the status cache counters and the event store counters.
+        """
+        return json_response({
+            "status": {
+                "code": 200,
+                "info": "Welcome to Dino Park Status API!",
+                "status": "SUCCESS",
+            },
+            "feed_cache": self._feed_cache.stats(),
+            "nudls": self._feed_cache.client.stats(),
+            "write_behind": self._write_behind.stats(),
+            "status_cache": self._status_cache.stats(),
+            "event_store": self._event_store.stats()
+        })
+
+
+class Parks(Resource):
+    """
+    The health check endpoint of a process serving several parks, each park has its own under its path.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Constructor.
+        :param kwargs: key word args sent from the main API package.
+
+        """
+        # park registry object passed from the main API package.
+        self._parks = kwargs["parks"]
+
     def get(self):
         """
-        :return: The response containing status of API.
+        :return: The response containing status of API and the memory held by the parks, per park and in total.
         """
-        return make_response(jsonify({
+        return json_response({
             "status": {
                 "code": 200,
                 "info": "Welcome to Dino Park Status API!",
                 "status": "SUCCESS",
-            }
-        }))
+            },
+            "parks": self._parks.stats()
+        })
+
+
+class Ready(Resource):
+    """
+    The readiness check endpoint.
+
+    Unlike the health check, it answers 503 until the start up work of the process is done, e.g. the MongoDB indexes
+    are created and the NUDLS feed is loaded.
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Constructor.
+        :param kwargs: key word args sent from the main API package.
+
+        """
+        # readiness object passed from the main API package.
+        self._readiness = kwargs["readiness"]
+
+    def get(self):
+        """
+        :return: The response containing whether the process is ready and the state of each start up task and check.
+        """
+        ready, checks = self._readiness.status()
+        return json_response({"ready": ready, "checks": checks}, 200 if ready else 503)
+
+
+class Metrics(Resource):
+    """
+    The metrics endpoint, in the Prometheus text format.
+
+    Metrics are kept per process: with several worker processes, each scrape is answered by one of them.
+    """
+
+    def get(self):
+        """
+        :return: The response containing the request latencies by route and phase, the requests in flight, the
+        errors of the calls to NUDLS and MongoDB, the age of the NUDLS feed and the write-behind queue depth.
+        """
+        response = make_response(REGISTRY.render())
+        response.content_type = CONTENT_TYPE
+        return response
 
 
 class StatusMaintenance(Resource):
@@ -51,89 +176,194 @@ class StatusMaintenance(Resource):
         :param kwargs: key word args sent from the main API package.
 
         """
-        # collection object passed from the main API package.
-        self._collection = kwargs["collection"]
+        # write-behind queue of the status collection, feed cache, status cache and event store objects passed from the main API package.
+        self._write_behind = kwargs["write_behind"]
+        self._feed_cache = kwargs["feed_cache"]
+        self._status_cache = kwargs["status_cache"]
+        self._event_store = kwargs["event_store"]
         self._logger = logging.getLogger(LOGGER)
-        self._parser = reqparse.RequestParser()
-        self._parser.add_argument("zone", type=str, help="Provide a zone number", location="args", required=True)
 
     def get(self):
         """
+        The status as of a past instant is given with as_of (ISO 8601 date or time, UTC), e.g. ?zone=A1&as_of=2021-02-03
         :return: A JSON response containing zone maintenance status for a given zone identifier.
         """
-        # Parse query arguments
-        args = self._parser.parse_args()
-        query = dict(args)
-        zone = query["zone"]
+        # Validate the zone first, malformed zones are rejected before the feed is read
+        zone = parse_zone(request.args.get("zone"))
+
+        as_of = request.args.get("as_of")
+        if as_of is not None:
+            return status_as_of_response("maintenance", zone, as_of, self._feed_cache, self._event_store)
+
+        # Retrieve park state built from NUDLS logs, served from the shared feed cache
+        park_state, snapshot_age = self._feed_cache.get_with_age()
+
+        # Maintenance status of the zone, computed only once per feed version and day - zone will be a partition key inside document DB
+        body, result, key, computed = self._status_cache.get_encoded("maintenance", park_state, zone)
+
+        # Queue newly computed status results to be upserted into MongoDB in the background
+        if computed:
+            self._write_behind.put([status_document(result, key)])
+
+        log_event(self._logger, logging.DEBUG, "status_request", status_type="maintenance", zone=zone, computed=computed)
+
+        # Let clients know how fresh the answer is, added to the cached encoding of the result
+        return json_response(add_field(body, "snapshot_age_seconds", round(snapshot_age, 3)))
+
+
+class StatusSafety(Resource):
+    """
+    End-point for providing the zone safety status in Dino Park for a given zone identifier.
+
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Constructor.
+        :param kwargs: key word args sent from the main API package.
+
+        """
+        # write-behind queue of the status collection, feed cache, status cache and event store objects passed from the main API package.
+        self._write_behind = kwargs["write_behind"]
+        self._feed_cache = kwargs["feed_cache"]
+        self._status_cache = kwargs["status_cache"]
+        self._event_store = kwargs["event_store"]
+        self._logger = logging.getLogger(LOGGER)
+
+    def get(self):
+        """
+        The status as of a past instant is given with as_of (ISO 8601 date or time, UTC), e.g. ?zone=A1&as_of=2021-02-03
+        :return: A JSON response containing zone safety status for a given zone identifier.
+        """
+        # Validate the zone first, malformed zones are rejected before the feed is read
+        zone = parse_zone(request.args.get("zone"))
+
+        as_of = request.args.get("as_of")
+        if as_of is not None:
+            return status_as_of_response("safety", zone, as_of, self._feed_cache, self._event_store)
+
+        # Retrieve park state built from NUDLS logs, served from the shared feed cache
+        park_state, snapshot_age = self._feed_cache.get_with_age()
+
+        # Safety status of the zone, computed only once per feed version and day - zone will be a partition key inside document DB
+        body, result, key, computed = self._status_cache.get_encoded("safety", park_state, zone)
+
+        # Queue newly computed status results to be upserted into MongoDB in the background
+        if computed:
+            self._write_behind.put([status_document(result, key)])
+
+        log_event(self._logger, logging.DEBUG, "status_request", status_type="safety", zone=zone, computed=computed)
+
+        # Let clients know how fresh the answer is, added to the cached encoding of the result
+        return json_response(add_field(body, "snapshot_age_seconds", round(snapshot_age, 3)))
 
-        # Retrieve logs from NUDLS monitoring system
-        try:
-            resp = requests.get(NUDLS_URL)
-            resp.raise_for_status()
-        except requests.exceptions.HTTPError as err:
-            self._logger.error(err)
-            raise
 
-        # Retrieve content of the logs
-        content = resp.json()
+class StatusBatch(Resource):
+    """
+    End-point for providing the maintenance and safety statuses of many zones at once.
 
-        # Retrieve maintenance performed date by filtering logs
-        maintenance_log = [entry for entry in content if entry["kind"] == "maintenance_performed"]
+    All zones are answered from the same NUDLS feed snapshot, and newly computed statuses are stored with a single bulk write. A zone that is not
+    in the NUDLS logs gets an error in place of its status instead of failing the whole batch.
 
-        # Check if zone exists in the logs
-        locations = [entry["location"] for entry in maintenance_log]
-        if zone not in locations:
-            raise BadRequest(f"Zone: {zone} is not available from NUDLS logs currently.")
+    """
 
-        # Filter document by given zone location
-        filter_by_zone = [entry for entry in maintenance_log if entry["location"] == zone][0]
+    def __init__(self, **kwargs):
+        """
+        Constructor.
+        :param kwargs: key word args sent from the main API package.
 
-        # Retrieve today's date and maintenance date
-        today = time.strftime("%Y-%m-%d")
-        maintenance_date = filter_by_zone["time"]
-        maintenance_date = datetime.strptime(maintenance_date, "%Y-%m-%dT%H:%M:%S.%fZ").strftime("%Y-%m-%d")
+        """
+        # write-behind queue of the status collection, feed cache and status cache objects passed from the main API package.
+        self._write_behind = kwargs["write_behind"]
+        self._feed_cache = kwargs["feed_cache"]
+        self._status_cache = kwargs["status_cache"]
+        self._logger = logging.getLogger(LOGGER)
 
-        # Convert to datetime object
-        date_obj_1 = datetime.strptime(today, "%Y-%m-%d")
-        date_obj_2 = datetime.strptime(maintenance_date, "%Y-%m-%d")
+    def get(self):
+        """
+        Zones and statuses are given as comma separated query arguments, e.g. ?zones=A1,A2&statuses=safety
+        :return: A JSON response containing the statuses of each zone.
+        """
+        return self._batch(request.args.get("zones", ""), request.args.get("statuses"))
 
-        # Calculate the difference in days
-        date_diff = (date_obj_1 - date_obj_2).days
+    def post(self):
+        """
+        Zones and statuses are given as lists in a JSON body, e.g. {"zones": ["A1", "A2"], "statuses": ["safety"]}
+        :return: A JSON response containing the statuses of each zone.
+        """
+        body = request.get_json(silent=True)
+        if not isinstance(body, dict):
+            raise BadRequest("Provide a JSON object with the zones.")
+        return self._batch(body.get("zones"), body.get("statuses"))
 
-        # Decide whether maintenance is required or not
-        if date_diff < 30:
-            maintenance_status = f"Maintenance is not required. Currently {date_diff} days after last maintenance performed."
-            maintenance_required = 0
-        elif date_diff == 30:
-            maintenance_status = f"Maintenance is not required, but maintenance will be required from tomorrow."
-            maintenance_required = 0
-        else:
-            maintenance_status = f"Maintenance is required. Currently {date_diff} days after last maintenance performed."
-            maintenance_required = 1
+    def _batch(self, zones, statuses):
+        """
+        Returns the statuses of the given zones, storing the newly computed ones.
+        :param zones: Zone identifiers, see parse_batch.
+        :param statuses: Status names, see parse_batch.
+        :return: A JSON response containing the statuses of each zone.
+        """
+        zones, statuses = parse_batch(zones, statuses)
 
-        # Final response body of the API - zone will be a partition key inside document DB
-        result = {
-            "zone": zone,
-            "maintenance_required": maintenance_required,
-            "info": maintenance_status
-        }
+        # One park state for the whole batch, served from the shared feed cache
+        park_state, snapshot_age = self._feed_cache.get_with_age()
+        results, computed = batch_status(park_state, zones, statuses, self._status_cache)
+        documents = [status_document(result, key) for key, result in computed]
+        for result in results:
+            for status in statuses:
+                if "status" not in result[status]:
+                    result[status]["snapshot_age_seconds"] = round(snapshot_age, 3)
 
-        # Insert status result into MongoDB and return insert count
-        insert_docs = self._collection.insert_many([result])
-        insert_count = len(insert_docs.inserted_ids)
-        self._logger.error(f"Number of documents inserted: {insert_count}")
+        # Queue newly computed status results to be upserted into MongoDB in the background
+        if documents:
+            self._write_behind.put(documents)
 
-        self._logger.error(f"Processed maintenance status request for zone: {zone}")
+        log_event(self._logger, logging.DEBUG, "batch_status_request", zones=len(zones), computed=len(documents))
 
-        # Delete _id key from the final response after insertion into MongoDB
-        result.pop("_id")
+        return json_response({"results": results, "snapshot_age_seconds": round(snapshot_age, 3)})
 
-        return make_response(jsonify(result))
 
+class ParkStatus(Resource):
+    """
+    End-point for providing the maintenance and safety statuses of every zone of the park.
+
+    The response is computed once per NUDLS feed snapshot and calendar day and served from memory with a strong ETag,
+    so repeat callers sending If-None-Match get 304 Not Modified until the feed or the date changes.
+    Unlike the single zone endpoints, the statuses are not stored in MongoDB.
 
-class StatusSafety(Resource):
     """
-    End-point for providing the zone safety status in Dino Park for a given zone identifier.
+
+    def __init__(self, **kwargs):
+        """
+        Constructor.
+        :param kwargs: key word args sent from the main API package.
+
+        """
+        # feed cache and park status cache objects passed from the main API package.
+        self._feed_cache = kwargs["feed_cache"]
+        self._park_status_cache = kwargs["park_status_cache"]
+
+    def get(self):
+        """
+        :return: A JSON response containing the statuses of each zone, or 304 Not Modified.
+        """
+        park_state, snapshot_age = self._feed_cache.get_with_age()
+        body, etag = self._park_status_cache.get(park_state)
+
+        response = make_response(body)
+        response.content_type = "application/json"
+        response.set_etag(etag)
+        # How long ago the feed the statuses are based on was fetched or revalidated
+        response.headers["Age"] = str(int(snapshot_age))
+        return response.make_conditional(request)
+
+
+class ZoneHistory(Resource):
+    """
+    End-point for providing the statuses computed for a zone, newest first.
+
+    Pages are linked with a cursor: pass the next_cursor of a page to get the following one. Statuses are stored in
+    the background, so the latest ones may take up to the write-behind flush interval to appear.
 
     """
 
@@ -145,167 +375,59 @@ class StatusSafety(Resource):
         """
         # collection object passed from the main API package.
         self._collection = kwargs["collection"]
+
+    def get(self, zone):
+        """
+        Arguments are given in the query: since (ISO 8601 date or time, UTC), limit, fields (comma separated) and cursor.
+        :param zone: Zone identifier.
+        :return: A JSON response containing a page of the statuses computed for the zone.
+        """
+        args = request.args
+        query, projection, limit = history_query(zone, args.get("since"), args.get("limit"), args.get("fields"), args.get("cursor"))
+
+        # Read one more document than the limit to know whether there is a next page
+        documents = list(self._collection.find(query, projection).sort(HISTORY_SORT).limit(limit + 1))
+        page = history_page(documents, limit, args.get("fields"))
+        page["zone"] = zone
+
+        return json_response(page)
+
+
+class ZoneStream(Resource):
+    """
+    End-point streaming the changes of the zone statuses as Server-Sent Events.
+
+    An event is pushed when the maintenance or safety status of a zone changes between NUDLS feed snapshots, or when
+    the date changes it. Subscribers first get the current status of each zone they subscribed to. Each stream holds a
+    worker thread, the ASGI serving mode holds none and suits many subscribers better.
+
+    """
+
+    def __init__(self, **kwargs):
+        """
+        Constructor.
+        :param kwargs: key word args sent from the main API package.
+
+        """
+        # feed cache and status stream objects passed from the main API package.
+        self._feed_cache = kwargs["feed_cache"]
+        self._status_stream = kwargs["status_stream"]
         self._logger = logging.getLogger(LOGGER)
-        self._parser = reqparse.RequestParser()
-        self._parser.add_argument("zone", type=str, help="Provide a zone number", location="args", required=True)
 
     def get(self):
         """
-        :return: A JSON response containing zone safety status for a given zone identifier.
+        :return: A response streaming the status events of the zones and statuses given in the query, all by default.
         """
-        # Parse query arguments
-        args = self._parser.parse_args()
-        query = dict(args)
-        zone = query["zone"]
-
-        # Retrieve logs from NUDLS monitoring system
-        try:
-            resp = requests.get(NUDLS_URL)
-            resp.raise_for_status()
-        except requests.exceptions.HTTPError as err:
-            self._logger.error(err)
-            raise
-
-        # Retrieve content of the logs
-        content = resp.json()
-
-        # Retrieve dinosaur information and create look up dictionary for information
-        dino_log = [i for i in content if i["kind"] == "dino_added"]
-
-        # Species look up e.g. {"1032": "Tyrannosaurus rex"}
-        dino_species = [{str(i["id"]): i["species"]} for i in dino_log]
-        _dino_species = {}
-        for i in dino_species:
-            for k, v in i.items():
-                _dino_species[k] = v
-
-        # Type look up e.g. {"1032": "carnivore"}
-        dino_type = [{str(i["id"]): i["herbivore"]} for i in dino_log]
-        _dino_type = {}
-        for i in dino_type:
-            for k, v in i.items():
-                if v is False:
-                    _dino_type[k] = "carnivore"
-                else:
-                    _dino_type[k] = "herbivore"
-
-        # Digestion time (in days) look up e.g. {"1032": 2}
-        dino_dt = [{str(i["id"]): i["digestion_period_in_hours"]} for i in dino_log]
-        _dino_dt = {}
-        for i in dino_dt:
-            for k, v in i.items():
-                _dino_dt[k] = int(v / 24)  # convert to days
-
-        # Removal of dinosaur with date e.g. {"1047": "2021-02-05T22:59:31.696Z"}
-        dino_rm_log = [i for i in content if i["kind"] == "dino_removed"]
-        dino_rm = [{str(i["dinosaur_id"]): i["time"]} for i in dino_rm_log]
-        _dino_rm = {}
-        for i in dino_rm:
-            for k, v in i.items():
-                _dino_rm[k] = v
-
-        # Feeding date of dinosaur e.g. {"1032": "2021-02-03T22:59:31.696Z"}
-        dino_fed_log = [i for i in content if i["kind"] == "dino_fed"]
-        dino_fed = [{str(i["dinosaur_id"]): i["time"]} for i in dino_fed_log]
-        _dino_fed = {}
-        for i in dino_fed:
-            for k, v in i.items():
-                _dino_fed[k] = v
-
-        # Retrieve location update information
-        dino_loc_update = [i for i in content if i["kind"] == "dino_location_updated"]
-        # Check if zone exists in the logs
-        locations = [entry["location"] for entry in dino_loc_update]
-        if zone not in locations:
-            raise BadRequest(f"Zone: {zone} is not available from NUDLS logs currently.")
-
-        # Filter entry by provided zone
-        filtered_item = [i for i in dino_loc_update if i["location"] == zone][0]
-
-        # Retrieve dinosaur id of the given dinosaur location updated zone
-        dino = str(filtered_item["dinosaur_id"])
-        result = self._safety_status_algorithm(filtered_item, zone, dino, _dino_species, _dino_type, _dino_dt, _dino_rm, _dino_fed)
-
-        # Insert status result into MongoDB and return insert count
-        insert_docs = self._collection.insert_many([result])
-        insert_count = len(insert_docs.inserted_ids)
-        self._logger.error(f"Number of documents inserted: {insert_count}")
-
-        self._logger.error(f"Processed safety status request for zone: {zone}")
-
-        # Delete _id key from the final response after insertion into MongoDB
-        result.pop("_id")
-
-        return make_response(jsonify(result))
-
-    def _safety_status_algorithm(self, zone_item, zone, dino_id, dino_species, dino_type, dino_digestion_time, dino_remove, dino_fed):
-        """
-        A Helper method to process logs using safety status algorithm.
-
-        :param zone_item: Dictionary of information of dino location update for a given zone.
-        :param zone: Given zone identifier.
-        :param dino_id: Dinosaur's unique ID.
-        :param dino_species: Species look up dictionary.
-        :param dino_type: Type look up dictionary.
-        :param dino_digestion_time: Digestion time look up dictionary.
-        :param dino_remove: Removal look up dictionary.
-        :param dino_fed: Fed time look up dictionary.
-        :return: Dictionary of safety status result.
-        """
-
-        # Check if dino is herbivore or carnivore
-        if dino_type[dino_id] == "herbivore":
-            result = {
-                "zone": zone,
-                "safety_status": 1,
-                "info": f"It is safe to enter. Currently {dino_species[dino_id]} ({dino_type[dino_id]}) is in the zone."
-            }
-            return result
-
-        # Now dino is carnivore. Check if dinosaur was removed.
-        if dino_id in dino_remove.keys():
-            removal_date = datetime.strptime(dino_remove[dino_id], "%Y-%m-%dT%H:%M:%S.%fZ").strftime("%Y-%m-%d")
-            update_date = datetime.strptime(zone_item["time"], "%Y-%m-%dT%H:%M:%S.%fZ").strftime("%Y-%m-%d")
-            if removal_date > update_date:
-                self._logger.info(f"{dino_id} was removed after its location was updated")
-                result = {
-                    "zone": zone,
-                    "safety_status": 1,
-                    "info": f"It is safe to enter. {dino_species[dino_id]} - ({dino_type[dino_id]}) was removed."
-                }
-                return result
-        else:
-            self._logger.info(f"{dino_id} was not removed.")
-
-        # Check if dinosaur was fed
-        if dino_id not in dino_fed.keys():
-            result = {
-                "zone": zone,
-                "safety_status": 0,
-                "info": f"{dino_id} - ({dino_type[dino_id]}) was not fed. It is not safe to enter."
-            }
-            return result
-
-        # If dino was fed, check if fed time + digestion time is bigger than today or not
-        else:
-            # Convert fed time to datetime object
-            fed_date = datetime.strptime(dino_fed[dino_id], "%Y-%m-%dT%H:%M:%S.%fZ").strftime("%Y-%m-%d")
-            fed_date = datetime.strptime(fed_date, "%Y-%m-%d")
-            today = datetime.strptime(time.strftime("%Y-%m-%d"), "%Y-%m-%d")
-            # Sum of fed date and digestion time
-            sum_fed_digest_date = fed_date + timedelta(days=dino_digestion_time[dino_id])
-
-            if sum_fed_digest_date < today:
-                result = {
-                    "zone": zone,
-                    "safety_status": 0,
-                    "info": f"It is not safe to enter. Currently {dino_species[dino_id]} has finished digesting."
-                }
-                return result
-            elif sum_fed_digest_date >= today:
-                result = {
-                    "zone": zone,
-                    "safety_status": 1,
-                    "info": f"It is safe to enter. Currently {dino_species[dino_id]} is still digesting."
-                }
-                return result
+        zones, statuses = parse_stream_filter(request.args.get("zones"), request.args.get("statuses"))
+
+        # Publish the current snapshot, so that the first events of the stream are current
+        self._status_stream.publish(self._feed_cache.get())
+        wake = threading.Event()
+        subscription = self._status_stream.subscribe(zones, statuses, wake.set)
+        log_event(self._logger, logging.DEBUG, "stream_subscribed", zones=len(zones) if zones is not None else None)
+
+        def refresh():
+            self._status_stream.publish(self._feed_cache.get())
+
+        return Response(event_stream(self._status_stream, subscription, wake, refresh), content_type=STREAM_CONTENT_TYPE,
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
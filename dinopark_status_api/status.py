@@ -0,0 +1,315 @@
+"""
+Zone status business logic shared by the API entry points.
+
+"""
+
+# System imports
+import logging
+import re
+from werkzeug.exceptions import BadRequest, HTTPException
+
+# Local imports
+from dinopark_status_api.constants import LOGGER, MAX_BATCH_ZONES, ZONE_PATTERN
+from dinopark_status_api.structured_logging import log_event
+from dinopark_status_api.timestamps import MILLIS_PER_DAY, today
+
+_logger = logging.getLogger(LOGGER)
+
+# Days after the last maintenance from which a zone requires maintenance again (exclusive)
+MAINTENANCE_INTERVAL_DAYS = 30
+
+# Outcomes of the maintenance status
+MAINTENANCE_NOT_REQUIRED = 0
+MAINTENANCE_DUE_TOMORROW = 1
+MAINTENANCE_REQUIRED = 2
+MAINTENANCE_DECISIONS = (MAINTENANCE_NOT_REQUIRED, MAINTENANCE_DUE_TOMORROW, MAINTENANCE_REQUIRED)
+
+# Outcomes of the safety status algorithm
+SAFE_HERBIVORE = 0
+SAFE_REMOVED = 1
+UNSAFE_NOT_FED = 2
+UNSAFE_DIGESTED = 3
+SAFE_DIGESTING = 4
+SAFETY_DECISIONS = (SAFE_HERBIVORE, SAFE_REMOVED, UNSAFE_NOT_FED, UNSAFE_DIGESTED, SAFE_DIGESTING)
+
+
+def maintenance_status(park_state, zone, day=None):
+    """
+    Maintenance status of a zone.
+
+    NUDLS logs give the date maintenance was last performed. The status compares it with today's date
+    to decide whether maintenance is required or not.
+
+    :param park_state: ParkState of the current NUDLS feed snapshot.
+    :param zone: Given zone identifier.
+    :param day: Day (since the epoch) the status is computed for, defaults to today.
+    :return: Dictionary of maintenance status result.
+    """
+    # Retrieve the latest maintenance performed log of the given zone
+    filter_by_zone = park_state.maintenance_by_zone.get(zone)
+    if filter_by_zone is None:
+        raise zone_unavailable(zone)
+
+    # Days between the maintenance date, parsed when the feed was applied, and today
+    date_diff = (day if day is not None else today()) - park_state.maintenance_day_by_zone[zone]
+
+    # Decide whether maintenance is required or not
+    if date_diff < MAINTENANCE_INTERVAL_DAYS:
+        decision = MAINTENANCE_NOT_REQUIRED
+    elif date_diff == MAINTENANCE_INTERVAL_DAYS:
+        decision = MAINTENANCE_DUE_TOMORROW
+    else:
+        decision = MAINTENANCE_REQUIRED
+    return maintenance_result(zone, date_diff, decision)
+
+
+def maintenance_result(zone, date_diff, decision):
+    """
+    Maintenance status result of a zone.
+
+    :param zone: Given zone identifier.
+    :param date_diff: Days between the last maintenance and today.
+    :param decision: Whether maintenance is required, one of MAINTENANCE_DECISIONS.
+    :return: Dictionary of maintenance status result.
+    """
+    if decision == MAINTENANCE_NOT_REQUIRED:
+        maintenance_info = f"Maintenance is not required. Currently {date_diff} days after last maintenance performed."
+        maintenance_required = 0
+    elif decision == MAINTENANCE_DUE_TOMORROW:
+        maintenance_info = f"Maintenance is not required, but maintenance will be required from tomorrow."
+        maintenance_required = 0
+    else:
+        maintenance_info = f"Maintenance is required. Currently {date_diff} days after last maintenance performed."
+        maintenance_required = 1
+
+    # Final response body of the API
+    result = {
+        "zone": zone,
+        "maintenance_required": maintenance_required,
+        "info": maintenance_info
+    }
+
+    return result
+
+
+def safety_status(park_state, zone, day=None):
+    """
+    Safety status of a zone, based on the dinosaur whose location was last updated to the zone.
+
+    :param park_state: ParkState of the current NUDLS feed snapshot.
+    :param zone: Given zone identifier.
+    :param day: Day (since the epoch) the status is computed for, defaults to today.
+    :return: Dictionary of safety status result.
+    """
+    # Retrieve the latest location update log of the given zone
+    filtered_item = park_state.location_by_zone.get(zone)
+    if filtered_item is None:
+        raise zone_unavailable(zone)
+
+    # Retrieve the record of the dinosaur whose location was updated to the given zone
+    dino_id = int(filtered_item["dinosaur_id"])
+    dinosaur = park_state.dinosaurs.get(dino_id)
+    if dinosaur is None or dinosaur.herbivore is None:
+        raise dinosaur_unavailable(zone, dino_id)
+    return safety_status_algorithm(park_state.location_day_by_zone[zone], zone, dino_id, dinosaur, day)
+
+
+def safety_status_algorithm(update_day, zone, dino_id, dinosaur, day=None):
+    """
+    A Helper function to process logs using safety status algorithm.
+
+    :param update_day: Day (since the epoch) the dinosaur's location was updated to the zone.
+    :param zone: Given zone identifier.
+    :param dino_id: Dinosaur's unique ID.
+    :param dinosaur: Dinosaur record of the park state.
+    :param day: Day (since the epoch) the status is computed for, defaults to today.
+    :return: Dictionary of safety status result.
+    """
+
+    # Check if dino is herbivore or carnivore
+    if dinosaur.herbivore:
+        return safety_result(zone, dino_id, dinosaur, SAFE_HERBIVORE)
+
+    # Now dino is carnivore. Check if dinosaur was removed.
+    if dinosaur.removed_at is not None:
+        if dinosaur.removed_at // MILLIS_PER_DAY > update_day:
+            log_event(_logger, logging.DEBUG, "dinosaur_removed_after_location_update", dinosaur_id=dino_id, zone=zone)
+            return safety_result(zone, dino_id, dinosaur, SAFE_REMOVED)
+    else:
+        log_event(_logger, logging.DEBUG, "dinosaur_not_removed", dinosaur_id=dino_id, zone=zone)
+
+    # Check if dinosaur was fed
+    if dinosaur.fed_at is None:
+        return safety_result(zone, dino_id, dinosaur, UNSAFE_NOT_FED)
+
+    # If dino was fed, check if fed day + digestion time is before today or not
+    if dinosaur.fed_at // MILLIS_PER_DAY + dinosaur.digestion_days < (day if day is not None else today()):
+        return safety_result(zone, dino_id, dinosaur, UNSAFE_DIGESTED)
+    return safety_result(zone, dino_id, dinosaur, SAFE_DIGESTING)
+
+
+def safety_result(zone, dino_id, dinosaur, decision):
+    """
+    Safety status result of a zone.
+
+    :param zone: Given zone identifier.
+    :param dino_id: Dinosaur's unique ID.
+    :param dinosaur: Dinosaur record of the park state.
+    :param decision: Outcome of the safety status algorithm, one of SAFETY_DECISIONS.
+    :return: Dictionary of safety status result.
+    """
+    if decision == SAFE_HERBIVORE:
+        return {
+            "zone": zone,
+            "safety_status": 1,
+            "info": f"It is safe to enter. Currently {dinosaur.species} ({dinosaur.diet}) is in the zone."
+        }
+    if decision == SAFE_REMOVED:
+        return {
+            "zone": zone,
+            "safety_status": 1,
+            "info": f"It is safe to enter. {dinosaur.species} - ({dinosaur.diet}) was removed."
+        }
+    if decision == UNSAFE_NOT_FED:
+        return {
+            "zone": zone,
+            "safety_status": 0,
+            "info": f"{dino_id} - ({dinosaur.diet}) was not fed. It is not safe to enter."
+        }
+    if decision == UNSAFE_DIGESTED:
+        return {
+            "zone": zone,
+            "safety_status": 0,
+            "info": f"It is not safe to enter. Currently {dinosaur.species} has finished digesting."
+        }
+    return {
+        "zone": zone,
+        "safety_status": 1,
+        "info": f"It is safe to enter. Currently {dinosaur.species} is still digesting."
+    }
+
+
+def zone_unavailable(zone):
+    """
+    :param zone: Given zone identifier.
+    :return: BadRequest for a zone the NUDLS logs have no event about.
+    """
+    return BadRequest(f"Zone: {zone} is not available from NUDLS logs currently.")
+
+
+def dinosaur_unavailable(zone, dino_id):
+    """
+    :param zone: Given zone identifier.
+    :param dino_id: Dinosaur's unique ID.
+    :return: BadRequest for a zone whose dinosaur was never added in the NUDLS logs.
+    """
+    return BadRequest(f"Dinosaur: {dino_id} in zone: {zone} is not available from NUDLS logs currently.")
+
+
+def error_result(err):
+    """
+    Error in place of a status that can't be computed, same body as the error response of the single zone endpoints.
+
+    :param err: The HTTPException raised computing the status.
+    :return: Dictionary of the error.
+    """
+    return {
+        "status": {
+            "code": err.code,
+            "info": err.description,
+            "status": "FAILURE"
+        }
+    }
+
+
+# Statuses a batch request can compute, by name
+STATUS_FUNCTIONS = {
+    "maintenance": maintenance_status,
+    "safety": safety_status
+}
+
+
+# Compiled once, zones are validated on every request
+ZONE_FORMAT = re.compile(ZONE_PATTERN)
+
+
+def parse_zone(zone):
+    """
+    Validates the zone of a request, so that malformed zones are rejected before the NUDLS feed or MongoDB is read.
+
+    :param zone: Zone identifier, e.g. A1. None if missing from the request.
+    :return: The zone identifier.
+    """
+    if not zone:
+        raise BadRequest("Provide a zone number.")
+    if ZONE_FORMAT.fullmatch(zone) is None:
+        raise BadRequest(f"Invalid zone: {zone[:8]}. Provide a zone from A1 to Z16.")
+    return zone
+
+
+def parse_batch(zones, statuses=None):
+    """
+    Validates the zones and statuses of a batch request.
+
+    :param zones: List of zone identifiers, or a comma separated string of them.
+    :param statuses: List of status names (see STATUS_FUNCTIONS), or a comma separated string of them. Defaults to all.
+    :return: Tuple of the zones, without duplicates, and the status names, in request order.
+    """
+    if isinstance(zones, str):
+        zones = zones.split(",")
+    if isinstance(statuses, str):
+        statuses = statuses.split(",")
+    if statuses is None:
+        statuses = list(STATUS_FUNCTIONS)
+
+    if not isinstance(zones, list) or not all(isinstance(zone, str) for zone in zones):
+        raise BadRequest("Provide zones as a list of zone identifiers.")
+    zones = list(dict.fromkeys(zone.strip() for zone in zones if zone.strip()))
+    if not zones:
+        raise BadRequest("Provide at least one zone.")
+    if len(zones) > MAX_BATCH_ZONES:
+        raise BadRequest(f"Provide at most {MAX_BATCH_ZONES} zones.")
+    invalid = [zone for zone in zones if ZONE_FORMAT.fullmatch(zone) is None]
+    if invalid:
+        raise BadRequest(f"Invalid zones: {', '.join(zone[:8] for zone in invalid[:10])}. Provide zones from A1 to Z16.")
+
+    if not isinstance(statuses, list) or not statuses or any(status not in STATUS_FUNCTIONS for status in statuses):
+        raise BadRequest(f"Provide statuses among: {', '.join(STATUS_FUNCTIONS)}.")
+
+    return zones, list(dict.fromkeys(statuses))
+
+
+def batch_status(park_state, zones, statuses, status_cache=None, day=None):
+    """
+    Statuses of many zones from the same NUDLS feed snapshot.
+
+    A zone whose status can't be computed, for example because it is not in the NUDLS logs, gets an error
+    in place of its status instead of failing the whole batch.
+
+    :param park_state: ParkState of the current NUDLS feed snapshot.
+    :param zones: Zone identifiers, see parse_batch.
+    :param statuses: Status names, see parse_batch.
+    :param status_cache: StatusCache the statuses are read through. If None, every status is computed.
+    :param day: Day (since the epoch) the statuses are computed for, defaults to today. Only without a status cache.
+    :return: Tuple of the list of per-zone results, in request order, and the list of (cache key, status result)
+    of the statuses computed by this call, to be stored. Keys are None without a status cache.
+    """
+    results = []
+    computed = []
+    for zone in zones:
+        result = {"zone": zone}
+        for status in statuses:
+            try:
+                if status_cache is None:
+                    document, key, is_new = STATUS_FUNCTIONS[status](park_state, zone, day), None, True
+                else:
+                    document, key, is_new = status_cache.get(status, park_state, zone)
+            except HTTPException as err:
+                result[status] = error_result(err)
+                continue
+            result[status] = document
+            if is_new:
+                computed.append((key, document))
+        results.append(result)
+
+    return results, computed
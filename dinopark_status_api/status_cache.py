@@ -0,0 +1,139 @@
+"""
+Read-through cache of zone status results.
+
+"""
+
+# System imports
+import threading
+import time
+from collections import OrderedDict
+
+# Local imports
+from dinopark_status_api.constants import STATUS_CACHE_SIZE, STATUS_CACHE_BYTES_PER_RESULT
+from dinopark_status_api.json_encoder import dumps
+from dinopark_status_api.metrics import observe_phase, phase
+from dinopark_status_api.status import STATUS_FUNCTIONS
+from dinopark_status_api.timestamps import today_iso
+
+
+def feed_version(park_state):
+    """
+    Version of the NUDLS feed a park state was built from: the time of its latest event.
+    The feed only ever gets new events appended, so every process reading the same feed gets the same version.
+    :param park_state: ParkState of a NUDLS feed snapshot.
+    :return: The feed version.
+    """
+    return park_state.high_water_mark
+
+
+class StatusCache:
+    """
+    LRU cache of status results keyed by (status, zone, feed version, date).
+
+    A zone's status only changes when the feed gets new events or the day rolls over, so it is computed once per
+    feed version and day, and every other request gets the cached result. Only newly computed results need storing
+    in MongoDB, where the same key identifies them (see history.upsert_requests). Errors, e.g. a zone that is not
+    in the NUDLS logs, are not cached. Results are kept along with their JSON encoding, so that cached answers are
+    served without encoding them again.
+    """
+
+    def __init__(self, max_size=STATUS_CACHE_SIZE, today=today_iso):
+        """
+        Constructor.
+        :param max_size: Maximum number of results kept, the least recently used are evicted first.
+        :param today: Function returning today's date as YYYY-MM-DD, injectable for tests.
+        """
+        self._max_size = max_size
+        self._today = today
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+        self._stats = {
+            "hits": 0,
+            "misses": 0
+        }
+
+    def get(self, status_type, park_state, zone):
+        """
+        Returns the status of a zone, computing it only if it is not cached.
+        :param status_type: Name of the status, see status.STATUS_FUNCTIONS.
+        :param park_state: ParkState of the current NUDLS feed snapshot.
+        :param zone: Zone identifier.
+        :return: Tuple of a copy of the status result, the cache key as a dictionary (status_type, zone, feed_version
+        and date) and whether the result was computed by this call.
+        """
+        (result, _), key, computed = self._get(status_type, park_state, zone)
+        return dict(result), key, computed
+
+    def get_encoded(self, status_type, park_state, zone):
+        """
+        Returns the status of a zone encoded as JSON, computing it only if it is not cached.
+        :param status_type: Name of the status, see status.STATUS_FUNCTIONS.
+        :param park_state: ParkState of the current NUDLS feed snapshot.
+        :param zone: Zone identifier.
+        :return: Tuple of the encoded status result, the status result itself, the cache key as a dictionary (see get)
+        and whether the result was computed by this call. The result is shared with the cache and must not be modified.
+        """
+        (result, body), key, computed = self._get(status_type, park_state, zone)
+        return body, result, key, computed
+
+    def _get(self, status_type, park_state, zone):
+        """
+        :return: Tuple of the cache entry (status result and its encoding), the cache key as a dictionary and whether
+        the entry was computed by this call.
+        """
+        key = (status_type, zone, feed_version(park_state), self._today())
+        started = time.perf_counter()
+        with self._lock:
+            entry = self._results.get(key)
+            if entry is not None:
+                self._results.move_to_end(key)
+                self._stats["hits"] += 1
+            else:
+                self._stats["misses"] += 1
+        observe_phase("index_lookup", time.perf_counter() - started)
+        if entry is not None:
+            return entry, self._key_fields(key), False
+
+        # Computed outside of the lock, concurrent misses of the same key compute the same result
+        with phase("algorithm"):
+            result = STATUS_FUNCTIONS[status_type](park_state, zone)
+        with phase("serialize"):
+            entry = (result, dumps(result))
+
+        with self._lock:
+            self._results[key] = entry
+            self._results.move_to_end(key)
+            while len(self._results) > self._max_size:
+                self._results.popitem(last=False)
+        return entry, self._key_fields(key), True
+
+    def clear(self):
+        """
+        Forgets every cached result.
+        """
+        with self._lock:
+            self._results.clear()
+
+    def estimated_bytes(self):
+        """
+        :return: Estimated bytes held by the cached results.
+        """
+        with self._lock:
+            return len(self._results) * STATUS_CACHE_BYTES_PER_RESULT
+
+    def stats(self):
+        """
+        :return: Dictionary of cache counters and size.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._results)
+            return stats
+
+    @staticmethod
+    def _key_fields(key):
+        """
+        :return: The cache key as the fields of a stored status document.
+        """
+        status_type, zone, version, date = key
+        return {"status_type": status_type, "zone": zone, "feed_version": version, "date": date}
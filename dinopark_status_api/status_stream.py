@@ -0,0 +1,305 @@
+"""
+Zone status change notifications, pushed to subscribers as Server-Sent Events.
+
+"""
+
+# System imports
+import logging
+import threading
+from collections import deque
+
+# Local imports
+from dinopark_status_api.constants import LOGGER, PARK_ZONES, STATUS_STREAM_MAX_QUEUED, STATUS_STREAM_KEEPALIVE_SECONDS, \
+    STATUS_STREAM_RETRY_MILLISECONDS
+from dinopark_status_api.json_encoder import dumps
+from dinopark_status_api.metrics import phase
+from dinopark_status_api.status import STATUS_FUNCTIONS, batch_status, parse_batch
+from dinopark_status_api.timestamps import epoch_day_of_date, today_iso
+
+# Content type of a Server-Sent Events stream
+CONTENT_TYPE = "text/event-stream"
+
+# Field of each status result holding its decision
+DECISION_FIELDS = {
+    "maintenance": "maintenance_required",
+    "safety": "safety_status"
+}
+
+
+def status_decision(status_type, result):
+    """
+    What a zone's status is, as opposed to how it is worded: the status only changes when this changes.
+    The info of a maintenance status counts the days since the last maintenance, it changes every day.
+    :param status_type: Name of the status, see status.STATUS_FUNCTIONS.
+    :param result: Status result, or error result (see status.error_result).
+    :return: The decision of the status, or the error code when it can't be computed.
+    """
+    if "status" in result:
+        return "error", result["status"]["code"]
+    return result[DECISION_FIELDS[status_type]]
+
+
+def diff_statuses(previous, current):
+    """
+    Compares the statuses of every zone between two feed snapshots.
+    :param previous: Dictionary of (zone, status name) to status result of the previous snapshot, empty for the first.
+    :param current: Dictionary of (zone, status name) to status result of the new snapshot.
+    :return: List of the (zone, status name) keys whose decision changed, or that are new, in the order of current.
+    """
+    changed = []
+    for key, result in current.items():
+        before = previous.get(key)
+        if before is None or status_decision(key[1], before) != status_decision(key[1], result):
+            changed.append(key)
+    return changed
+
+
+def parse_stream_filter(zones=None, statuses=None):
+    """
+    Validates the filter of a subscription.
+    :param zones: Comma separated zone identifiers, None for every zone of the park.
+    :param statuses: Comma separated status names, None for every status.
+    :return: Tuple of the zones, None for every zone, and the status names.
+    """
+    parsed_zones, statuses = parse_batch(zones if zones is not None else list(PARK_ZONES), statuses)
+    return (parsed_zones if zones is not None else None), statuses
+
+
+class Subscription:
+    """
+    A subscriber to the stream: its filter and the events waiting to be sent to it.
+    """
+    __slots__ = ("zones", "statuses", "events", "overflowed", "_notify")
+
+    def __init__(self, zones, statuses, notify):
+        """
+        Constructor.
+        :param zones: Zones subscribed to, None for every zone.
+        :param statuses: Status names subscribed to.
+        :param notify: Callable waking up the subscriber when events are queued, called holding the stream's lock.
+        """
+        self.zones = frozenset(zones) if zones is not None else None
+        self.statuses = frozenset(statuses)
+        self.events = deque()
+        self.overflowed = False
+        self._notify = notify
+
+    def push(self, event, max_queued):
+        """
+        Queues an event, must be called holding the stream's lock.
+        :param event: Encoded event.
+        :param max_queued: Maximum number of events queued, the queue is dropped past it.
+        :return: Whether the queue was dropped by this event.
+        """
+        if self.overflowed:
+            return False
+        dropped = len(self.events) >= max_queued
+        if dropped:
+            # Too far behind, the current statuses are sent again instead of every change since
+            self.events.clear()
+            self.overflowed = True
+        else:
+            self.events.append(event)
+        self._notify()
+        return dropped
+
+
+class StatusStream:
+    """
+    Statuses of every zone of the park, published once per NUDLS feed snapshot and calendar day, and the subscribers
+    to their changes.
+
+    Each publication evaluates every zone and compares the decisions with the previous publication. Only the statuses
+    that changed are encoded, once each, as Server-Sent Events and queued for the subscribers whose filter matches:
+    subscribers are indexed by zone, so a change reaches the subscribers of its zone without looking at the others,
+    and nothing is computed per subscriber. A new subscriber first gets the current
+    status of each zone it subscribed to, from the events of the latest publication.
+    """
+
+    def __init__(self, zones=PARK_ZONES, today=today_iso, max_queued=STATUS_STREAM_MAX_QUEUED):
+        """
+        Constructor.
+        :param zones: Zone identifiers of the park.
+        :param today: Function returning today's date as YYYY-MM-DD, injectable for tests.
+        :param max_queued: Maximum number of events queued per subscriber.
+        """
+        self._zones = zones
+        self._today = today
+        self._max_queued = max_queued
+        self._lock = threading.Lock()
+        self._key = None
+        self._results = {}
+        # (zone, status name): encoded event of its latest status
+        self._events = {}
+        self._event_id = 0
+        # Subscriptions to every zone, and to given zones by zone
+        self._subscribers = set()
+        self._subscribers_by_zone = {}
+        self._stats = {
+            "publications": 0,
+            "changes": 0,
+            "overflows": 0
+        }
+
+    def publish(self, park_state):
+        """
+        Pushes the statuses that changed since the previous publication to their subscribers. Does nothing when the
+        feed snapshot and the date did not change, so it is cheap to call on every refresh of the feed.
+        :param park_state: ParkState of the current NUDLS feed snapshot.
+        :return: Number of statuses that changed.
+        """
+        key = (park_state, self._today())
+        with self._lock:
+            # Compare the snapshot by identity, a refreshed feed is always a new ParkState
+            if self._key is not None and self._key[0] is key[0] and self._key[1] == key[1]:
+                return 0
+            results = self._evaluate(park_state, key[1])
+            changed = diff_statuses(self._results, results)
+            for zone, status in changed:
+                self._event_id += 1
+                event = self._encode(self._event_id, zone, status, results[zone, status], park_state, key[1])
+                self._events[zone, status] = event
+                for subscription in self._subscribers.union(self._subscribers_by_zone.get(zone, ())):
+                    if status in subscription.statuses and subscription.push(event, self._max_queued):
+                        self._stats["overflows"] += 1
+            self._results = results
+            self._key = key
+            self._stats["publications"] += 1
+            self._stats["changes"] += len(changed)
+            return len(changed)
+
+    def on_snapshot(self, park_state):
+        """
+        Listener of the feed cache: publishes each new snapshot while anyone is subscribed. Without subscribers nothing
+        is evaluated, the next subscriber publishes the snapshot current when it subscribes.
+        :param park_state: ParkState of the snapshot swapped in.
+        """
+        with self._lock:
+            subscribed = bool(self._subscribers or self._subscribers_by_zone)
+        if subscribed:
+            self.publish(park_state)
+
+    def clear(self):
+        """
+        Forgets the snapshot last published so that it can be freed. The statuses published are kept, the next
+        publication only pushes the ones that changed since.
+        """
+        with self._lock:
+            self._key = None
+
+    def subscribe(self, zones, statuses, notify):
+        """
+        Adds a subscriber, with the current status of each zone it subscribed to queued.
+        :param zones: Zones subscribed to, None for every zone, see parse_stream_filter.
+        :param statuses: Status names subscribed to.
+        :param notify: Callable waking up the subscriber when events are queued, must not block.
+        :return: The Subscription, to drain and to unsubscribe.
+        """
+        subscription = Subscription(zones, statuses, notify)
+        with self._lock:
+            subscription.events.extend(self._current_events(subscription))
+            if subscription.zones is None:
+                self._subscribers.add(subscription)
+            else:
+                for zone in subscription.zones:
+                    self._subscribers_by_zone.setdefault(zone, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        """
+        Removes a subscriber.
+        :param subscription: Subscription returned by subscribe.
+        """
+        with self._lock:
+            if subscription.zones is None:
+                self._subscribers.discard(subscription)
+                return
+            for zone in subscription.zones:
+                subscribers = self._subscribers_by_zone.get(zone)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers_by_zone[zone]
+
+    def drain(self, subscription):
+        """
+        :param subscription: Subscription returned by subscribe.
+        :return: List of the encoded events queued for the subscriber, emptied.
+        """
+        with self._lock:
+            if subscription.overflowed:
+                subscription.overflowed = False
+                return self._current_events(subscription)
+            events = list(subscription.events)
+            subscription.events.clear()
+            return events
+
+    def stats(self):
+        """
+        :return: Dictionary of publication counters and the number of subscribers.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["subscribers"] = len(self._subscribers) + len({subscription for subscribers in self._subscribers_by_zone.values()
+                                                                 for subscription in subscribers})
+            return stats
+
+    def _current_events(self, subscription):
+        """
+        :return: List of the latest event of each status of the subscription. Must be called holding the lock.
+        """
+        zones = self._zones if subscription.zones is None else [zone for zone in self._zones if zone in subscription.zones]
+        return [self._events[zone, status] for zone in zones for status in STATUS_FUNCTIONS
+                if status in subscription.statuses and (zone, status) in self._events]
+
+    def _evaluate(self, park_state, today):
+        """
+        :return: Dictionary of (zone, status name) to the status result of every zone.
+        """
+        with phase("algorithm"):
+            results, _ = batch_status(park_state, self._zones, list(STATUS_FUNCTIONS), day=epoch_day_of_date(today))
+        return {(result["zone"], status): result[status] for result in results for status in STATUS_FUNCTIONS}
+
+    @staticmethod
+    def _encode(event_id, zone, status, result, park_state, today):
+        """
+        :return: The Server-Sent Event of a status.
+        """
+        data = dumps({
+            "zone": zone,
+            "status_type": status,
+            "date": today,
+            "feed_time": park_state.high_water_mark,
+            "result": result
+        })
+        return b"".join((b"id: ", str(event_id).encode("ascii"), b"\nevent: status\ndata: ", data, b"\n\n"))
+
+
+def event_stream(status_stream, subscription, wake, refresh, keepalive=STATUS_STREAM_KEEPALIVE_SECONDS):
+    """
+    Body of a stream response: the events of a subscription as they are published, until the client disconnects.
+    :param status_stream: StatusStream subscribed to.
+    :param subscription: Subscription returned by subscribe, unsubscribed when the stream is closed.
+    :param wake: threading.Event set by the subscription's notify.
+    :param refresh: Callable publishing the current feed snapshot, called when the stream is idle, so that a changed
+    feed or date is published even when nothing else refreshes the feed.
+    :param keepalive: Seconds between keep-alive comments of an idle stream.
+    :return: Generator of encoded chunks.
+    """
+    logger = logging.getLogger(LOGGER)
+    try:
+        yield f"retry: {STATUS_STREAM_RETRY_MILLISECONDS}\n\n".encode("ascii")
+        while True:
+            wake.clear()
+            events = status_stream.drain(subscription)
+            if events:
+                yield b"".join(events)
+            elif not wake.wait(keepalive):
+                try:
+                    refresh()
+                except Exception as err:  # pylint: disable=broad-except
+                    logger.error(f"Could not refresh the status stream: {err}")
+                # A comment, ignored by clients, to keep the connection open through proxies
+                yield b": keepalive\n\n"
+    finally:
+        status_stream.unsubscribe(subscription)
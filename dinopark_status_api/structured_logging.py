@@ -0,0 +1,59 @@
+"""
+Structured logs: one JSON object per line, with the fields of the logged event.
+
+"""
+
+# System imports
+import json
+import logging
+
+# Local imports
+from dinopark_status_api.constants import LOGGER, LOG_LEVEL
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats log records as JSON lines: time, level, logger, event and the fields given to log_event.
+    """
+
+    def format(self, record):
+        """
+        :param record: The log record.
+        :return: The JSON line.
+        """
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage()
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def log_event(logger, level, event, **fields):
+    """
+    Logs an event with its fields. Nothing is formatted, nor is the record built, when the level is disabled, so that
+    events of the request hot path cost next to nothing in production.
+    :param logger: The logger.
+    :param level: Logging level, e.g. logging.DEBUG.
+    :param event: Name of the event, e.g. status_request.
+    :param fields: Fields of the event, e.g. zone="A1".
+    """
+    if logger.isEnabledFor(level):
+        logger.log(level, event, extra={"fields": fields})
+
+
+def configure_logging(level=LOG_LEVEL):
+    """
+    Writes the logs of the API to stderr as JSON lines.
+    :param level: Logging level name or number.
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter())
+    logger = logging.getLogger(LOGGER)
+    logger.handlers[:] = [handler]
+    logger.setLevel(level)
+    logger.propagate = False
@@ -26,7 +26,8 @@ class TestAppErrorHandler(unittest.TestCase):
         # Here since we're testing for common API functions, it will not write anything to mongodb
         mongo_url = "mongodb://mongodb:27017/"
         mongo_dal = pymongo.MongoClient(mongo_url)
-        app = DinoparkStatusApi.create_app(mongo_dal)
+        # No need to poll NUDLS either
+        app = DinoparkStatusApi.create_app(mongo_dal, poll_interval=None)
         cls.app = app.test_client()
 
     def test_unsupported_route_error(self):
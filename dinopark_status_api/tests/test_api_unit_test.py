@@ -3,10 +3,11 @@ Tests API main functionality.
 """
 
 # System imports
+import json
 import unittest
 import mock
 import time
-from datetime import datetime
+from datetime import datetime, timedelta
 from unittest.mock import Mock, patch
 
 # Third-party import
@@ -16,6 +17,9 @@ from requests.exceptions import HTTPError
 # Local imports
 from dinopark_status_api.constants import API_VERSION
 from dinopark_status_api.apis import DinoparkStatusApi
+from dinopark_status_api.feed_cache import FeedCache
+from dinopark_status_api.history import status_document, ensure_indexes, history_query, HISTORY_SORT
+from dinopark_status_api.timestamps import Clock, set_clock
 
 
 class TestDinoparkStatusApi(unittest.TestCase):
@@ -33,14 +37,30 @@ class TestDinoparkStatusApi(unittest.TestCase):
         """
         # Setup test client
         mongo_dal = cls._MONGO_DAL
-        app = DinoparkStatusApi.create_app(mongo_dal)
+        # Disable feed caching and polling so each test request sees its own mocked NUDLS response
+        cls.feed_cache = FeedCache(ttl=0, stale_ttl=0)
+        app = DinoparkStatusApi.create_app(mongo_dal, feed_cache=cls.feed_cache, poll_interval=None)
+        cls.write_behind = app.extensions["write_behind"]
+        cls.status_cache = app.extensions["status_cache"]
+        # The indexes are created in the background, wait for them
+        cls.readiness = app.extensions["readiness"]
+        cls.readiness.wait(timeout=30)
         cls.app = app.test_client()
 
+    def setUp(self):
+        """
+        Drop the previous test's feed snapshot and statuses, each test mocks an unrelated NUDLS feed.
+        """
+        self.feed_cache.invalidate()
+        self.status_cache.clear()
+
     @classmethod
     def tearDownClass(cls):
         """
         A class method called after tests in an individual class have run. This is to drop or delete collection entries after running test.
         """
+        # Insert the queued status documents first so that none is left behind
+        cls.write_behind.flush()
         # Retrieve db and collection
         test_db = cls._MONGO_DAL["dinopark_status_db"]
         test_collection = test_db["dinopark_status_collection"]
@@ -55,9 +75,70 @@ class TestDinoparkStatusApi(unittest.TestCase):
             response = client.get('dinopark_status/' + API_VERSION + '/')
             response_json = response.get_json()
             self.assertEqual(response.status_code, 200)
-            self.assertEqual(response_json, {"status": {"code": 200, "info": "Welcome to Dino Park Status API!", "status": "SUCCESS"}})
+            self.assertEqual(response_json["status"], {"code": 200, "info": "Welcome to Dino Park Status API!", "status": "SUCCESS"})
+            self.assertIn("misses", response_json["feed_cache"])
+
+    def test_ready_endpoint(self):
+        """
+        Test the readiness endpoint answers 503 until the start up tasks are done.
+        """
+        with self.app as client:
+            response = client.get('dinopark_status/' + API_VERSION + '/ready')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json(), {"ready": True, "checks": {"indexes": True}})
+
+            self.readiness.add_check("feed", self.feed_cache.loaded)
+            try:
+                response = client.get('dinopark_status/' + API_VERSION + '/ready')
+            finally:
+                self.readiness.add_check("feed", lambda: True)
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response.get_json(), {"ready": False, "checks": {"indexes": True, "feed": False}})
+
+    def test_metrics_endpoint(self):
+        """
+        Test the metrics endpoint renders the latency of the requests served by route.
+        """
+        with self.app as client:
+            self.assertEqual(client.get('dinopark_status/' + API_VERSION + '/').status_code, 200)
+            response = client.get('dinopark_status/' + API_VERSION + '/metrics')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.content_type.startswith("text/plain; version=0.0.4"))
+            lines = response.get_data(as_text=True).splitlines()
+            self.assertTrue(any(line.startswith('dinopark_request_duration_seconds_count{route="health",method="GET",code="200"}') for line in lines))
+            self.assertIn('dinopark_requests_in_flight{route="metrics"} 1', lines)
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_zone_stream(self, mock_get):
+        """
+        Test the zone stream starts with the current statuses of the zones subscribed to.
+        """
+        source_data = [{'kind': 'maintenance_performed',
+                        'location': 'O4',
+                        'park_id': 1,
+                        'time': '2021-02-03T22:59:31.696Z'}]
+
+        with self.app as client:
+            mock_get.return_value = Mock(status_code=200, json=lambda: source_data)
+            response = client.get('dinopark_status/' + API_VERSION + '/zones/stream?zones=O4&statuses=maintenance', buffered=False)
+            try:
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.mimetype, "text/event-stream")
+                self.assertEqual(response.headers["Cache-Control"], "no-cache")
+                chunks = iter(response.response)
+                self.assertTrue(next(chunks).startswith(b"retry: "))
+                lines = next(chunks).decode("utf-8").splitlines()
+            finally:
+                response.close()
+            self.assertEqual(lines[1], "event: status")
+            event = json.loads(lines[2][len("data: "):])
+            self.assertEqual((event["zone"], event["status_type"]), ("O4", "maintenance"))
+            self.assertIn("maintenance_required", event["result"])
+
+            response = client.get('dinopark_status/' + API_VERSION + '/zones/stream?zones=A17')
+            self.assertEqual(response.status_code, 400)
 
-    @patch("dinopark_status_api.resources.requests.get")
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
     def test_safety_status(self, mock_get):
         """
         Test the safety status endpoint works.
@@ -112,9 +193,10 @@ class TestDinoparkStatusApi(unittest.TestCase):
             response = client.get('dinopark_status/' + API_VERSION + '/safety_status' + args)
             response_json = response.get_json()
             self.assertEqual(response.status_code, 200)
+            self.assertIsInstance(response_json.pop("snapshot_age_seconds"), float)
             self.assertEqual(response_json, expected_response)
 
-    @patch("dinopark_status_api.resources.requests.get")
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
     def test_maintenance_status(self, mock_get):
         """
         Test the maintenance status endpoint works.
@@ -138,15 +220,14 @@ class TestDinoparkStatusApi(unittest.TestCase):
                         'park_id': 1,
                         'time': '2021-02-03T17:08:01.497Z'}]
 
-        # Setup test dates. This is required since today's event_date changes everyday and test might fail.
-        test_today_date = datetime.strptime(time.strftime("%Y-%m-%d"), "%Y-%m-%d")
-        test_source_date = datetime.strptime("2021-02-03", "%Y-%m-%d")
-        test_date_diff = (test_today_date - test_source_date).days
+        # Fix today's date to 4 days after the maintenance, so the test does not depend on when it runs
+        previous_clock = set_clock(Clock(lambda: time.mktime((2021, 2, 7, 12, 0, 0, 0, 0, -1))))
+        self.addCleanup(set_clock, previous_clock)
 
         expected_response = {
             "zone": "O4",
             "maintenance_required": 0,
-            "info": f"Maintenance is not required. Currently {test_date_diff} days after last maintenance performed."
+            "info": "Maintenance is not required. Currently 4 days after last maintenance performed."
         }
 
         with self.app as client:
@@ -156,9 +237,186 @@ class TestDinoparkStatusApi(unittest.TestCase):
             response = client.get('dinopark_status/' + API_VERSION + '/maintenance_status' + args)
             response_json = response.get_json()
             self.assertEqual(response.status_code, 200)
+            self.assertIsInstance(response_json.pop("snapshot_age_seconds"), float)
             self.assertEqual(response_json, expected_response)
 
-    @mock.patch("dinopark_status_api.resources.requests.get")
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_status_as_of(self, mock_get):
+        """
+        Test the statuses as of a past instant are rebuilt from the events up to that instant, and are not stored.
+        """
+        source_data = [{'kind': 'maintenance_performed',
+                        'location': 'O4',
+                        'park_id': 1,
+                        'time': '2021-03-20T10:00:00.000Z'},
+                       {'kind': 'maintenance_performed',
+                        'location': 'O4',
+                        'park_id': 1,
+                        'time': '2021-02-03T17:08:01.497Z'}]
+        mock_get.return_value = Mock(status_code=200, json=lambda: source_data)
+        # Its own app, the event store of the shared one holds the events of the other tests
+        app = DinoparkStatusApi.create_app(self._MONGO_DAL, feed_cache=FeedCache(ttl=0, stale_ttl=0), poll_interval=None,
+                                           create_indexes=False)
+        path = 'dinopark_status/' + API_VERSION + '/maintenance_status?zone=O4&as_of='
+
+        with app.test_client() as client:
+            response = client.get(path + '2021-03-10')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json(), {
+                "zone": "O4",
+                "maintenance_required": 1,
+                "info": "Maintenance is required. Currently 35 days after last maintenance performed.",
+                "as_of": "2021-03-10T23:59:59.999Z"
+            })
+            response = client.get(path + '2021-03-25T12:00:00%2B02:00')
+            self.assertEqual(response.get_json()["info"], "Maintenance is not required. Currently 5 days after last maintenance performed.")
+            self.assertEqual(response.get_json()["as_of"], "2021-03-25T10:00:00.000Z")
+            # Before the first maintenance, the zone was not in the NUDLS logs yet
+            self.assertEqual(client.get(path + '2021-02-01').status_code, 400)
+            for as_of in ('yesterday', '2999-01-01T00:00:00Z'):
+                self.assertEqual(client.get(path + as_of).status_code, 400, as_of)
+            self.assertEqual(client.get('dinopark_status/' + API_VERSION + '/').get_json()["event_store"]["events"], 2)
+        self.assertEqual(app.extensions["write_behind"].stats()["queued"], 0)
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_batch_status(self, mock_get):
+        """
+        Test the batch status endpoint answers every zone from one feed, with per-zone errors.
+        """
+        # Test NUDLS source data
+        source_data = [{'kind': 'dino_location_updated',
+                        'location': 'V16',
+                        'dinosaur_id': 1032,
+                        'park_id': 1,
+                        'time': '2021-02-05T22:59:31.696Z'},
+                       {'kind': 'dino_added',
+                        'name': 'McGroggity',
+                        'species': 'Tyrannosaurus rex',
+                        'gender': 'male',
+                        'id': 1032,
+                        'digestion_period_in_hours': 48,
+                        'herbivore': False,
+                        'park_id': 1,
+                        'time': '2021-01-28T22:59:31.696Z'}]
+
+        with self.app as client:
+            mock_get.return_value = Mock(status_code=200, json=lambda: source_data)
+            response = client.post('dinopark_status/' + API_VERSION + '/status:batch', json={"zones": ["V16", "A1", "V16"]})
+            results = response.get_json()["results"]
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([result["zone"] for result in results], ["V16", "A1"])
+            self.assertEqual(results[0]["safety"]["safety_status"], 0)
+            self.assertIsInstance(results[0]["safety"]["snapshot_age_seconds"], float)
+            self.assertEqual(results[0]["maintenance"]["status"]["code"], 400)
+            self.assertEqual(results[1]["safety"]["status"]["code"], 400)
+            self.assertEqual(mock_get.call_count, 1)
+
+            response = client.get('dinopark_status/' + API_VERSION + '/status:batch?zones=V16&statuses=safety')
+            self.assertCountEqual(response.get_json()["results"][0], ["zone", "safety"])
+
+            response = client.post('dinopark_status/' + API_VERSION + '/status:batch', json={"zones": []})
+            self.assertEqual(response.status_code, 400)
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_park_status(self, mock_get):
+        """
+        Test the park status endpoint answers every zone and 304 Not Modified to callers with the current ETag.
+        """
+        source_data = [{'kind': 'maintenance_performed',
+                        'location': 'O4',
+                        'park_id': 1,
+                        'time': '2021-02-03T17:08:01.497Z'}]
+
+        with self.app as client:
+            mock_get.return_value = Mock(status_code=200, json=lambda: source_data)
+            response = client.get('dinopark_status/' + API_VERSION + '/park_status')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.get_json()["results"]), 416)
+            etag = response.headers["ETag"]
+
+            response = client.get('dinopark_status/' + API_VERSION + '/park_status', headers={"If-None-Match": etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.data, b"")
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_status_computed_once_per_feed_version(self, mock_get):
+        """
+        Test repeated requests on the same NUDLS feed are served from the status cache and stored once.
+        """
+        source_data = [{'kind': 'maintenance_performed',
+                        'location': 'K7',
+                        'park_id': 1,
+                        'time': '2021-02-04T17:08:01.497Z'}]
+        collection = self._MONGO_DAL["dinopark_status_db"]["dinopark_status_collection"]
+        before = self.status_cache.stats()
+
+        with self.app as client:
+            mock_get.return_value = Mock(status_code=200, json=lambda: source_data)
+            for _ in range(3):
+                response = client.get('dinopark_status/' + API_VERSION + '/maintenance_status?zone=K7')
+                self.assertEqual(response.status_code, 200)
+            self.write_behind.flush()
+            self.assertEqual(collection.count_documents({"zone": "K7", "feed_version": "2021-02-04T17:08:01.497Z"}), 1)
+
+            stats = client.get('dinopark_status/' + API_VERSION + '/').get_json()["status_cache"]
+            self.assertEqual((stats["hits"] - before["hits"], stats["misses"] - before["misses"]), (2, 1))
+
+    def test_zone_history(self):
+        """
+        Test the zone history endpoint pages through the statuses of a zone, newest first, with the requested fields.
+        """
+        collection = self._MONGO_DAL["dinopark_status_db"]["dinopark_status_collection"]
+        self.assertIn("zone_history", collection.index_information())
+        # Statuses computed on each of the last 5 days, within the TTL
+        start = datetime.utcnow().replace(microsecond=0) - timedelta(days=5)
+        collection.insert_many([status_document({"zone": "Q1", "maintenance_required": 0, "info": str(day)},
+                                                {"status_type": "maintenance", "zone": "Q1", "feed_version": str(day),
+                                                 "date": (start + timedelta(days=day)).strftime("%Y-%m-%d")},
+                                                start + timedelta(days=day)) for day in range(5)])
+
+        with self.app as client:
+            since = (start + timedelta(days=1)).isoformat()
+            path = 'dinopark_status/' + API_VERSION + f'/zones/Q1/history?since={since}&limit=2&fields=info'
+            page = client.get(path).get_json()
+            self.assertEqual(page["items"], [{"info": "4"}, {"info": "3"}])
+
+            page = client.get(path + "&cursor=" + page["next_cursor"]).get_json()
+            self.assertEqual(page["items"], [{"info": "2"}, {"info": "1"}])
+            self.assertIsNone(page["next_cursor"])
+
+            response = client.get('dinopark_status/' + API_VERSION + '/zones/Q1/history?fields=_id')
+            self.assertEqual(response.status_code, 400)
+
+    def test_zone_history_index(self):
+        """
+        Test the history index starts with the equality fields of the history query followed by its sort, so that
+        MongoDB walks the index in order instead of sorting in memory, and that the superseded index is dropped.
+        """
+        collection = self._MONGO_DAL["dinopark_status_db"]["dinopark_status_collection_indexes"]
+        collection.create_index([("zone", pymongo.ASCENDING), ("computed_at", pymongo.DESCENDING)], name="zone_computed_at")
+        self.assertTrue(ensure_indexes(collection))
+
+        indexes = collection.index_information()
+        self.assertNotIn("zone_computed_at", indexes)
+        query, _, _ = history_query("Q1")
+        self.assertEqual(list(query), ["zone"])
+        self.assertEqual(indexes["zone_history"]["key"], [(field, pymongo.ASCENDING) for field in query] + HISTORY_SORT)
+        self._MONGO_DAL["dinopark_status_db"].drop_collection("dinopark_status_collection_indexes")
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_malformed_zone(self, mock_get):
+        """
+        Test malformed zones are rejected with a 400 before the NUDLS feed is read.
+        """
+        with self.app as client:
+            for path in ('/maintenance_status?zone=A17', '/safety_status?zone=a1', '/safety_status', '/zones/AA1/history',
+                         '/status:batch?zones=A1,B0'):
+                response = client.get('dinopark_status/' + API_VERSION + path)
+                self.assertEqual(response.status_code, 400, path)
+                self.assertEqual(response.get_json()["status"]["status"], "FAILURE")
+        mock_get.assert_not_called()
+
+    @mock.patch("dinopark_status_api.nudls_client.requests.Session.get")
     def test_no_nudls_response(self, mock_get):
         """
         Test API can handle exceptions raised when NUDLS is down.
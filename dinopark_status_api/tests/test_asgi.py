@@ -0,0 +1,223 @@
+"""
+Tests the asynchronous (ASGI) serving mode.
+"""
+
+# System imports
+import asyncio
+import unittest
+
+# Third-party import
+import httpx
+import pymongo
+from bson import ObjectId
+
+# Local imports
+from dinopark_status_api.asgi import AsyncFeedCache, AsyncNudlsClient, DinoparkStatusAsgi
+from dinopark_status_api.constants import API_VERSION, DATABASE_NAME, COLLECTION_NAME
+
+
+class BulkWriteResult:
+    """
+    Result of AsyncCollection.bulk_write.
+    """
+    def __init__(self, upserted_count):
+        self.upserted_count = upserted_count
+
+
+class AsyncCollection:
+    """
+    In-memory stand-in of an asynchronous MongoDB collection.
+    """
+    def __init__(self):
+        self.documents = []
+        # Synchronous collection wrapped by a Motor collection, for the index set up
+        self.delegate = None
+
+    async def bulk_write(self, requests, ordered=True):  # pylint: disable=unused-argument
+        # Only the $setOnInsert upserts of history.upsert_requests are supported
+        upserted = 0
+        for update in requests:
+            key = update._filter  # pylint: disable=protected-access
+            if not any(all(document.get(field) == value for field, value in key.items()) for document in self.documents):
+                document = dict(update._doc["$setOnInsert"])  # pylint: disable=protected-access
+                document["_id"] = ObjectId()
+                self.documents.append(document)
+                upserted += 1
+        return BulkWriteResult(upserted)
+
+
+class TestDinoparkStatusAsgi(unittest.TestCase):
+    """
+    Tests the ASGI app serves the same contract as the Flask app.
+    """
+    _FEED = [{'kind': 'dino_location_updated',
+              'location': 'V16',
+              'dinosaur_id': 1032,
+              'park_id': 1,
+              'time': '2021-02-05T22:59:31.696Z'},
+             {'kind': 'dino_added',
+              'name': 'McGroggity',
+              'species': 'Tyrannosaurus rex',
+              'gender': 'male',
+              'id': 1032,
+              'digestion_period_in_hours': 48,
+              'herbivore': False,
+              'park_id': 1,
+              'time': '2021-01-28T22:59:31.696Z'}]
+
+    def setUp(self):
+        """
+        Setup an ASGI app whose NUDLS calls are answered by a mock transport.
+        """
+        self.nudls_calls = 0
+
+        def nudls(request):  # pylint: disable=unused-argument
+            self.nudls_calls += 1
+            return httpx.Response(200, json=self._FEED)
+
+        client = AsyncNudlsClient(url="http://nudls.test/feed", transport=httpx.MockTransport(nudls))
+        self.collection = AsyncCollection()
+        self.app = DinoparkStatusAsgi.create_app({DATABASE_NAME: {COLLECTION_NAME: self.collection}},
+                                                 feed_cache=AsyncFeedCache(client=client), poll_interval=None)
+
+    def _get(self, *paths, method="GET", json=None, headers=None):
+        """
+        Sends concurrent requests to the app.
+        :return: List of responses.
+        """
+        async def send_all():
+            transport = httpx.ASGITransport(app=self.app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://dinopark.test") as client:
+                return await asyncio.gather(*[client.request(method, 'dinopark_status/' + API_VERSION + path, json=json, headers=headers) for path in paths])
+        return asyncio.run(send_all())
+
+    def test_safety_status(self):
+        """
+        Test the safety status endpoint works and stores its result.
+        """
+        response = self._get('/safety_status?zone=V16')[0]
+        response_json = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertIsInstance(response_json.pop("snapshot_age_seconds"), float)
+        self.assertEqual(response_json, {"zone": "V16", "safety_status": 0, "info": "1032 - (carnivore) was not fed. It is not safe to enter."})
+        self.assertEqual(len(self.collection.documents), 1)
+
+    def test_status_as_of(self):
+        """
+        Test the status as of a past instant is rebuilt from the events up to that instant and not stored.
+        """
+        response = self._get('/safety_status?zone=V16&as_of=2021-02-06')[0]
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["as_of"], "2021-02-06T23:59:59.999Z")
+        self.assertEqual(response.json()["safety_status"], 0)
+        # The dinosaur was not in V16 yet
+        self.assertEqual(self._get('/safety_status?zone=V16&as_of=2021-02-05T12:00:00Z')[0].status_code, 400)
+        self.assertEqual(self.collection.documents, [])
+
+    def test_concurrent_as_of_requests_share_one_sync(self):
+        """
+        Test concurrent as_of requests fetch the feed once for the event store, on top of the feed cache's fetch.
+        """
+        responses = self._get(*['/safety_status?zone=V16&as_of=2021-02-06'] * 10)
+        self.assertEqual([response.status_code for response in responses], [200] * 10)
+        self.assertEqual(self.nudls_calls, 2)
+        self.assertEqual(self.app._event_store.stats()["syncs"], 1)  # pylint: disable=protected-access
+
+    def test_metrics(self):
+        """
+        Test the metrics endpoint renders the phases of the requests served by route.
+        """
+        self._get('/safety_status?zone=V16')
+        response = self._get('/metrics')[0]
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain; version=0.0.4"))
+        lines = response.text.splitlines()
+        self.assertTrue(any(line.startswith('dinopark_request_duration_seconds_count{route="safety_status",method="GET",code="200"}') for line in lines))
+        self.assertTrue(any(line.startswith('dinopark_phase_duration_seconds_count{route="safety_status",phase="feed_fetch"}') for line in lines))
+        self.assertTrue(any(line.startswith('dinopark_phase_duration_seconds_count{route="safety_status",phase="mongo_write"}') for line in lines))
+
+    def test_zone_stream(self):
+        """
+        Test the zone stream sends the current statuses, then stops and unsubscribes when the client disconnects.
+        """
+        messages = []
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            messages.append(message)
+            if len(messages) == 3:
+                disconnected.set()
+
+        scope = {"type": "http", "method": "GET", "path": "/dinopark_status/" + API_VERSION + "/zones/stream",
+                 "query_string": b"zones=V16&statuses=safety", "headers": []}
+        asyncio.run(asyncio.wait_for(self.app(scope, receive, send), 5))
+
+        self.assertEqual(messages[0]["status"], 200)
+        self.assertIn((b"content-type", b"text/event-stream"), messages[0]["headers"])
+        self.assertTrue(messages[1]["body"].startswith(b"retry: "))
+        self.assertIn(b'"zone":"V16","status_type":"safety"', messages[2]["body"])
+        self.assertEqual(self.app._status_stream.stats()["subscribers"], 0)  # pylint: disable=protected-access
+
+    def test_concurrent_requests_share_one_fetch(self):
+        """
+        Test concurrent requests on a cold cache trigger a single NUDLS call.
+        """
+        responses = self._get(*['/safety_status?zone=V16'] * 10)
+        self.assertEqual([response.status_code for response in responses], [200] * 10)
+        self.assertEqual(self.nudls_calls, 1)
+
+    def test_batch_status(self):
+        """
+        Test the batch endpoint answers each zone and stores the computed statuses in one write.
+        """
+        response = self._get('/status:batch', method="POST", json={"zones": ["V16", "A1"], "statuses": ["safety"]})[0]
+        results = response.json()["results"]
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(results[0]["safety"]["safety_status"], 0)
+        self.assertEqual(results[1]["safety"]["status"]["code"], 400)
+        self.assertEqual(len(self.collection.documents), 1)
+
+    def test_park_status_not_modified(self):
+        """
+        Test the park status endpoint answers 304 Not Modified to callers with the current ETag.
+        """
+        response = self._get('/park_status')[0]
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 416)
+        not_modified = self._get('/park_status', headers={"If-None-Match": response.headers["ETag"]})[0]
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_indexes(self):
+        """
+        Test the indexes are created as by the Flask app, superseded ones included.
+        """
+        database = pymongo.MongoClient("mongodb://mongodb:27017/")["dinopark_status_db"]
+        collection = database["dinopark_status_collection_asgi"]
+        collection.create_index([("zone", pymongo.ASCENDING), ("computed_at", pymongo.DESCENDING)], name="zone_computed_at")
+        self.collection.delegate = collection
+        try:
+            self.assertTrue(asyncio.run(self.app._ensure_indexes()))  # pylint: disable=protected-access
+            indexes = collection.index_information()
+            self.assertIn("zone_history", indexes)
+            self.assertNotIn("zone_computed_at", indexes)
+        finally:
+            database.drop_collection("dinopark_status_collection_asgi")
+
+    def test_error_envelope(self):
+        """
+        Test errors use the same response envelope as the Flask app.
+        """
+        unknown_zone, not_found = self._get('/safety_status?zone=A1', '/test_route')
+        not_allowed = self._get('/', method="POST")[0]
+        self.assertEqual(unknown_zone.status_code, 400)
+        self.assertEqual(unknown_zone.json()["status"]["status"], "FAILURE")
+        self.assertEqual(not_found.status_code, 404)
+        self.assertEqual(not_allowed.status_code, 405)
+
+
+if __name__ == '__main__':
+    unittest.main()
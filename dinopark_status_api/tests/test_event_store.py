@@ -0,0 +1,175 @@
+"""
+Tests the event store answering time travel queries.
+"""
+
+# System imports
+import os
+import random
+import time
+import unittest
+from unittest.mock import Mock, call
+
+# Third-party imports
+from werkzeug.exceptions import BadRequest
+
+# Local imports
+from dinopark_status_api.event_store import EventStore, parse_as_of, status_as_of
+from dinopark_status_api.feed_cache import FeedCache
+from dinopark_status_api.nudls_client import NudlsUnavailable
+from dinopark_status_api.park_state import ParkState
+from dinopark_status_api.status import STATUS_FUNCTIONS
+from dinopark_status_api.timestamps import Clock, epoch_millis, set_clock
+
+
+def feed(count, seed=7):
+    """
+    :return: List of maintenance, location and feeding events of a few zones and dinosaurs, in random order.
+    """
+    rng = random.Random(seed)
+    events = [{"kind": "dino_added", "id": dino_id, "name": str(dino_id), "species": "Velociraptor", "gender": "female",
+               "digestion_period_in_hours": 48, "herbivore": False, "park_id": 1, "time": "2021-01-01T00:00:00.000Z"}
+              for dino_id in range(5)]
+    for index in range(count):
+        time = f"2021-01-{2 + index // 200:02d}T{index % 24:02d}:{index % 60:02d}:00.{index % 1000:03d}Z"
+        kind = rng.choice(("maintenance_performed", "dino_location_updated", "dino_fed"))
+        event = {"kind": kind, "park_id": 1, "time": time}
+        if kind != "dino_fed":
+            event["location"] = rng.choice(("A1", "B2", "C3"))
+        if kind != "maintenance_performed":
+            event["dinosaur_id"] = rng.randrange(5)
+        events.append(event)
+    rng.shuffle(events)
+    return events
+
+
+def tables(park_state):
+    """
+    :return: The look up tables of a park state, to compare them.
+    """
+    return (park_state.maintenance_by_zone, park_state.location_by_zone, park_state.maintenance_day_by_zone,
+            park_state.location_day_by_zone, park_state.dinosaurs, park_state.high_water_mark)
+
+
+class TestEventStore(unittest.TestCase):
+    """
+    Tests the park state as of an instant is the one built from the events up to that instant.
+    """
+
+    def test_state_at_matches_full_replay(self):
+        """
+        Test every checkpoint interval gives the state built from the whole feed filtered up to the instant.
+        """
+        events = feed(1000)
+        instants = sorted(epoch_millis(event["time"]) for event in random.Random(1).sample(events, 20))
+        instants.append(epoch_millis("2020-12-31T00:00:00.000Z"))
+        for interval in (1, 7, 100, 5000):
+            store = EventStore(checkpoint_interval=interval)
+            self.assertEqual(store.ingest(events), len(events))
+            self.assertEqual(store.stats()["checkpoints"], len(events) // interval + 1)
+            for millis in instants:
+                expected = ParkState.from_events(event for event in events if epoch_millis(event["time"]) <= millis)
+                self.assertEqual(tables(store.state_at(millis)), tables(expected), (interval, millis))
+            self.assertLessEqual(store.stats()["replayed_events"], interval * len(instants))
+
+    def test_ingest_appends_new_events(self):
+        """
+        Test ingesting the grown feed only appends the events added since, even those at the latest time stored.
+        """
+        events = sorted(feed(300), key=lambda event: epoch_millis(event["time"]))
+        store = EventStore(checkpoint_interval=50)
+        store.ingest(events[:200])
+        latest = epoch_millis(events[199]["time"])
+        before = store.state_at(latest)
+        self.assertIs(store.state_at(latest), before)
+
+        # The whole feed again, with an event at the latest time stored that was not in it yet
+        late = {"kind": "maintenance_performed", "location": "Z16", "park_id": 1, "time": events[199]["time"]}
+        self.assertEqual(store.ingest(events + [late]), 106)
+        self.assertEqual(store.ingest(events + [late]), 0)
+        self.assertEqual(store.stats()["events"], 306)
+        self.assertIn("Z16", store.state_at(latest).maintenance_by_zone)
+        self.assertEqual(tables(store.state_at(epoch_millis("2021-12-31T00:00:00.000Z"))), tables(ParkState.from_events(events + [late])))
+
+    def test_sync(self):
+        """
+        Test the store gets its events from the feed cache: the whole feed once it is first behind, then the events of
+        every feed the cache fetches, and keeps its events when NUDLS is down.
+        """
+        events = sorted(feed(20), key=lambda event: epoch_millis(event["time"]))
+        client = Mock()
+        client.fetch_feed.return_value = Mock(status_code=200, headers={"ETag": '"v1"'})
+        client.events.return_value = events[:10]
+        feed_cache = FeedCache(client=client)
+        store = EventStore()
+        feed_cache.add_events_listener(store.on_feed, store.wants_events)
+
+        # Not in use until the first sync
+        feed_version = feed_cache.get().high_water_mark
+        self.assertEqual(store.stats()["events"], 0)
+        store.sync(feed_cache, feed_version)
+        store.sync(feed_cache, feed_version)
+        self.assertEqual(store.stats()["events"], 10)
+        self.assertEqual(client.fetch_feed.call_args_list, [call(None, None), call(None, None)])
+
+        # Then the feeds the cache fetches are ingested as they come
+        client.events.return_value = events
+        feed_cache.refresh()
+        client.fetch_feed.assert_called_with('"v1"', None)
+        self.assertFalse(store.behind(feed_cache.get().high_water_mark))
+        self.assertEqual(store.stats()["events"], len(events))
+
+        client.fetch_feed.side_effect = NudlsUnavailable()
+        store.sync(feed_cache, "2021-02-01T00:00:00.000Z")
+        self.assertEqual(store.stats()["fallbacks"], 1)
+        with self.assertRaises(NudlsUnavailable):
+            EventStore().sync(feed_cache, feed_version)
+
+    def test_parse_as_of(self):
+        """
+        Test instants are UTC, dates are the end of the day, and the future is rejected.
+        """
+        now = epoch_millis("2021-02-07T12:00:00.000Z") / 1000
+        self.assertEqual(parse_as_of("2021-02-03", lambda: now), epoch_millis("2021-02-03T23:59:59.999Z"))
+        self.assertEqual(parse_as_of("2021-02-07", lambda: now), now * 1000)
+        self.assertEqual(parse_as_of("2021-02-03T22:59:31.696Z", lambda: now), epoch_millis("2021-02-03T22:59:31.696Z"))
+        self.assertEqual(parse_as_of("2021-02-04T00:59:31+02:00", lambda: now), epoch_millis("2021-02-03T22:59:31.000Z"))
+        for value in ("2021-02-08T00:00:00", "last week", ""):
+            with self.assertRaises(BadRequest):
+                parse_as_of(value, lambda: now)
+
+    def test_status_as_of(self):
+        """
+        Test the status is computed for the day of the instant.
+        """
+        park_state = ParkState.from_events([{"kind": "maintenance_performed", "location": "O4", "park_id": 1,
+                                             "time": "2021-02-03T22:59:31.696Z"}])
+        result = status_as_of("maintenance", park_state, "O4", epoch_millis("2021-03-06T08:00:00.000Z"))
+        self.assertEqual(result["maintenance_required"], 1)
+        self.assertEqual(result["as_of"], "2021-03-06T08:00:00.000Z")
+
+    def test_status_as_of_now_is_the_current_status(self):
+        """
+        Test the status as of now is computed for the same local day as the current status, in a time zone whose date
+        is not the UTC one.
+        """
+        # 30 days before the local date, 29 before the UTC one
+        park_state = ParkState.from_events([{"kind": "maintenance_performed", "location": "O4", "park_id": 1,
+                                             "time": "2021-01-07T10:00:00.000Z"}])
+        now = epoch_millis("2021-02-05T20:00:00.000Z") / 1000
+        previous_tz = os.environ.get("TZ")
+        os.environ["TZ"] = "Pacific/Auckland"
+        time.tzset()
+        previous_clock = set_clock(Clock(lambda: now))
+        try:
+            current = STATUS_FUNCTIONS["maintenance"](park_state, "O4")
+            result = status_as_of("maintenance", park_state, "O4", parse_as_of("2021-02-05T20:00:00Z", lambda: now))
+        finally:
+            set_clock(previous_clock)
+            if previous_tz is None:
+                del os.environ["TZ"]
+            else:
+                os.environ["TZ"] = previous_tz
+            time.tzset()
+        self.assertEqual(result.pop("as_of"), "2021-02-05T20:00:00.000Z")
+        self.assertEqual(result, current)
+        self.assertIn("required from tomorrow", result["info"])
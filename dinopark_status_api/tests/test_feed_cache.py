@@ -0,0 +1,300 @@
+"""
+Tests the shared NUDLS feed cache.
+"""
+
+# System imports
+import threading
+import time
+import unittest
+from unittest.mock import Mock, patch
+
+# Third-party import
+import pymongo
+from bson.errors import InvalidDocument
+from requests.exceptions import HTTPError
+
+# Local imports
+from dinopark_status_api.feed_cache import FeedCache
+from dinopark_status_api.nudls_client import NudlsClient
+from dinopark_status_api.park_state import ParkState
+from dinopark_status_api.park_state_store import ParkStateStore
+
+
+def raw_feed(content, previous=None):  # pylint: disable=unused-argument
+    """
+    Snapshot factory caching the raw feed content so tests can compare it directly.
+    """
+    return content
+
+
+class FakeClock:
+    """
+    A manually advanced clock.
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestFeedCache(unittest.TestCase):
+    """
+    Tests TTL, stale-while-revalidate, single-flight and conditional fetch behaviour of the feed cache.
+    """
+    _FEED = [{"kind": "maintenance_performed", "location": "O4", "park_id": 1, "time": "2021-02-03T22:59:31.696Z"}]
+    # MongoDB setup, see test_api_unit_test
+    _COLLECTION = pymongo.MongoClient("mongodb://mongodb:27017/")["dinopark_status_db"]["dinopark_park_state_collection_test"]
+
+    def setUp(self):
+        """
+        Setup a cache with a manual clock.
+        """
+        self.clock = FakeClock()
+        self.cache = FeedCache(client=NudlsClient(url="http://nudls.test/feed"), ttl=10, stale_ttl=20, clock=self.clock, snapshot_factory=raw_feed)
+
+    def tearDown(self):
+        """
+        Drop the saved park states.
+        """
+        self._COLLECTION.drop()
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_fresh_feed_is_served_from_memory(self, mock_get):
+        """
+        Test the feed is fetched once and then served from memory until the TTL expires.
+        """
+        mock_get.return_value = Mock(status_code=200, json=lambda: self._FEED, headers={})
+        self.assertEqual(self.cache.get(), self._FEED)
+        self.clock.now = 5
+        self.assertEqual(self.cache.get(), self._FEED)
+        self.assertEqual(mock_get.call_count, 1)
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 1)
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_stale_feed_is_served_while_revalidating(self, mock_get):
+        """
+        Test a stale feed is returned immediately and refreshed in the background.
+        """
+        new_feed = self._FEED + [{"kind": "maintenance_performed", "location": "A1", "park_id": 1, "time": "2021-02-04T22:59:31.696Z"}]
+        mock_get.return_value = Mock(status_code=200, json=lambda: self._FEED, headers={})
+        self.cache.get()
+
+        mock_get.return_value = Mock(status_code=200, json=lambda: new_feed, headers={})
+        self.clock.now = 15
+        self.assertEqual(self.cache.get(), self._FEED)
+
+        # Wait for the background refresh to land
+        for _ in range(100):
+            if self.cache.stats()["refreshes"] == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(self.cache.get(), new_feed)
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_not_modified_keeps_cached_feed(self, mock_get):
+        """
+        Test the cache sends the ETag back and keeps its content on 304 Not Modified.
+        """
+        mock_get.return_value = Mock(status_code=200, json=lambda: self._FEED, headers={"ETag": '"v1"'})
+        self.cache.get()
+
+        mock_get.return_value = Mock(status_code=304, headers={})
+        self.clock.now = 60
+        self.assertEqual(self.cache.get(), self._FEED)
+        self.assertEqual(mock_get.call_args[1]["headers"], {"If-None-Match": '"v1"'})
+        self.assertEqual(self.cache.stats()["not_modified"], 1)
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_listeners_get_new_snapshots(self, mock_get):
+        """
+        Test listeners are called with each new snapshot, and not when the feed is revalidated or fails.
+        """
+        snapshots = []
+        self.cache.add_listener(snapshots.append)
+        mock_get.return_value = Mock(status_code=200, json=lambda: self._FEED, headers={"ETag": '"v1"'})
+        self.cache.get()
+        self.assertEqual(snapshots, [self._FEED])
+
+        mock_get.return_value = Mock(status_code=304, headers={})
+        self.clock.now = 60
+        self.cache.get()
+        # NUDLS down, the cached snapshot is served
+        mock_get.return_value = Mock(status_code=500, headers={})
+        self.clock.now = 120
+        self.assertEqual(self.cache.get(), self._FEED)
+        self.assertEqual(len(snapshots), 1)
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_concurrent_misses_fetch_once(self, mock_get):
+        """
+        Test concurrent callers on an empty cache share a single upstream fetch.
+        """
+        release = threading.Event()
+
+        def slow_get(*args, **kwargs):
+            release.wait(1)
+            return Mock(status_code=200, json=lambda: self._FEED, headers={})
+
+        mock_get.side_effect = slow_get
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.cache.get())) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(results, [self._FEED] * 8)
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_failed_fetch_is_raised(self, mock_get):
+        """
+        Test an upstream error is raised to the caller when there is no feed to fall back on.
+        """
+        mock_get.side_effect = HTTPError
+        with self.assertRaises(HTTPError):
+            self.cache.get()
+        self.assertEqual(self.cache.stats()["errors"], 1)
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_polling_keeps_requests_off_upstream(self, mock_get):
+        """
+        Test that while polling, callers read the poller's snapshot and never fetch the feed themselves.
+        """
+        mock_get.return_value = Mock(status_code=200, json=lambda: self._FEED, headers={})
+        self.cache.start_polling(interval=60)
+        try:
+            snapshot, age = self.cache.get_with_age()
+            self.assertEqual(snapshot, self._FEED)
+            self.assertEqual(age, 0)
+
+            # Way past the TTL, the snapshot is still served as is until the poller refreshes it
+            self.clock.now = 1000
+            self.assertEqual(self.cache.get_with_age(), (self._FEED, 1000))
+            self.assertEqual(mock_get.call_count, 1)
+            self.assertTrue(self.cache.stats()["polling"])
+        finally:
+            self.cache.stop_polling()
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_restart_resumes_from_saved_park_state(self, mock_get):
+        """
+        Test a new process serves the saved park state and only revalidates the feed instead of rebuilding it.
+        """
+        store = ParkStateStore(self._COLLECTION, "http://nudls.test/feed", clock=lambda: 100.0)
+        client = NudlsClient(url="http://nudls.test/feed")
+        mock_get.return_value = Mock(status_code=200, json=lambda: self._FEED, headers={"ETag": '"v1"'})
+        FeedCache(client=client, ttl=10, stale_ttl=20, clock=self.clock, store=store).get()
+
+        restarted = FeedCache(client=client, ttl=10, stale_ttl=20, clock=self.clock, store=store)
+        mock_get.return_value = Mock(status_code=304, headers={})
+        park_state = restarted.get()
+        self.assertEqual(park_state.maintenance_by_zone["O4"]["time"], "2021-02-03T22:59:31.696Z")
+        self.assertEqual(mock_get.call_args[1]["headers"], {"If-None-Match": '"v1"'})
+        self.assertEqual((restarted.stats()["restored"], restarted.stats()["saved"]), (1, 0))
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_store_errors_do_not_fail_refreshes(self, mock_get):
+        """
+        Test a park state that can't be restored or saved, e.g. too large for a MongoDB document, is rebuilt from the
+        feed and served, and leaves no caller waiting.
+        """
+        store = Mock()
+        store.load.side_effect = KeyError("state")
+        store.save.side_effect = InvalidDocument("BSON document too large")
+        cache = FeedCache(client=NudlsClient(url="http://nudls.test/feed"), ttl=0, stale_ttl=0, clock=self.clock, store=store)
+        mock_get.return_value = Mock(status_code=200, json=lambda: self._FEED, headers={})
+        self.assertIn("O4", cache.get().maintenance_by_zone)
+
+        # The next refresh is not blocked
+        new_feed = self._FEED + [dict(self._FEED[0], location="A1", time="2021-02-04T22:59:31.696Z")]
+        mock_get.return_value = Mock(status_code=200, json=lambda: new_feed, headers={})
+        self.assertIn("A1", cache.get().maintenance_by_zone)
+        self.assertEqual((cache.stats()["saved"], store.save.call_count), (0, 2))
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_background_refresh_errors_stay_in_the_thread(self, mock_get):
+        """
+        Test a store failing a background refresh is logged, counted and leaves the stale feed served, instead of
+        escaping the thread.
+        """
+        store = Mock()
+        store.load.return_value = None
+        store.save.return_value = True
+        cache = FeedCache(client=NudlsClient(url="http://nudls.test/feed"), ttl=10, stale_ttl=20, clock=self.clock, store=store)
+        mock_get.return_value = Mock(status_code=200, json=lambda: self._FEED, headers={})
+        park_state = cache.get()
+
+        # A store that does not say whether it saved the park state fails the refresh after the save
+        store.save.return_value = None
+        new_feed = self._FEED + [dict(self._FEED[0], location="A1", time="2021-02-04T22:59:31.696Z")]
+        mock_get.return_value = Mock(status_code=200, json=lambda: new_feed, headers={})
+        self.clock.now = 15
+        uncaught = []
+        with patch("threading.excepthook", uncaught.append), \
+                patch("dinopark_status_api.feed_cache.dependency_error") as mock_dependency_error:
+            self.assertIs(cache.get(), park_state)
+            for _ in range(100):
+                if cache.stats()["errors"] == 1 and mock_dependency_error.called:
+                    break
+                time.sleep(0.01)
+        self.assertEqual(uncaught, [])
+        self.assertEqual(cache.stats()["errors"], 1)
+        mock_dependency_error.assert_called_once_with("mongo", "TypeError")
+
+        # The next refresh is not blocked
+        store.save.return_value = True
+        self.clock.now = 40
+        self.assertIn("A1", cache.get().maintenance_by_zone)
+
+    def test_store_saves_changed_entries(self):
+        """
+        Test the park state is saved one document per entry, only the entries changed since the previous save are
+        written, and a park state saved with another layout is ignored.
+        """
+        self._COLLECTION.replace_one({"_id": "http://nudls.test/feed"}, {"state": {}, "saved_at": 0}, upsert=True)
+        store = ParkStateStore(self._COLLECTION, "http://nudls.test/feed", clock=lambda: 100.0, batch_size=2)
+        self.assertIsNone(store.load())
+
+        events = [{"kind": "maintenance_performed", "location": zone, "park_id": 1, "time": "2021-02-03T22:59:31.696Z"} for zone in "ABCDE"]
+        events.append({"kind": "dino_fed", "dinosaur_id": 7, "park_id": 1, "time": "2021-02-03T22:59:31.696Z"})
+        park_state = ParkState.from_events(events)
+        self.assertTrue(store.save(park_state, '"v1"'))
+        self.assertEqual(self._COLLECTION.count_documents({}), 7)
+
+        later = ParkState.from_events([dict(events[0], time="2021-02-04T22:59:31.696Z")], previous=park_state)
+        with patch.object(self._COLLECTION, "bulk_write", wraps=self._COLLECTION.bulk_write) as bulk_write:
+            self.assertTrue(store.save(later, '"v2"'))
+        self.assertEqual(len(bulk_write.call_args[0][0]), 1)
+
+        loaded, etag, _, age = ParkStateStore(self._COLLECTION, "http://nudls.test/feed", clock=lambda: 130.0).load()
+        self.assertEqual((etag, age), ('"v2"', 30.0))
+        self.assertEqual(loaded.maintenance_by_zone, later.maintenance_by_zone)
+        self.assertEqual(loaded.dinosaurs, later.dinosaurs)
+        self.assertEqual(loaded.high_water_mark, "2021-02-04T22:59:31.696Z")
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_unload_drops_the_feed(self, mock_get):
+        """
+        Test an unloaded cache stops polling and fetches the whole feed again on the next call.
+        """
+        mock_get.return_value = Mock(status_code=200, json=lambda: self._FEED, headers={"ETag": '"v1"'})
+        self.cache.start_polling(interval=60)
+        self.assertEqual(self.cache.get(), self._FEED)
+
+        self.cache.unload()
+        self.assertFalse(self.cache.loaded())
+        self.assertFalse(self.cache.stats()["polling"])
+        self.assertEqual(self.cache.get(), self._FEED)
+        self.assertEqual(mock_get.call_args[1]["headers"], {})
+        self.assertEqual(mock_get.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+"""
+Tests the streaming NUDLS feed parsers.
+"""
+
+# System imports
+import json
+import os
+import unittest
+from unittest.mock import Mock, patch
+
+# Local imports
+from dinopark_status_api.feed_cache import FeedCache
+from dinopark_status_api.nudls_client import NudlsClient
+from dinopark_status_api.feed_stream import iter_json_array, iter_ndjson
+
+
+def load_test_feed_bytes():
+    """
+    Loads tests/data/nudls_test_data.json as the JSON array NUDLS returns.
+    The file holds comma separated events without the enclosing brackets.
+    """
+    path = os.path.join(os.path.dirname(__file__), "data", "nudls_test_data.json")
+    with open(path, "rb") as data_file:
+        return b"[" + data_file.read() + b"]"
+
+
+class TestFeedStream(unittest.TestCase):
+    """
+    Tests the incremental JSON array and NDJSON parsers.
+    """
+    def test_json_array_in_any_chunk_size(self):
+        """
+        Test the parser yields the same events as json.loads however the body is chunked.
+        """
+        data = load_test_feed_bytes()
+        expected = json.loads(data)
+        for size in (1, 7, 64, len(data)):
+            chunks = [data[i:i + size] for i in range(0, len(data), size)]
+            self.assertEqual(list(iter_json_array(chunks)), expected)
+
+    def test_truncated_json_array(self):
+        """
+        Test a feed cut off mid download raises instead of silently yielding a partial feed.
+        """
+        data = load_test_feed_bytes()
+        with self.assertRaises(ValueError):
+            list(iter_json_array([data[:-40]]))
+
+    def test_malformed_separators(self):
+        """
+        Test misplaced commas and missing separators are rejected like json.loads does, whatever the chunking.
+        """
+        self.assertEqual(list(iter_json_array([b" [ ] "])), [])
+        self.assertEqual(list(iter_json_array([b'[{"a": 1} , 2', b"3]"])), [{"a": 1}, 23])
+        for data in (b'[,{"a": 1}]', b'[{"a": 1},,{"a": 2}]', b'[{"a": 1},]', b'[{"a": 1} {"a": 2}]', b"[,]"):
+            with self.assertRaises(ValueError):
+                json.loads(data)
+            for size in (1, len(data)):
+                with self.assertRaises(ValueError, msg=data):
+                    list(iter_json_array([data[i:i + size] for i in range(0, len(data), size)]))
+
+    def test_ndjson(self):
+        """
+        Test newline delimited events are parsed one per line.
+        """
+        events = json.loads(load_test_feed_bytes())
+        lines = [json.dumps(event).encode() for event in events] + [b""]
+        self.assertEqual(list(iter_ndjson(lines)), events)
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_streaming_feed_cache(self, mock_get):
+        """
+        Test the feed cache builds its park state from a streamed response.
+        """
+        data = load_test_feed_bytes()
+        mock_get.return_value = Mock(status_code=200, headers={"Content-Type": "application/json"},
+                                     iter_content=lambda chunk_size: [data[i:i + 100] for i in range(0, len(data), 100)])
+        park_state = FeedCache(client=NudlsClient(streaming=True), ttl=0, stale_ttl=0).get()
+
+        self.assertTrue(mock_get.call_args[1]["stream"])
+        self.assertEqual(park_state.location_by_zone["V16"]["dinosaur_id"], 1032)
+        mock_get.return_value.json.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+Tests the metrics registry and its Prometheus text format.
+"""
+
+# System imports
+import unittest
+
+# Local imports
+from dinopark_status_api.metrics import Registry, BACKGROUND_ROUTE, PHASE_SECONDS, phase, set_route, reset_route
+
+
+class TestMetrics(unittest.TestCase):
+    """
+    Tests counters, gauges and histograms are rendered in the Prometheus text format.
+    """
+
+    def setUp(self):
+        """
+        A registry of its own for each test.
+        """
+        self.registry = Registry()
+
+    def test_counter(self):
+        """
+        Test a counter is rendered with one sample per combination of label values.
+        """
+        errors = self.registry.counter("errors_total", "Errors.", ("dependency", "error"))
+        errors.inc("nudls", "ReadTimeout")
+        errors.inc("nudls", "ReadTimeout")
+        errors.inc("mongo", 'Say "hi"')
+
+        self.assertEqual(self.registry.render().decode("utf-8").splitlines(), [
+            "# HELP errors_total Errors.",
+            "# TYPE errors_total counter",
+            'errors_total{dependency="mongo",error="Say \\"hi\\""} 1',
+            'errors_total{dependency="nudls",error="ReadTimeout"} 2'
+        ])
+
+    def test_histogram(self):
+        """
+        Test a histogram is rendered with cumulative buckets, sum and count.
+        """
+        latency = self.registry.histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1))
+        latency.observe(0.05, "health")
+        latency.observe(0.5, "health")
+        latency.observe(5, "health")
+
+        self.assertEqual(self.registry.render().decode("utf-8").splitlines()[2:], [
+            'latency_seconds_bucket{route="health",le="0.1"} 1',
+            'latency_seconds_bucket{route="health",le="1"} 2',
+            'latency_seconds_bucket{route="health",le="+Inf"} 3',
+            'latency_seconds_sum{route="health"} 5.55',
+            'latency_seconds_count{route="health"} 3'
+        ])
+
+    def test_gauge(self):
+        """
+        Test gauges go up and down, or are read from a function when rendered.
+        """
+        in_flight = self.registry.gauge("in_flight", "In flight.", ("route",))
+        in_flight.inc("health")
+        in_flight.inc("health")
+        in_flight.dec("health")
+        self.registry.gauge("age_seconds", "Age.").set_function(lambda: 1.5)
+        self.registry.gauge("unknown", "Unknown.").set_function(lambda: None)
+
+        lines = self.registry.render().decode("utf-8").splitlines()
+        self.assertIn('in_flight{route="health"} 1', lines)
+        self.assertIn("age_seconds 1.5", lines)
+        self.assertFalse([line for line in lines if line.startswith("unknown")])
+
+    def test_metric_redefined(self):
+        """
+        Test a metric can't be registered again with other labels.
+        """
+        errors = self.registry.counter("errors_total", "Errors.", ("dependency",))
+        self.assertIs(self.registry.counter("errors_total", "Errors.", ("dependency",)), errors)
+        with self.assertRaises(ValueError):
+            self.registry.counter("errors_total", "Errors.", ("dependency", "error"))
+
+    def test_phase_route(self):
+        """
+        Test phases are recorded under the route of the current request, the background route outside of requests.
+        """
+        def count(route, name):
+            return sum(value for suffix, labels, value in PHASE_SECONDS.samples()
+                       if suffix == "_count" and labels == (("route", route), ("phase", name)))
+
+        background, request = count(BACKGROUND_ROUTE, "test_phase"), count("test_route", "test_phase")
+        with phase("test_phase"):
+            pass
+        token = set_route("test_route")
+        try:
+            with phase("test_phase"):
+                pass
+        finally:
+            reset_route(token)
+
+        self.assertEqual(count(BACKGROUND_ROUTE, "test_phase"), background + 1)
+        self.assertEqual(count("test_route", "test_phase"), request + 1)
@@ -0,0 +1,122 @@
+"""
+Tests the NUDLS client retries and circuit breaker.
+"""
+
+# System imports
+import unittest
+from unittest.mock import Mock, patch
+
+# Third-party import
+from requests.exceptions import ConnectionError as RequestsConnectionError
+
+# Local imports
+from dinopark_status_api.feed_cache import FeedCache
+from dinopark_status_api.nudls_client import NudlsClient, NudlsUnavailable
+
+
+class FakeClock:
+    """
+    A manually advanced clock.
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestNudlsClient(unittest.TestCase):
+    """
+    Tests retries with backoff, the circuit breaker and the feed cache fallback.
+    """
+    _FEED = [{"kind": "maintenance_performed", "location": "O4", "park_id": 1, "time": "2021-02-03T22:59:31.696Z"}]
+
+    def setUp(self):
+        """
+        Setup a client that does not sleep between retries.
+        """
+        self.clock = FakeClock()
+        self.sleeps = []
+        self.client = NudlsClient(url="http://nudls.test/feed", max_retries=2, failure_threshold=2, reset_timeout=30,
+                                  sleep=self.sleeps.append, clock=self.clock)
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_retries_then_succeeds(self, mock_get):
+        """
+        Test a server error is retried with a bounded, jittered backoff and timeouts are always set.
+        """
+        mock_get.side_effect = [Mock(status_code=503), RequestsConnectionError(), Mock(status_code=200, json=lambda: self._FEED)]
+        resp = self.client.fetch_feed()
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(mock_get.call_count, 3)
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertTrue(all(0 <= delay <= 2 for delay in self.sleeps))
+        self.assertIsNotNone(mock_get.call_args[1]["timeout"])
+
+        stats = self.client.stats()
+        self.assertEqual(stats["retries"], 2)
+        self.assertEqual(stats["errors"], {"HTTP 503": 1, "ConnectionError": 1})
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_circuit_opens_and_recovers(self, mock_get):
+        """
+        Test the circuit opens after consecutive failures, fails fast while open and closes after a successful trial call.
+        """
+        mock_get.side_effect = RequestsConnectionError()
+        for _ in range(2):
+            with self.assertRaises(NudlsUnavailable):
+                self.client.fetch_feed()
+        self.assertEqual(self.client.stats()["circuit"], "open")
+
+        mock_get.reset_mock()
+        with self.assertRaises(NudlsUnavailable):
+            self.client.fetch_feed()
+        mock_get.assert_not_called()
+
+        self.clock.now = 31
+        mock_get.side_effect = None
+        mock_get.return_value = Mock(status_code=200, json=lambda: self._FEED)
+        resp = self.client.fetch_feed()
+        self.assertEqual(self.client.stats()["circuit"], "half_open")
+        self.assertEqual(self.client.events(resp), self._FEED)
+        self.assertEqual(self.client.stats()["circuit"], "closed")
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_body_failure_counts_against_the_circuit(self, mock_get):
+        """
+        Test a streamed feed whose body fails mid-stream is a failed call, and opens the circuit past the threshold.
+        """
+        def broken_stream(**kwargs):
+            yield b'[{"kind": "maintenance_performed", "location": "O4", '
+            raise RequestsConnectionError("Connection dropped")
+
+        client = NudlsClient(url="http://nudls.test/feed", streaming=True, max_retries=0, failure_threshold=2, clock=self.clock)
+        for _ in range(2):
+            mock_get.return_value = Mock(status_code=200, headers={"Content-Type": "application/json"}, iter_content=broken_stream)
+            resp = client.fetch_feed()
+            with self.assertRaises(RequestsConnectionError):
+                list(client.events(resp))
+
+        stats = client.stats()
+        self.assertEqual((stats["successes"], stats["failures"]), (0, 2))
+        self.assertEqual(stats["errors"], {"ConnectionError": 2})
+        self.assertEqual(stats["circuit"], "open")
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_feed_cache_serves_last_good_snapshot(self, mock_get):
+        """
+        Test the feed cache falls back on its last good snapshot while NUDLS is unavailable.
+        """
+        feed_cache = FeedCache(client=self.client, ttl=0, stale_ttl=0)
+        mock_get.return_value = Mock(status_code=200, json=lambda: self._FEED, headers={})
+        park_state = feed_cache.get()
+
+        mock_get.return_value = None
+        mock_get.side_effect = RequestsConnectionError()
+        self.assertIs(feed_cache.get(), park_state)
+        self.assertEqual(feed_cache.stats()["fallbacks"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+"""
+Tests the park state look up tables.
+"""
+
+# System imports
+import json
+import os
+import unittest
+
+# Local imports
+from dinopark_status_api.park_state import ParkState
+from dinopark_status_api.timestamps import epoch_millis
+
+
+def load_test_feed():
+    """
+    Loads the NUDLS events stored in tests/data/nudls_test_data.json.
+    The file holds comma separated events without the enclosing brackets.
+    """
+    path = os.path.join(os.path.dirname(__file__), "data", "nudls_test_data.json")
+    with open(path) as data_file:
+        return json.loads("[" + data_file.read() + "]")
+
+
+class TestParkState(unittest.TestCase):
+    """
+    Tests the indexes built from a NUDLS feed.
+    """
+    @classmethod
+    def setUpClass(cls):
+        """
+        Build a park state from the test feed.
+        """
+        cls.park_state = ParkState.from_events(load_test_feed())
+
+    def test_zone_indexes_keep_latest_event(self):
+        """
+        Test zones are indexed by their most recent event, the first one listed in the feed.
+        """
+        self.assertEqual(self.park_state.maintenance_by_zone["O4"]["time"], "2021-02-04T02:56:27.294Z")
+        self.assertEqual(self.park_state.location_by_zone["V16"]["dinosaur_id"], 1032)
+        self.assertNotIn("B1", self.park_state.maintenance_by_zone)
+
+    def test_dinosaur_indexes(self):
+        """
+        Test dinosaurs are indexed by their id, with interned species and epoch millisecond times.
+        """
+        dinosaur = self.park_state.dinosaurs[1032]
+        self.assertEqual((dinosaur.species, dinosaur.diet, dinosaur.digestion_days), ("Tyrannosaurus rex", "carnivore", 2))
+        self.assertEqual(self.park_state.dinosaurs[1047].removed_at, epoch_millis("2021-02-06T02:56:27.294Z"))
+        self.assertEqual(epoch_millis("2021-02-06T02:56:27.294Z"), 1612580187294)
+        self.assertIsNotNone(self.park_state.dinosaurs[1039].fed_at)
+        species = [dinosaur.species for dinosaur in self.park_state.dinosaurs.values() if dinosaur.species == "Tyrannosaurus rex"]
+        self.assertTrue(all(name is species[0] for name in species))
+
+    def test_latest_event_wins_in_any_order(self):
+        """
+        Test the latest event of a dinosaur wins whatever the order of the feed.
+        """
+        # Dinosaur 1035 was fed on 2021-01-29 and again on 2021-02-05
+        self.assertEqual(self.park_state.dinosaurs[1035].fed_at, epoch_millis("2021-02-05T02:56:27.294Z"))
+        reversed_state = ParkState.from_events(list(reversed(load_test_feed())))
+        self.assertEqual(reversed_state.dinosaurs, self.park_state.dinosaurs)
+        self.assertEqual(reversed_state.location_by_zone, self.park_state.location_by_zone)
+
+    def test_incremental_refresh_applies_delta(self):
+        """
+        Test building a snapshot from the previous one gives the same state as a full build, without changing the previous one.
+        """
+        feed = load_test_feed()
+        new_events = [{"kind": "dino_fed", "dinosaur_id": 1032, "park_id": 1, "time": "2021-02-08T02:56:27.294Z"},
+                      {"kind": "maintenance_performed", "location": "B1", "park_id": 1, "time": "2021-02-08T01:56:27.294Z"}]
+
+        previous = ParkState.from_events(feed)
+        refreshed = ParkState.from_events(new_events + feed, previous=previous)
+        rebuilt = ParkState.from_events(new_events + feed)
+
+        self.assertEqual(refreshed.dinosaurs, rebuilt.dinosaurs)
+        self.assertNotEqual(previous.dinosaurs[1032], rebuilt.dinosaurs[1032])
+        self.assertEqual(refreshed.maintenance_by_zone, rebuilt.maintenance_by_zone)
+        self.assertEqual(refreshed.high_water_mark, "2021-02-08T02:56:27.294Z")
+        self.assertEqual(len(list(previous.delta(new_events + feed))), 3)
+        self.assertNotIn("B1", previous.maintenance_by_zone)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+"""
+Tests the whole-park status cache.
+"""
+
+# System imports
+import json
+import unittest
+
+# Local imports
+from dinopark_status_api.constants import PARK_ZONES
+from dinopark_status_api.park_state import ParkState
+from dinopark_status_api.park_status import ParkStatusCache, etag_matches
+from dinopark_status_api.tests.test_park_state import load_test_feed
+
+
+class TestParkStatusCache(unittest.TestCase):
+    """
+    Tests the park status is computed once per feed snapshot and day.
+    """
+    def setUp(self):
+        """
+        Setup a cache whose date is set by the test.
+        """
+        self.today = "2021-02-07"
+        self.cache = ParkStatusCache(today=lambda: self.today)
+        self.park_state = ParkState.from_events(load_test_feed())
+
+    def test_every_zone_is_answered(self):
+        """
+        Test every zone of the grid has a status, or an error when it is not in the feed.
+        """
+        body, _ = self.cache.get(self.park_state)
+        results = json.loads(body)["results"]
+        self.assertEqual([result["zone"] for result in results], list(PARK_ZONES))
+        self.assertIn("maintenance_required", results[PARK_ZONES.index("O4")]["maintenance"])
+        self.assertEqual(results[PARK_ZONES.index("B1")]["maintenance"]["status"]["code"], 400)
+
+    def test_recomputed_on_new_snapshot_or_day(self):
+        """
+        Test the encoded body is reused until the snapshot or the date changes, and the ETag only depends on the content.
+        """
+        body, etag = self.cache.get(self.park_state)
+        self.assertIs(self.cache.get(self.park_state)[0], body)
+
+        same_feed_body, same_feed_etag = self.cache.get(ParkState.from_events(load_test_feed()))
+        self.assertIsNot(same_feed_body, body)
+        self.assertEqual(same_feed_etag, etag)
+
+        self.today = "2021-03-31"
+        self.assertNotEqual(self.cache.get(self.park_state)[1], etag)
+
+    def test_etag_matches(self):
+        """
+        Test If-None-Match header parsing.
+        """
+        self.assertTrue(etag_matches('"abc"', "abc"))
+        self.assertTrue(etag_matches('"xyz", W/"abc"', "abc"))
+        self.assertTrue(etag_matches("*", "abc"))
+        self.assertTrue(etag_matches(' * ', "abc"))
+        self.assertFalse(etag_matches('"xyz"', "abc"))
+        # Only the W/ prefix is the weakness indicator, not any of its characters
+        self.assertTrue(etag_matches('W/"W/abc"', "W/abc"))
+        self.assertFalse(etag_matches('"W/abc"', "abc"))
+        self.assertFalse(etag_matches('W/W/abc', "abc"))
+        self.assertFalse(etag_matches(None, "abc"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,212 @@
+"""
+Tests serving several parks, and the memory budgets of their snapshots.
+"""
+
+# System imports
+import unittest
+from unittest.mock import Mock, patch
+
+# Third-party import
+import pymongo
+
+# Local imports
+from dinopark_status_api.constants import API_VERSION, PARK_STATE_BYTES_PER_ZONE_EVENT, STATUS_CACHE_BYTES_PER_RESULT
+from dinopark_status_api.apis import DinoparkStatusApi
+from dinopark_status_api.parks import Park, ParkRegistry
+
+
+class FakeClock:
+    """
+    A manually advanced clock.
+    """
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeServices:
+    """
+    Services of a park recording loads and unloads, whose snapshots are swapped in by the test.
+    """
+    def __init__(self, park):
+        self.park = park
+        self.feed_cache = Mock()
+        self.loads = 0
+        self.unloads = 0
+        self.subscribers = 0
+        self.bytes = None
+
+    def swap_in(self, estimated_bytes):
+        self.bytes = estimated_bytes
+        listener = self.feed_cache.add_listener.call_args[0][0]
+        listener(Mock())
+
+    def load(self):
+        self.loads += 1
+
+    def unload(self):
+        self.unloads += 1
+        self.bytes = None
+
+    def loaded(self):
+        return self.bytes is not None
+
+    def estimated_bytes(self):
+        return self.bytes or 0
+
+    def busy(self):
+        return self.subscribers > 0
+
+
+class TestParkRegistry(unittest.TestCase):
+    """
+    Tests parks are loaded on use, and idle parks are evicted to keep within the memory budgets.
+    """
+
+    def setUp(self):
+        """
+        Setup a registry of three parks with a manual clock.
+        """
+        self.clock = FakeClock()
+        self.parks = ParkRegistry([Park("isla-nublar", "http://nublar.test/feed", memory_budget=500),
+                                   Park("isla-sorna", "http://sorna.test/feed"),
+                                   Park("lockwood", "http://lockwood.test/feed")],
+                                  memory_budget=1000, idle_seconds=60, clock=self.clock)
+        self.services = {}
+        for park in self.parks:
+            self.services[park.name] = FakeServices(park)
+            self.parks.attach(self.services[park.name])
+
+    def test_park_names(self):
+        """
+        Test park names are path segments that do not shadow the other routes, and are unique.
+        """
+        self.assertEqual(Park("isla-nublar", "http://nublar.test/feed").collection_name, "dinopark_status_collection_isla-nublar")
+        for name in ("Isla Nublar", "", "-nublar", "ready", "metrics", "a/b"):
+            with self.assertRaises(ValueError):
+                Park(name, "http://nublar.test/feed")
+        with self.assertRaises(ValueError):
+            ParkRegistry([Park("isla-nublar", "http://nublar.test/feed"), Park("isla-nublar", "http://sorna.test/feed")])
+
+    def test_park_over_its_budget_is_evicted_once_idle(self):
+        """
+        Test a park whose snapshot is over its own budget keeps it while in use, and loses it once idle.
+        """
+        self.parks.use("isla-nublar")
+        self.services["isla-nublar"].swap_in(600)
+        self.assertEqual(self.services["isla-nublar"].unloads, 0)
+
+        self.clock.now = 61
+        self.assertEqual(self.parks.enforce(), ["isla-nublar"])
+        self.assertEqual(self.services["isla-nublar"].unloads, 1)
+        stats = self.parks.stats()
+        self.assertEqual((stats["evictions"], stats["memory_bytes"]), (1, 0))
+        self.assertFalse(stats["parks"]["isla-nublar"]["loaded"])
+
+        # Used again, it is loaded again
+        self.parks.use("isla-nublar")
+        self.assertEqual(self.services["isla-nublar"].loads, 2)
+
+    def test_least_recently_used_idle_parks_are_evicted(self):
+        """
+        Test past the budget of the process, idle parks are evicted least recently used first, and busy parks are kept.
+        """
+        for name in ("lockwood", "isla-sorna", "isla-nublar"):
+            self.parks.use(name)
+            self.services[name].swap_in(400)
+            self.clock.now += 10
+        self.assertEqual(self.parks.stats()["memory_bytes"], 1200)
+
+        # Only lockwood is idle, but subscribed to
+        self.services["lockwood"].subscribers = 1
+        self.clock.now = 65
+        self.assertEqual(self.parks.enforce(), [])
+        self.clock.now = 200
+        self.assertEqual(self.parks.enforce(), ["isla-sorna"])
+        self.assertEqual(self.parks.stats()["memory_bytes"], 800)
+        self.assertEqual([self.services[name].unloads for name in ("lockwood", "isla-sorna", "isla-nublar")], [0, 1, 0])
+
+
+class TestParkRoutes(unittest.TestCase):
+    """
+    Tests each park is served under its own path from its own feed and collection.
+    """
+    _MONGO_DAL = pymongo.MongoClient("mongodb://mongodb:27017/")
+
+    _FEEDS = {
+        "http://nublar.test/feed": [{"kind": "maintenance_performed", "location": "A1", "park_id": 1, "time": "2021-02-03T22:59:31.696Z"}],
+        "http://sorna.test/feed": [{"kind": "maintenance_performed", "location": "B2", "park_id": 2, "time": "2021-02-03T22:59:31.696Z"}]
+    }
+
+    def tearDown(self):
+        """
+        Drop the collections of the parks.
+        """
+        database = self._MONGO_DAL["dinopark_status_db"]
+        for park in ("isla-nublar", "isla-sorna"):
+            database.drop_collection("dinopark_status_collection_" + park)
+            database.drop_collection("dinopark_park_state_collection_" + park)
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_parks_are_served_separately(self, mock_get):
+        """
+        Test a zone is only known to the park whose feed it is in, and every park reports its own caches.
+        """
+        mock_get.side_effect = lambda url, **kwargs: Mock(status_code=200, json=lambda: self._FEEDS[url], headers={})
+        parks = ParkRegistry([Park("isla-nublar", "http://nublar.test/feed", poll_interval=None),
+                              Park("isla-sorna", "http://sorna.test/feed", poll_interval=None)])
+        app = DinoparkStatusApi.create_app(self._MONGO_DAL, create_indexes=False, parks=parks)
+        path = "dinopark_status/" + API_VERSION
+
+        with app.test_client() as client:
+            self.assertEqual(client.get(path + "/isla-nublar/maintenance_status?zone=A1").status_code, 200)
+            self.assertEqual(client.get(path + "/isla-nublar/maintenance_status?zone=B2").status_code, 400)
+            self.assertEqual(client.get(path + "/isla-sorna/maintenance_status?zone=B2").status_code, 200)
+            self.assertEqual(client.get(path + "/jurassic-world/maintenance_status?zone=B2").status_code, 404)
+            self.assertEqual(client.get(path + "/maintenance_status?zone=B2").status_code, 404)
+            self.assertEqual(client.get(path + "/isla-sorna/").get_json()["feed_cache"]["misses"], 1)
+            self.assertEqual(client.get(path + "/ready").status_code, 200)
+
+            stats = client.get(path + "/").get_json()["parks"]
+            self.assertTrue(stats["parks"]["isla-nublar"]["loaded"])
+            self.assertGreater(stats["memory_bytes"], 0)
+        self.assertEqual(mock_get.call_count, 2)
+        for services in app.extensions["parks"].values():
+            services.write_behind.close()
+
+    @patch("dinopark_status_api.nudls_client.requests.Session.get")
+    def test_as_of_query_counts_towards_the_budget(self, mock_get):
+        """
+        Test the events kept for an as_of query are accounted for, and evict their park once it is idle.
+        """
+        mock_get.side_effect = lambda url, **kwargs: Mock(status_code=200, json=lambda: self._FEEDS[url], headers={})
+        clock = FakeClock()
+        # Room for the snapshot of one zone and one cached status, not for the events
+        budget = PARK_STATE_BYTES_PER_ZONE_EVENT + STATUS_CACHE_BYTES_PER_RESULT
+        parks = ParkRegistry([Park("isla-nublar", "http://nublar.test/feed", poll_interval=None, memory_budget=budget),
+                              Park("isla-sorna", "http://sorna.test/feed", poll_interval=None)], idle_seconds=60, clock=clock)
+        app = DinoparkStatusApi.create_app(self._MONGO_DAL, create_indexes=False, parks=parks)
+        path = "dinopark_status/" + API_VERSION + "/isla-nublar/maintenance_status?zone=A1"
+
+        with app.test_client() as client:
+            self.assertEqual(client.get(path).status_code, 200)
+            clock.now = 100
+            self.assertEqual(parks.enforce(), [])
+            self.assertEqual(parks.stats()["parks"]["isla-nublar"]["memory_bytes"], budget)
+
+            self.assertEqual(client.get(path + "&as_of=2021-02-05").status_code, 200)
+            self.assertGreater(parks.stats()["parks"]["isla-nublar"]["memory_bytes"], budget)
+            # In use, it is kept until it is idle
+            self.assertEqual(parks.enforce(), [])
+            clock.now = 200
+            self.assertEqual(parks.enforce(), ["isla-nublar"])
+        services = app.extensions["parks"]["isla-nublar"]
+        self.assertEqual((services.estimated_bytes(), services.event_store.stats()["events"]), (0, 0))
+        for services in app.extensions["parks"].values():
+            services.write_behind.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
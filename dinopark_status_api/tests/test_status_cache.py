@@ -0,0 +1,93 @@
+"""
+Tests the read-through status cache.
+"""
+
+# System imports
+import json
+import unittest
+
+# Third-party imports
+from werkzeug.exceptions import BadRequest
+
+# Local imports
+from dinopark_status_api.history import upsert_requests, status_document
+from dinopark_status_api.json_encoder import add_field
+from dinopark_status_api.park_state import ParkState
+from dinopark_status_api.status_cache import StatusCache
+from dinopark_status_api.tests.test_park_state import load_test_feed
+
+
+class TestStatusCache(unittest.TestCase):
+    """
+    Tests statuses are computed once per feed version and day.
+    """
+    def setUp(self):
+        """
+        Setup a small cache whose date is set by the test.
+        """
+        self.today = "2021-02-07"
+        self.cache = StatusCache(max_size=2, today=lambda: self.today)
+        self.park_state = ParkState.from_events(load_test_feed())
+
+    def test_computed_once_per_key(self):
+        """
+        Test a status is computed on the first request only, until the feed version or the date changes.
+        """
+        result, key, computed = self.cache.get("maintenance", self.park_state, "O4")
+        self.assertTrue(computed)
+        self.assertEqual(key, {"status_type": "maintenance", "zone": "O4",
+                               "feed_version": self.park_state.high_water_mark, "date": "2021-02-07"})
+
+        result["snapshot_age_seconds"] = 1.0
+        cached, _, computed = self.cache.get("maintenance", self.park_state, "O4")
+        self.assertFalse(computed)
+        self.assertNotIn("snapshot_age_seconds", cached)
+
+        self.today = "2021-02-08"
+        self.assertTrue(self.cache.get("maintenance", self.park_state, "O4")[2])
+        self.assertEqual(self.cache.stats(), {"hits": 1, "misses": 2, "size": 2})
+
+    def test_errors_not_cached_and_lru_eviction(self):
+        """
+        Test errors are raised on every request and the least recently used status is evicted.
+        """
+        with self.assertRaises(BadRequest):
+            self.cache.get("safety", self.park_state, "B1")
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+        self.cache.get("maintenance", self.park_state, "O4")
+        self.cache.get("maintenance", self.park_state, "L14")
+        self.cache.get("maintenance", self.park_state, "O4")
+        self.cache.get("maintenance", self.park_state, "W9")
+        self.assertFalse(self.cache.get("maintenance", self.park_state, "O4")[2])
+        self.assertTrue(self.cache.get("maintenance", self.park_state, "L14")[2])
+
+    def test_encoded_once_per_key(self):
+        """
+        Test cached statuses are served from their encoding, with the snapshot age added without decoding it.
+        """
+        body, result, _, computed = self.cache.get_encoded("maintenance", self.park_state, "O4")
+        self.assertTrue(computed)
+        self.assertEqual(json.loads(body), result)
+
+        cached_body, cached_result, _, computed = self.cache.get_encoded("maintenance", self.park_state, "O4")
+        self.assertFalse(computed)
+        self.assertIs(cached_body, body)
+        self.assertIs(cached_result, result)
+
+        response = json.loads(add_field(body, "snapshot_age_seconds", 1.5))
+        self.assertEqual(response.pop("snapshot_age_seconds"), 1.5)
+        self.assertEqual(response, result)
+
+    def test_upsert_requests(self):
+        """
+        Test stored statuses are upserted by key, inserted only if missing.
+        """
+        result, key, _ = self.cache.get("maintenance", self.park_state, "O4")
+        request = upsert_requests([status_document(result, key)])[0]
+        self.assertEqual(request._filter, key)  # pylint: disable=protected-access
+        self.assertEqual(set(request._doc), {"$setOnInsert"})  # pylint: disable=protected-access
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+"""
+Tests the zone status stream.
+"""
+
+# System imports
+import json
+import threading
+import unittest
+
+# Third-party imports
+from werkzeug.exceptions import BadRequest
+
+# Local imports
+from dinopark_status_api.park_state import ParkState
+from dinopark_status_api.status_stream import StatusStream, diff_statuses, event_stream, parse_stream_filter
+
+
+def parse_events(chunks):
+    """
+    :return: List of the data of the status events in the encoded chunks.
+    """
+    return [json.loads(line[len("data: "):]) for line in b"".join(chunks).decode("utf-8").splitlines() if line.startswith("data: ")]
+
+
+class TestStatusStream(unittest.TestCase):
+    """
+    Tests only the statuses that changed are pushed, to the subscribers of their zone.
+    """
+    _FEED = [{'kind': 'maintenance_performed',
+              'location': 'O4',
+              'park_id': 1,
+              'time': '2021-02-03T22:59:31.696Z'},
+             {'kind': 'dino_location_updated',
+              'location': 'V16',
+              'dinosaur_id': 1032,
+              'park_id': 1,
+              'time': '2021-02-01T22:59:31.696Z'},
+             {'kind': 'dino_added',
+              'name': 'McGroggity',
+              'species': 'Tyrannosaurus rex',
+              'gender': 'male',
+              'id': 1032,
+              'digestion_period_in_hours': 48,
+              'herbivore': False,
+              'park_id': 1,
+              'time': '2021-01-28T22:59:31.696Z'}]
+
+    # The dinosaur of V16 is fed: V16 becomes safe to enter, O4 does not change
+    _FED = [{'kind': 'dino_fed',
+             'dinosaur_id': 1032,
+             'park_id': 1,
+             'time': '2021-02-06T22:59:31.696Z'}]
+
+    def setUp(self):
+        """
+        Setup a stream of a few zones whose date is set by the test.
+        """
+        self.today = "2021-02-07"
+        self.stream = StatusStream(zones=("O4", "V16"), today=lambda: self.today)
+        self.park_state = ParkState.from_events(self._FEED)
+
+    def test_changes_pushed_to_zone_subscribers(self):
+        """
+        Test subscribers get the current statuses, then only the changes of their zones and statuses.
+        """
+        self.assertEqual(self.stream.publish(self.park_state), 4)
+        notified = []
+        v16_safety = self.stream.subscribe(["V16"], ["safety"], lambda: notified.append("V16"))
+        o4 = self.stream.subscribe(["O4"], ["maintenance", "safety"], lambda: notified.append("O4"))
+        everything = self.stream.subscribe(None, ["maintenance", "safety"], lambda: notified.append("all"))
+
+        events = parse_events(self.stream.drain(v16_safety))
+        self.assertEqual([(event["zone"], event["status_type"]) for event in events], [("V16", "safety")])
+        self.assertEqual(events[0]["result"]["safety_status"], 0)
+        self.assertEqual(len(self.stream.drain(o4)), 2)
+        self.assertEqual(len(self.stream.drain(everything)), 4)
+
+        # Same snapshot and date: nothing is evaluated nor pushed
+        self.assertEqual(self.stream.publish(self.park_state), 0)
+        self.assertEqual(notified, [])
+
+        self.assertEqual(self.stream.publish(ParkState.from_events(self._FED, previous=self.park_state)), 1)
+        self.assertEqual(sorted(notified), ["V16", "all"])
+        events = parse_events(self.stream.drain(v16_safety))
+        self.assertEqual(len(events), 1)
+        self.assertEqual(events[0]["result"]["safety_status"], 1)
+        self.assertEqual(self.stream.drain(o4), [])
+        self.assertEqual(len(self.stream.drain(everything)), 1)
+
+        self.stream.unsubscribe(v16_safety)
+        self.stream.unsubscribe(o4)
+        self.stream.unsubscribe(everything)
+        self.assertEqual(self.stream.stats()["subscribers"], 0)
+
+    def test_only_decisions_are_compared(self):
+        """
+        Test the daily change of the days since the last maintenance is not a change, the maintenance becoming due is.
+        """
+        self.stream.publish(self.park_state)
+        self.today = "2021-02-08"
+        self.assertEqual(self.stream.publish(self.park_state), 0)
+        self.today = "2021-03-31"
+        self.assertEqual(self.stream.publish(self.park_state), 1)
+
+        previous = {("O4", "maintenance"): {"zone": "O4", "maintenance_required": 0, "info": "3 days"}}
+        current = {("O4", "maintenance"): {"zone": "O4", "maintenance_required": 0, "info": "4 days"},
+                   ("V16", "safety"): {"status": {"code": 400, "info": "Unavailable", "status": "FAILURE"}}}
+        self.assertEqual(diff_statuses(previous, current), [("V16", "safety")])
+
+    def test_overflow_sends_current_statuses(self):
+        """
+        Test a subscriber too far behind gets the current statuses instead of every change.
+        """
+        stream = StatusStream(zones=("O4", "V16"), today=lambda: self.today, max_queued=1)
+        subscription = stream.subscribe(None, ["maintenance", "safety"], lambda: None)
+        stream.publish(self.park_state)
+        stream.publish(ParkState.from_events(self._FED, previous=self.park_state))
+        self.assertEqual(stream.stats()["overflows"], 1)
+        events = parse_events(stream.drain(subscription))
+        self.assertEqual(len(events), 4)
+        self.assertEqual([event["result"]["safety_status"] for event in events if event["status_type"] == "safety" and event["zone"] == "V16"], [1])
+
+    def test_event_stream(self):
+        """
+        Test the stream body starts with the reconnection delay and the current statuses, and unsubscribes when closed.
+        """
+        self.stream.publish(self.park_state)
+        wake = threading.Event()
+        subscription = self.stream.subscribe(["V16"], ["safety"], wake.set)
+        body = event_stream(self.stream, subscription, wake, lambda: None, keepalive=0.01)
+
+        self.assertTrue(next(body).startswith(b"retry: "))
+        self.assertEqual(len(parse_events([next(body)])), 1)
+        self.assertEqual(next(body), b": keepalive\n\n")
+        body.close()
+        self.assertEqual(self.stream.stats()["subscribers"], 0)
+
+    def test_parse_stream_filter(self):
+        """
+        Test every zone is subscribed to by default, and given zones are validated.
+        """
+        self.assertEqual(parse_stream_filter(), (None, ["maintenance", "safety"]))
+        self.assertEqual(parse_stream_filter("A1,B2", "safety"), (["A1", "B2"], ["safety"]))
+        with self.assertRaises(BadRequest):
+            parse_stream_filter("A17")
@@ -0,0 +1,43 @@
+"""
+Tests the timestamp parsing and the clock.
+"""
+
+# System imports
+import time
+import unittest
+from datetime import datetime
+
+# Local imports
+from dinopark_status_api.timestamps import Clock, date_of_day, epoch_day, epoch_millis
+
+
+class TestTimestamps(unittest.TestCase):
+    """
+    Tests NUDLS times are parsed to the same integers as with datetime.
+    """
+    def test_epoch_millis(self):
+        """
+        Test the fixed format fast path against datetime, and the fallback for other formats.
+        """
+        for value in ("2021-02-03T22:59:31.696Z", "1970-01-01T00:00:00.000Z", "2024-02-29T23:59:59.999Z"):
+            parsed = datetime.strptime(value, "%Y-%m-%dT%H:%M:%S.%fZ") - datetime(1970, 1, 1)
+            self.assertEqual(epoch_millis(value), parsed.days * 86400000 + parsed.seconds * 1000 + parsed.microseconds // 1000)
+        self.assertEqual(epoch_millis("2021-02-03T22:59:31Z"), epoch_millis("2021-02-03T22:59:31.000Z"))
+
+        self.assertEqual(epoch_day("2021-02-03T22:59:31.696Z"), 18661)
+        self.assertEqual(date_of_day(18661), "2021-02-03")
+
+    def test_clock_rolls_over_at_midnight(self):
+        """
+        Test the clock recomputes today only once the day changes.
+        """
+        now = [time.mktime((2021, 2, 3, 23, 59, 59, 0, 0, -1))]
+        clock = Clock(lambda: now[0])
+        self.assertEqual((clock.today(), clock.today_iso()), (18661, "2021-02-03"))
+
+        now[0] += 1
+        self.assertEqual((clock.today(), clock.today_iso()), (18662, "2021-02-04"))
+
+
+if __name__ == '__main__':
+    unittest.main()
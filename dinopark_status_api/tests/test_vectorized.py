@@ -0,0 +1,75 @@
+"""
+Tests the columnar status evaluation against the per-zone path.
+"""
+
+# System imports
+import unittest
+from datetime import date, timedelta
+
+# Local imports
+from dinopark_status_api.constants import PARK_ZONES
+from dinopark_status_api.park_state import ParkState
+from dinopark_status_api.status import batch_status, STATUS_FUNCTIONS
+from dinopark_status_api.tests.test_park_state import load_test_feed
+
+try:
+    from dinopark_status_api.vectorized import vectorized_batch_status
+except ImportError:
+    # numpy is not a requirement of the app
+    vectorized_batch_status = None
+
+
+def event_time(days_ago):
+    """
+    :return: NUDLS event time the given number of days before today.
+    """
+    return (date.today() - timedelta(days=days_ago)).strftime("%Y-%m-%d") + "T10:00:00.000Z"
+
+
+@unittest.skipIf(vectorized_batch_status is None, "Needs numpy")
+class TestVectorizedBatchStatus(unittest.TestCase):
+    """
+    Tests the columnar engine gives the same results as the per-zone Python path.
+    """
+    def assert_same_as_per_zone(self, park_state, zones):
+        """
+        Compares both engines on every status of the given zones.
+        """
+        statuses = list(STATUS_FUNCTIONS)
+        expected, _ = batch_status(park_state, zones, statuses)
+        self.assertEqual(vectorized_batch_status(park_state, zones, statuses), expected)
+        return expected
+
+    def test_test_feed(self):
+        """
+        Test every zone of the park against the test feed, including zones missing from it.
+        """
+        self.assert_same_as_per_zone(ParkState.from_events(load_test_feed()), list(PARK_ZONES))
+
+    def test_every_decision(self):
+        """
+        Test each branch of the maintenance thresholds and of the safety status algorithm.
+        """
+        def added(dino_id, herbivore, hours=48):
+            return {"kind": "dino_added", "id": dino_id, "species": "Velociraptor", "herbivore": herbivore,
+                    "digestion_period_in_hours": hours, "time": event_time(100)}
+
+        def located(dino_id, zone, days_ago):
+            return {"kind": "dino_location_updated", "dinosaur_id": dino_id, "location": zone, "time": event_time(days_ago)}
+
+        events = [added(1, True), added(2, False), added(3, False), added(4, False), added(5, False),
+                  located(1, "A1", 1), located(2, "A2", 5), located(3, "A3", 1), located(4, "A4", 1), located(5, "A5", 1),
+                  located(6, "A6", 1),
+                  {"kind": "dino_removed", "dinosaur_id": 2, "time": event_time(2)},
+                  {"kind": "dino_fed", "dinosaur_id": 4, "time": event_time(10)},
+                  {"kind": "dino_fed", "dinosaur_id": 5, "time": event_time(1)}]
+        events += [{"kind": "maintenance_performed", "location": zone, "time": event_time(days_ago)}
+                   for zone, days_ago in (("A1", 10), ("A2", 30), ("A3", 31))]
+
+        results = self.assert_same_as_per_zone(ParkState.from_events(events), ["A1", "A2", "A3", "A4", "A5", "A6", "B1"])
+        self.assertEqual([result["safety"].get("safety_status") for result in results], [1, 1, 0, 0, 1, None, None])
+        self.assertEqual([result["maintenance"].get("maintenance_required") for result in results], [0, 0, 1, None, None, None, None])
+
+
+if __name__ == '__main__':
+    unittest.main()
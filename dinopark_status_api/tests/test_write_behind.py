@@ -0,0 +1,203 @@
+"""
+Tests the write-behind queue of status documents.
+"""
+
+# System imports
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch
+
+# Third-party imports
+from bson import json_util
+from pymongo.errors import BulkWriteError
+
+# Local imports
+from dinopark_status_api.write_behind import WriteBehindQueue, WriteBehindFull
+
+
+class FakeCollection:
+    """
+    Collection recording each bulk insert, failing them while failing is set.
+    """
+    def __init__(self):
+        self.inserts = []
+        self.failing = False
+        self.inserted = threading.Event()
+        # Details of a BulkWriteError raised by the next insert
+        self.write_errors = None
+
+    def insert_many(self, documents, ordered=True):
+        if self.failing:
+            raise ConnectionError("MongoDB is down")
+        if self.write_errors is not None:
+            details, self.write_errors = self.write_errors, None
+            raise BulkWriteError(details)
+        self.inserts.append((list(documents), ordered))
+        self.inserted.set()
+
+
+class TestWriteBehindQueue(unittest.TestCase):
+    """
+    Tests documents are inserted in bulk in the background, and the overflow policies.
+    """
+    def setUp(self):
+        """
+        Setup a collection and a spill directory.
+        """
+        self.collection = FakeCollection()
+        self.spill_dir = tempfile.TemporaryDirectory()
+        self.spill_path = os.path.join(self.spill_dir.name, "spill.jsonl")
+
+    def tearDown(self):
+        self.spill_dir.cleanup()
+
+    def test_flush_on_batch_size(self):
+        """
+        Test a full batch is inserted with one unordered bulk insert, without waiting for the flush interval.
+        """
+        queue = WriteBehindQueue(self.collection, max_batch=3, flush_interval=60)
+        result = {"zone": "A1"}
+        queue.put([result, {"zone": "A2"}])
+        self.assertEqual(self.collection.inserts, [])
+        queue.put([{"zone": "A3"}])
+
+        self.assertTrue(self.collection.inserted.wait(5))
+        self.assertEqual(self.collection.inserts, [([{"zone": "A1"}, {"zone": "A2"}, {"zone": "A3"}], False)])
+        # The caller's document is not modified by the insert
+        self.assertEqual(result, {"zone": "A1"})
+        self.assertEqual(queue.stats()["inserted"], 3)
+
+    def test_close_drains_the_queue(self):
+        """
+        Test closing the queue inserts the documents still queued and stops accepting new ones.
+        """
+        queue = WriteBehindQueue(self.collection, max_batch=100, flush_interval=60)
+        queue.put([{"zone": "A1"}])
+        queue.close()
+        self.assertEqual(len(self.collection.inserts), 1)
+        self.assertEqual(queue.stats()["queued"], 0)
+        with self.assertRaises(WriteBehindFull):
+            queue.put([{"zone": "A2"}])
+
+    def test_close_timeout_spills_the_queue(self):
+        """
+        Test the documents still queued when closing times out are spilled to disk, and replayed from there.
+        """
+        release = threading.Event()
+
+        class SlowCollection(FakeCollection):
+            def insert_many(self, documents, ordered=True):
+                release.wait(5)
+                super().insert_many(documents, ordered)
+
+        collection = SlowCollection()
+        queue = WriteBehindQueue(collection, max_batch=1, flush_interval=60, overflow="drop", spill_path=self.spill_path)
+        queue.put([{"zone": "A1"}, {"zone": "A2"}, {"zone": "A3"}])
+        queue.close(timeout=0.1)
+        self.assertEqual(queue.stats()["spilled"], 2)
+        with open(f"{self.spill_path}.{os.getpid()}") as spill_file:
+            self.assertEqual([json_util.loads(line)["zone"] for line in spill_file], ["A2", "A3"])
+
+        # The insert in progress completes, then the spilled documents are replayed
+        release.set()
+        queue._thread.join(5)  # pylint: disable=protected-access
+        self.assertEqual([document["zone"] for documents, _ in collection.inserts for document in documents], ["A1", "A2", "A3"])
+
+    def test_overflow_drop_and_block(self):
+        """
+        Test a full queue drops new documents, or makes callers wait for room then raises.
+        """
+        self.collection.failing = True
+        dropping = WriteBehindQueue(self.collection, max_batch=10, flush_interval=60, max_queued=1, overflow="drop")
+        dropping.put([{"zone": "A1"}])
+        dropping.put([{"zone": "A2"}])
+        self.assertEqual(dropping.stats()["dropped"], 1)
+
+        blocking = WriteBehindQueue(self.collection, max_batch=10, flush_interval=60, max_queued=1, overflow="block",
+                                    block_timeout=0.05)
+        blocking.put([{"zone": "A1"}])
+        with self.assertRaises(WriteBehindFull):
+            blocking.put([{"zone": "A2"}])
+
+    def test_overflow_spill_and_replay(self):
+        """
+        Test documents that don't fit are spilled to disk and inserted once the queue has been drained.
+        """
+        queue = WriteBehindQueue(self.collection, max_batch=10, flush_interval=60, max_queued=1, overflow="spill",
+                                 spill_path=self.spill_path)
+        queue.put([{"zone": "A1"}])
+        queue.put([{"zone": "A2"}])
+        self.assertEqual(queue.stats()["spilled"], 1)
+
+        queue.close()
+        self.assertEqual([document["zone"] for documents, _ in self.collection.inserts for document in documents], ["A1", "A2"])
+        self.assertEqual(os.listdir(self.spill_dir.name), [])
+
+    def test_partly_failed_insert(self):
+        """
+        Test only the documents of a bulk write that failed are spilled, those already stored are not failures.
+        """
+        queue = WriteBehindQueue(self.collection, max_batch=10, flush_interval=60, overflow="spill", spill_path=self.spill_path)
+        self.collection.write_errors = {"nInserted": 1, "nUpserted": 0, "writeErrors": [
+            {"index": 1, "code": 11000, "errmsg": "E11000 duplicate key error"},
+            {"index": 2, "code": 121, "errmsg": "Document failed validation"}
+        ]}
+        queue.put([{"zone": "A1"}, {"zone": "A2"}, {"zone": "A3"}])
+        queue.flush()
+        stats = queue.stats()
+        self.assertEqual((stats["inserted"], stats["spilled"], stats["flush_errors"]), (1, 1, 1))
+
+        queue.close()
+        self.assertEqual([document["zone"] for documents, _ in self.collection.inserts for document in documents], ["A3"])
+
+    def test_spill_outside_of_the_lock(self):
+        """
+        Test the queue keeps being served while documents are written to the spill file.
+        """
+        queue = WriteBehindQueue(self.collection, max_batch=10, flush_interval=60, max_queued=1, overflow="spill",
+                                 spill_path=self.spill_path)
+        queue.put([{"zone": "A1"}])
+        read = []
+        dumps = json_util.dumps
+
+        def slow_dumps(document):
+            # Another thread reads the queue while the file is written
+            reader = threading.Thread(target=lambda: read.append(queue.stats()["queued"]))
+            reader.start()
+            reader.join(5)
+            return dumps(document)
+
+        with patch("dinopark_status_api.write_behind.json_util.dumps", side_effect=slow_dumps):
+            queue.put([{"zone": "A2"}])
+        self.assertEqual(read, [1])
+        self.assertEqual(queue.stats()["spilled"], 1)
+        queue.close()
+
+    def test_replay_leaves_live_spill_files(self):
+        """
+        Test only the spill files of processes that are gone are replayed, and a line cut short when its process was
+        killed is skipped, its file kept aside.
+        """
+        # A process that is gone, and one that is running (the test runner's parent)
+        gone = subprocess.Popen([sys.executable, "-c", "pass"])
+        gone.wait()
+        with open(f"{self.spill_path}.{gone.pid}", "w") as spill_file:
+            spill_file.write('{"zone": "B1"}\n{"zone": "B2"}\n{"zone": "B')
+        live = f"{self.spill_path}.{os.getppid()}"
+        with open(live, "w") as spill_file:
+            spill_file.write('{"zone": "C1"}\n')
+
+        queue = WriteBehindQueue(self.collection, max_batch=10, flush_interval=60, overflow="spill", spill_path=self.spill_path)
+        queue.put([{"zone": "A1"}])
+        queue.close()
+        self.assertEqual([document["zone"] for documents, _ in self.collection.inserts for document in documents], ["A1", "B1", "B2"])
+        self.assertEqual(sorted(os.listdir(self.spill_dir.name)),
+                         sorted([os.path.basename(live), f"spill.jsonl.{gone.pid}.replaying.{os.getpid()}.corrupt"]))
+
+
+if __name__ == '__main__':
+    unittest.main()
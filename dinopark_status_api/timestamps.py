@@ -0,0 +1,153 @@
+"""
+NUDLS timestamps and today's date as integers.
+
+NUDLS event times are parsed once, when the events are applied to the park state, into milliseconds or days since
+the epoch, so that all date arithmetic runs on integers. Today's date comes from a clock that computes it once per
+day, and that tests can replace.
+
+"""
+
+# System imports
+import time
+from datetime import date, datetime, timedelta
+
+# Days are counted from the epoch, NUDLS times are UTC
+EPOCH_DATE = date(1970, 1, 1)
+MILLIS_PER_DAY = 24 * 3600 * 1000
+
+_EPOCH = datetime(1970, 1, 1)
+_MILLISECOND = timedelta(milliseconds=1)
+
+# Days since the epoch of each YYYY-MM-DD date met, e.g. {"2021-02-03": 18661}
+_DAYS = {}
+
+
+def epoch_day_of_date(value):
+    """
+    :param value: Date as YYYY-MM-DD, e.g. 2021-02-03
+    :return: Days since the epoch.
+    """
+    day = _DAYS.get(value)
+    if day is None:
+        day = _DAYS[value] = (date.fromisoformat(value) - EPOCH_DATE).days
+    return day
+
+
+def epoch_millis(value):
+    """
+    :param value: NUDLS event time, e.g. 2021-02-03T22:59:31.696Z
+    :return: Milliseconds since the epoch.
+    """
+    if len(value) != 24 or value[23] != "Z":
+        return (datetime.fromisoformat(value.rstrip("Z")) - _EPOCH) // _MILLISECOND
+
+    # Fixed format: only parse the date once per day, the time of day is plain integer fields
+    return (epoch_day_of_date(value[:10]) * MILLIS_PER_DAY + int(value[11:13]) * 3600000 + int(value[14:16]) * 60000
+            + int(value[17:19]) * 1000 + int(value[20:23]))
+
+
+def epoch_day(value):
+    """
+    :param value: NUDLS event time, e.g. 2021-02-03T22:59:31.696Z
+    :return: Days since the epoch of the (UTC) date of the event.
+    """
+    if len(value) != 24 or value[23] != "Z":
+        return epoch_millis(value) // MILLIS_PER_DAY
+    return epoch_day_of_date(value[:10])
+
+
+def iso_of_millis(millis):
+    """
+    :param millis: Milliseconds since the epoch.
+    :return: The UTC time in the format of NUDLS event times, e.g. 2021-02-03T22:59:31.696Z
+    """
+    return (_EPOCH + millis * _MILLISECOND).isoformat(timespec="milliseconds") + "Z"
+
+
+def date_of_day(day):
+    """
+    :param day: Days since the epoch.
+    :return: The date as YYYY-MM-DD.
+    """
+    return (EPOCH_DATE + timedelta(days=day)).isoformat()
+
+
+def local_day(seconds):
+    """
+    :param seconds: Seconds since the epoch.
+    :return: Days since the epoch of the local date at that time, the day statuses are computed for.
+    """
+    local = time.localtime(seconds)
+    return (date(local.tm_year, local.tm_mon, local.tm_mday) - EPOCH_DATE).days
+
+
+class Clock:
+    """
+    Today's (local) date as days since the epoch, computed once per day.
+    """
+
+    def __init__(self, now=time.time):
+        """
+        Constructor.
+        :param now: Function returning the current time in seconds since the epoch, injectable for tests.
+        """
+        self._now = now
+        # Tuple of the start and end (in seconds since the epoch) of the current day, and the day as days since the
+        # epoch and as YYYY-MM-DD. Replaced as a whole, so readers need no lock.
+        self._current_day = (0, 0, None, None)
+
+    def today(self):
+        """
+        :return: Today as days since the epoch.
+        """
+        return self._current()[0]
+
+    def today_iso(self):
+        """
+        :return: Today as YYYY-MM-DD.
+        """
+        return self._current()[1]
+
+    def _current(self):
+        """
+        :return: Tuple of today as days since the epoch and as YYYY-MM-DD, recomputed after midnight.
+        """
+        now = self._now()
+        midnight, next_midnight, day, iso = self._current_day
+        if not midnight <= now < next_midnight:
+            local = time.localtime(now)
+            day = local_day(now)
+            iso = date_of_day(day)
+            midnight = time.mktime((local.tm_year, local.tm_mon, local.tm_mday, 0, 0, 0, 0, 0, -1))
+            next_midnight = time.mktime((local.tm_year, local.tm_mon, local.tm_mday + 1, 0, 0, 0, 0, 0, -1))
+            self._current_day = (midnight, next_midnight, day, iso)
+        return day, iso
+
+
+# Clock of the process, see set_clock
+_clock = Clock()
+
+
+def today():
+    """
+    :return: Today as days since the epoch, from the clock of the process.
+    """
+    return _clock.today()
+
+
+def today_iso():
+    """
+    :return: Today as YYYY-MM-DD, from the clock of the process.
+    """
+    return _clock.today_iso()
+
+
+def set_clock(clock):
+    """
+    Replaces the clock of the process, e.g. with a fixed one in tests.
+    :param clock: A Clock instance.
+    :return: The previous clock, to restore it.
+    """
+    global _clock  # pylint: disable=global-statement
+    previous, _clock = _clock, clock
+    return previous
@@ -0,0 +1,108 @@
+"""
+Columnar evaluation of the statuses of many zones at once.
+
+Only used to compare with the per-zone path (see benchmarks/bench_vectorized_status.py): building the columns costs
+as much as the per-zone checks, so it is not faster for the zones of a park. Needs numpy, which is not a requirement
+of the app.
+"""
+
+# Third-party imports
+import numpy as np
+
+# Local imports
+from dinopark_status_api.status import MAINTENANCE_INTERVAL_DAYS, MAINTENANCE_NOT_REQUIRED, \
+    MAINTENANCE_DUE_TOMORROW, MAINTENANCE_REQUIRED, SAFE_HERBIVORE, SAFE_REMOVED, UNSAFE_NOT_FED, UNSAFE_DIGESTED, \
+    SAFE_DIGESTING, maintenance_result, safety_result, error_result, zone_unavailable, dinosaur_unavailable
+from dinopark_status_api.timestamps import MILLIS_PER_DAY, today as current_day
+
+
+def vectorized_batch_status(park_state, zones, statuses, today=None):
+    """
+    Statuses of many zones from the same NUDLS feed snapshot, same results as status.batch_status.
+
+    The zones' event times are loaded into arrays once, and the maintenance thresholds and the safety status algorithm
+    are evaluated for every zone at once with array operations. Only the result bodies are built zone by zone.
+
+    :param park_state: ParkState of the current NUDLS feed snapshot.
+    :param zones: Zone identifiers, see status.parse_batch.
+    :param statuses: Status names, see status.parse_batch.
+    :param today: Today as days since the epoch, defaults to today from the clock of the process.
+    :return: List of per-zone results, in request order.
+    """
+    if today is None:
+        today = current_day()
+
+    results = [{"zone": zone} for zone in zones]
+    for status in statuses:
+        _EVALUATORS[status](park_state, zones, today, results)
+    return results
+
+
+def _maintenance(park_state, zones, today, results):
+    """
+    Adds the maintenance status of each zone to its result.
+    """
+    days = [park_state.maintenance_day_by_zone.get(zone) for zone in zones]
+    known = np.fromiter((day is not None for day in days), dtype=bool, count=len(zones))
+    maintenance_day = np.fromiter((day if day is not None else 0 for day in days), dtype=np.int64, count=len(zones))
+
+    date_diff = today - maintenance_day
+    decision = np.select([date_diff < MAINTENANCE_INTERVAL_DAYS, date_diff == MAINTENANCE_INTERVAL_DAYS],
+                         [MAINTENANCE_NOT_REQUIRED, MAINTENANCE_DUE_TOMORROW], MAINTENANCE_REQUIRED)
+
+    for i, (zone, result) in enumerate(zip(zones, results)):
+        if known[i]:
+            result["maintenance"] = maintenance_result(zone, int(date_diff[i]), int(decision[i]))
+        else:
+            result["maintenance"] = error_result(zone_unavailable(zone))
+
+
+def _safety(park_state, zones, today, results):
+    """
+    Adds the safety status of each zone to its result.
+    """
+    # One row per zone: the dinosaur last seen in the zone and the day it was seen there
+    dino_ids = []
+    dinosaurs = []
+    update_days = []
+    for zone in zones:
+        event = park_state.location_by_zone.get(zone)
+        dino_id = int(event["dinosaur_id"]) if event is not None else None
+        dino_ids.append(dino_id)
+        dinosaurs.append(park_state.dinosaurs.get(dino_id) if event is not None else None)
+        update_days.append(park_state.location_day_by_zone[zone] if event is not None else 0)
+
+    count = len(zones)
+    known = np.fromiter((dinosaur is not None and dinosaur.herbivore is not None for dinosaur in dinosaurs), dtype=bool, count=count)
+    herbivore = np.fromiter((bool(dinosaur is not None and dinosaur.herbivore) for dinosaur in dinosaurs), dtype=bool, count=count)
+    removed = np.fromiter((dinosaur is not None and dinosaur.removed_at is not None for dinosaur in dinosaurs), dtype=bool, count=count)
+    removed_day = np.fromiter((dinosaur.removed_at // MILLIS_PER_DAY if dinosaur is not None and dinosaur.removed_at is not None else 0
+                               for dinosaur in dinosaurs), dtype=np.int64, count=count)
+    fed = np.fromiter((dinosaur is not None and dinosaur.fed_at is not None for dinosaur in dinosaurs), dtype=bool, count=count)
+    fed_day = np.fromiter((dinosaur.fed_at // MILLIS_PER_DAY if dinosaur is not None and dinosaur.fed_at is not None else 0
+                           for dinosaur in dinosaurs), dtype=np.int64, count=count)
+    digestion_days = np.fromiter((dinosaur.digestion_days or 0 if dinosaur is not None else 0 for dinosaur in dinosaurs),
+                                 dtype=np.int64, count=count)
+    update_day = np.array(update_days, dtype=np.int64)
+
+    # Same order of checks as status.safety_status_algorithm, the first matching condition wins
+    decision = np.select([herbivore,
+                          removed & (removed_day > update_day),
+                          ~fed,
+                          fed_day + digestion_days < today],
+                         [SAFE_HERBIVORE, SAFE_REMOVED, UNSAFE_NOT_FED, UNSAFE_DIGESTED], SAFE_DIGESTING)
+
+    for i, (zone, result) in enumerate(zip(zones, results)):
+        if known[i]:
+            result["safety"] = safety_result(zone, dino_ids[i], dinosaurs[i], int(decision[i]))
+        elif dino_ids[i] is not None:
+            result["safety"] = error_result(dinosaur_unavailable(zone, dino_ids[i]))
+        else:
+            result["safety"] = error_result(zone_unavailable(zone))
+
+
+# Status name to columnar evaluator, see status.STATUS_FUNCTIONS
+_EVALUATORS = {
+    "maintenance": _maintenance,
+    "safety": _safety
+}
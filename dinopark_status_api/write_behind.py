@@ -0,0 +1,380 @@
+"""
+Write-behind queue of the status documents stored in MongoDB.
+
+"""
+
+# System imports
+import glob
+import logging
+import os
+import threading
+import time
+
+# Third-party imports
+from bson import json_util
+from pymongo.errors import BulkWriteError
+from werkzeug.exceptions import ServiceUnavailable
+
+# Local imports
+from dinopark_status_api.constants import LOGGER, WRITE_BEHIND_MAX_BATCH, WRITE_BEHIND_FLUSH_SECONDS, WRITE_BEHIND_MAX_QUEUED, \
+    WRITE_BEHIND_OVERFLOW, WRITE_BEHIND_BLOCK_SECONDS, WRITE_BEHIND_SPILL_PATH
+from dinopark_status_api.metrics import dependency_error, observe_phase
+
+# What to do with new documents while the queue is full
+OVERFLOW_DROP = "drop"
+OVERFLOW_BLOCK = "block"
+OVERFLOW_SPILL = "spill"
+
+# MongoDB error code of a document whose unique key is already stored
+DUPLICATE_KEY = 11000
+
+
+class WriteBehindFull(ServiceUnavailable):
+    """
+    Raised when the queue stayed full for longer than the block timeout.
+    """
+
+
+class WriteBehindQueue:
+    """
+    Buffers status documents and inserts them into MongoDB from a background thread, so requests don't wait on MongoDB.
+
+    Documents are flushed with an unordered bulk insert once max_batch of them are queued, or flush_interval seconds
+    after the previous flush. At most max_queued documents are held in memory; past that, new documents are dropped,
+    wait for room (up to block_timeout seconds, then WriteBehindFull is raised) or are appended to a spill file on disk,
+    depending on the overflow policy. Spilled documents, and those of failed flushes when spilling, are inserted again
+    once the queue is empty, including spill files left by a process that stopped before replaying them. The files
+    other processes still append to are left to them.
+
+    The flushing thread starts with the first queued document, so a queue created before a fork runs in the child.
+    close() drains the queue.
+    """
+
+    def __init__(self, collection, max_batch=WRITE_BEHIND_MAX_BATCH, flush_interval=WRITE_BEHIND_FLUSH_SECONDS,
+                 max_queued=WRITE_BEHIND_MAX_QUEUED, overflow=WRITE_BEHIND_OVERFLOW, block_timeout=WRITE_BEHIND_BLOCK_SECONDS,
+                 spill_path=WRITE_BEHIND_SPILL_PATH, to_requests=None):
+        """
+        Constructor.
+        :param collection: MongoDB collection the documents are inserted into.
+        :param max_batch: Number of queued documents that triggers a flush, and maximum size of an insert.
+        :param flush_interval: Seconds between flushes of a queue holding fewer than max_batch documents.
+        :param max_queued: Maximum number of documents held in memory.
+        :param overflow: What to do with new documents while the queue is full: drop, block or spill.
+        :param block_timeout: Seconds to wait for room in the queue with the block policy.
+        :param spill_path: Path prefix of the spill files, each process appends its id.
+        :param to_requests: Function turning a batch of documents into bulk write requests, e.g. upserts, one request per
+        document and in the same order. If None, batches are inserted with insert_many.
+        """
+        if overflow not in (OVERFLOW_DROP, OVERFLOW_BLOCK, OVERFLOW_SPILL):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+
+        self._collection = collection
+        self._max_batch = max_batch
+        self._flush_interval = flush_interval
+        self._max_queued = max_queued
+        self._overflow = overflow
+        self._block_timeout = block_timeout
+        self._spill_path = spill_path
+        self._to_requests = to_requests
+        self._logger = logging.getLogger(LOGGER)
+        # Held while appending to this process' spill file and while sealing it, never while holding the condition's lock
+        self._spill_lock = threading.Lock()
+
+        # All state below is guarded by the condition's lock.
+        self._cond = threading.Condition()
+        self._queue = []
+        self._thread = None
+        self._closed = False
+        self._spill_pending = overflow == OVERFLOW_SPILL
+        self._stats = {
+            "enqueued": 0,
+            "inserted": 0,
+            "dropped": 0,
+            "spilled": 0,
+            "replayed": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+            "flush_latency_ms_total": 0.0,
+            "flush_latency_ms_max": 0.0
+        }
+
+    def put(self, documents):
+        """
+        Queues documents to be inserted. The documents are copied, so the caller keeps ownership of its dictionaries
+        (the insert adds an _id to the copies only).
+        :param documents: List of documents.
+        """
+        documents = [dict(document) for document in documents]
+        spill = False
+        with self._cond:
+            if self._closed:
+                raise WriteBehindFull("Status documents are no longer accepted, the app is shutting down.")
+            self._start()
+
+            if len(self._queue) + len(documents) > self._max_queued:
+                if self._overflow == OVERFLOW_DROP:
+                    self._stats["dropped"] += len(documents)
+                    self._logger.warning(f"Write-behind queue full, dropped {len(documents)} documents")
+                    return
+                spill = self._overflow == OVERFLOW_SPILL
+                deadline = time.monotonic() + self._block_timeout
+                while not spill and len(self._queue) + len(documents) > self._max_queued:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise WriteBehindFull("Status documents can't be stored right now, try again later.")
+                    self._cond.wait(remaining)
+
+            if not spill:
+                self._queue.extend(documents)
+                self._stats["enqueued"] += len(documents)
+                if len(self._queue) >= self._max_batch:
+                    self._cond.notify_all()
+
+        if spill:
+            # Written outside of the lock, so that requests and the flushing thread don't wait on the disk meanwhile
+            self._spill(documents)
+
+    def flush(self):
+        """
+        Inserts every queued document now, from the calling thread.
+        """
+        while True:
+            with self._cond:
+                batch = self._take()
+            if not batch:
+                return
+            self._insert(batch)
+
+    def close(self, timeout=None):
+        """
+        Stops accepting documents and waits for the queued ones to be inserted. The documents still queued once the
+        timeout expires, e.g. while MongoDB is unreachable, are spilled to disk to be inserted by the next process.
+        :param timeout: Seconds to wait for the flushing thread, None to wait until it is done.
+        """
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+            self._cond.notify_all()
+        if thread is None or not thread.is_alive():
+            self.flush()
+            return
+
+        thread.join(timeout)
+        if thread.is_alive():
+            with self._cond:
+                left = self._queue
+                self._queue = []
+            if left:
+                self._logger.warning(f"Write-behind queue not drained after {timeout} seconds, spilling {len(left)} documents")
+                self._spill(left)
+
+    def stats(self):
+        """
+        :return: Dictionary of queue depth, counters and flush latencies.
+        """
+        with self._cond:
+            stats = dict(self._stats)
+            stats["queued"] = len(self._queue)
+            stats["max_queued"] = self._max_queued
+        flushes = stats["flushes"]
+        stats["flush_latency_ms_avg"] = round(stats["flush_latency_ms_total"] / flushes, 3) if flushes else None
+        stats["flush_latency_ms_total"] = round(stats["flush_latency_ms_total"], 3)
+        stats["flush_latency_ms_max"] = round(stats["flush_latency_ms_max"], 3)
+        return stats
+
+    def _start(self):
+        """
+        Starts the flushing thread if it is not running in this process. Must be called holding the lock.
+        """
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="status-write-behind", daemon=True)
+            self._thread.start()
+
+    def _take(self):
+        """
+        Removes the next batch from the queue. Must be called holding the lock.
+        :return: List of up to max_batch documents.
+        """
+        batch = self._queue[:self._max_batch]
+        del self._queue[:self._max_batch]
+        # Wake up callers blocked on a full queue
+        self._cond.notify_all()
+        return batch
+
+    def _run(self):
+        """
+        Body of the flushing thread.
+        """
+        while True:
+            with self._cond:
+                if not self._closed and len(self._queue) < self._max_batch:
+                    self._cond.wait(self._flush_interval)
+                batch = self._take()
+                closed = self._closed and not self._queue
+                replay = self._spill_pending and not self._queue
+
+            if batch:
+                self._insert(batch)
+            if replay:
+                try:
+                    self._replay()
+                except Exception as err:  # pylint: disable=broad-except
+                    # The files not replayed yet are replayed with the next spill
+                    self._logger.error(f"Failed to replay the spill files: {err}")
+            if closed:
+                return
+
+    def _insert(self, batch):
+        """
+        Writes a batch with an unordered bulk write. The documents that failed are spilled with the spill policy,
+        dropped otherwise. Documents already stored (duplicate keys) are not failures.
+        """
+        start = time.monotonic()
+        written = len(batch)
+        failed = []
+        try:
+            if self._to_requests is None:
+                self._collection.insert_many(batch, ordered=False)
+            else:
+                self._collection.bulk_write(self._to_requests(batch), ordered=False)
+        except BulkWriteError as err:
+            # Unordered: every write was attempted, only those in the write errors failed
+            written = err.details.get("nInserted", 0) + err.details.get("nUpserted", 0)
+            failed = [batch[write_error["index"]] for write_error in err.details.get("writeErrors", [])
+                      if write_error.get("code") != DUPLICATE_KEY]
+            if failed:
+                self._logger.error(f"Failed to write {len(failed)} of {len(batch)} status documents: {err}")
+                dependency_error("mongo", err.__class__.__name__)
+        except Exception as err:  # pylint: disable=broad-except
+            written = 0
+            failed = batch
+            self._logger.error(f"Failed to write {len(batch)} status documents: {err}")
+            dependency_error("mongo", err.__class__.__name__)
+        elapsed = time.monotonic() - start
+        observe_phase("mongo_write", elapsed)
+        latency_ms = elapsed * 1000
+
+        spill = bool(failed) and self._overflow == OVERFLOW_SPILL
+        with self._cond:
+            self._stats["flushes"] += 1
+            self._stats["flush_latency_ms_total"] += latency_ms
+            self._stats["flush_latency_ms_max"] = max(self._stats["flush_latency_ms_max"], latency_ms)
+            self._stats["inserted"] += written
+            if not failed:
+                return
+            self._stats["flush_errors"] += 1
+            if not spill:
+                self._stats["dropped"] += len(failed)
+        if spill:
+            # Documents of a failed insert may be stored all the same, e.g. on a network error, keep their _id to spot
+            # duplicates
+            self._spill(failed)
+
+    def _spill(self, documents):
+        """
+        Appends documents to this process' spill file. Must be called without holding the condition's lock, only the
+        counters are updated under it.
+        """
+        with self._spill_lock:
+            with open(f"{self._spill_path}.{os.getpid()}", "a") as spill_file:
+                spill_file.writelines(json_util.dumps(document) + "\n" for document in documents)
+        with self._cond:
+            self._stats["spilled"] += len(documents)
+            self._spill_pending = True
+
+    def _replay(self):
+        """
+        Inserts the documents of the spill files nobody appends to any more: the ones this process sealed, and the
+        ones left by processes that are gone. Each file is claimed first, by a rename, so that only one process
+        replays it. Lines that can't be decoded, e.g. the last one of a process killed while spilling, are skipped
+        and their file is kept aside as corrupt.
+        """
+        with self._cond:
+            self._spill_pending = False
+        with self._spill_lock:
+            # Sealed while holding the spill lock, so that no document is being appended to it. New documents go to a
+            # new file.
+            live = f"{self._spill_path}.{os.getpid()}"
+            if os.path.exists(live):
+                os.rename(live, f"{live}.sealed.{time.time_ns()}")
+
+        for path in glob.glob(f"{self._spill_path}.*"):
+            if not self._replayable(path[len(self._spill_path) + 1:].split(".")):
+                continue
+            claimed = f"{path.split('.replaying.')[0]}.replaying.{os.getpid()}"
+            try:
+                os.rename(path, claimed)
+            except OSError:
+                continue  # Claimed by another process
+
+            documents, errors = self._read_spill(claimed)
+            # Failed inserts are spilled again to this process' spill file
+            for start in range(0, len(documents), self._max_batch):
+                self._insert(documents[start:start + self._max_batch])
+            if errors:
+                os.rename(claimed, f"{claimed}.corrupt")
+                self._logger.error(f"{errors} lines of the spill file {path} could not be decoded, it is kept as {claimed}.corrupt")
+            else:
+                os.remove(claimed)
+            with self._cond:
+                self._stats["replayed"] += len(documents)
+
+    @staticmethod
+    def _replayable(suffix):
+        """
+        Tells whether a spill file is complete and replayable, from its name after the spill path: <pid> while its
+        process appends to it, <pid>.sealed.<n> once sealed, followed by .replaying.<pid> once claimed, and .corrupt
+        if it could not be decoded.
+        :param suffix: The parts of the name after the spill path.
+        :return: Whether the file may be claimed.
+        """
+        if suffix[-1] == "corrupt":
+            return False
+        if len(suffix) >= 2 and suffix[-2] == "replaying":
+            # Claimed by a process that stopped before replaying it
+            return not _alive(suffix[-1])
+        if len(suffix) == 1:
+            return not _alive(suffix[0])
+        return len(suffix) == 3 and suffix[1] == "sealed"
+
+    def _read_spill(self, path):
+        """
+        Decodes the documents of a spill file, one per line.
+        :return: Tuple of the list of documents and the number of lines that could not be decoded.
+        """
+        documents = []
+        errors = 0
+        try:
+            with open(path) as spill_file:
+                for number, line in enumerate(spill_file, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        documents.append(json_util.loads(line))
+                    except ValueError as err:
+                        errors += 1
+                        self._logger.warning(f"Skipped line {number} of the spill file {path}: {err}")
+        except OSError as err:
+            errors += 1
+            self._logger.error(f"Could not read the spill file {path}: {err}")
+        return documents, errors
+
+
+def _alive(pid):
+    """
+    :param pid: Process id, as found in the name of a spill file.
+    :return: Whether a process with this id is running. Ids that are not numbers are taken as alive, so that their
+    files are left alone.
+    """
+    try:
+        os.kill(int(pid), 0)
+    except ValueError:
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running, under another user
+        return True
+    return True
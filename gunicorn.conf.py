@@ -0,0 +1,67 @@
+"""
+gunicorn configuration: `gunicorn -c gunicorn.conf.py`.
+
+The app is loaded once in the master process (preload_app) and forked into workers, each serving requests from a
+pool of threads (gthread). Worker and thread counts are set with the environment variables below.
+
+- DINOPARK_BIND: address to listen on, defaults to 0.0.0.0:80.
+- DINOPARK_WORKERS: number of worker processes, defaults to the number of cores.
+- DINOPARK_THREADS: number of threads per worker, defaults to 4.
+
+"""
+
+# System imports
+import functools
+import multiprocessing
+import os
+
+# Local imports
+from dinopark_status_api.constants import FEED_POLL_INTERVAL_SECONDS, WRITE_BEHIND_CLOSE_SECONDS
+from dinopark_status_api.history import ensure_indexes
+
+# The NUDLS poller is started and the MongoDB indexes are created per worker in post_worker_init: threads do not
+# survive a fork, and MongoDB connections must not be opened before it
+wsgi_app = "app:create_app(poll_interval=None, create_indexes=False)"
+bind = os.environ.get("DINOPARK_BIND", "0.0.0.0:80")
+workers = int(os.environ.get("DINOPARK_WORKERS", multiprocessing.cpu_count()))
+threads = int(os.environ.get("DINOPARK_THREADS", 4))
+worker_class = "gthread"
+preload_app = True
+
+
+def post_worker_init(worker):
+    """
+    Starts refreshing the NUDLS feed and creating the MongoDB indexes if missing in the background, in each worker.
+    The worker reports ready (see resources.Ready) once both are done.
+
+    Every worker has its own copy of the feed cache: nothing is fetched from NUDLS before the fork, so none of the
+    NUDLS connections or cache state are shared between processes.
+
+    When several parks are served, each park's feed is only refreshed once the park is requested (see
+    parks.ParkRegistry), only the indexes of each park's collection are created here.
+    :param worker: The gunicorn worker, holding the loaded Flask app.
+    """
+    if "parks" in worker.wsgi.extensions:
+        for name, services in worker.wsgi.extensions["parks"].items():
+            worker.wsgi.extensions["readiness"].start(f"indexes:{name}", functools.partial(ensure_indexes, services.collection))
+        return
+    feed_cache, readiness = worker.wsgi.extensions["feed_cache"], worker.wsgi.extensions["readiness"]
+    feed_cache.start_polling(FEED_POLL_INTERVAL_SECONDS)
+    readiness.add_check("feed", feed_cache.loaded)
+    readiness.start("indexes", functools.partial(ensure_indexes, worker.wsgi.extensions["status_collection"]))
+
+
+def worker_exit(server, worker):  # pylint: disable=unused-argument
+    """
+    Inserts the status documents still queued in the worker's write-behind queues before it exits, for at most
+    WRITE_BEHIND_CLOSE_SECONDS per queue: the documents left are spilled to disk.
+    :param server: The gunicorn arbiter.
+    :param worker: The gunicorn worker, holding the loaded Flask app.
+    """
+    if worker.wsgi is None:
+        return
+    if "parks" in worker.wsgi.extensions:
+        for services in worker.wsgi.extensions["parks"].values():
+            services.write_behind.close(WRITE_BEHIND_CLOSE_SECONDS)
+    else:
+        worker.wsgi.extensions["write_behind"].close(WRITE_BEHIND_CLOSE_SECONDS)